@@ -1,173 +1,198 @@
+import math
 import random
-import networkx as nx
+import time
+import multiprocessing
+from contextlib import closing
 import numpy as np
-from scheduling import v2g_milp_optimize
-
-# 讀取圖形文件
-graphml_file = "Taiwan.graphml"
-G = nx.read_graphml(graphml_file)
-
-# 參數設置
-start_node = "-144866"
-end_node = "-212207"
-initial_soc = 80  # 起始電量 (百分比)
-target_soc = 90   # 目標電量 (百分比)
-maximum_power = 60000  # 電池最大容量 (Wh)
-max_time = 3600 * 2     # 2 小時
-charging_cost_per_kWh_peak = 0.3
-charging_cost_per_kWh_offpeak = 0.2
-energy_consumption_per_m = 0.2  # 每米耗電量 (Wh)
-charging_station_power = 80     # kW (僅做參考, 交給v2g演算法更詳細處理)
-power_track_power = 12          # kW
-power_track_length = 200        # m
-
-# 螞蟻群算法參數
-num_ants = 300
-iterations = 300
-alpha = 4
-beta = 4
-rho = 0.1
-Q = 100
-min_pheromone = 1e-6
-
-visited_nodes = {}
+from v2g_cache import V2GCostCache
+from pheromone import PheromoneTable
+from transition import TransitionTable
+from routing_problem import RoutingProblem
 
 
 #############################
 # ACO邏輯與輔助函式
 #############################
 
-def initialize_pheromone(G):
-    pheromone = {}
-    for u, v in G.edges():
-        # 一般路徑
-        pheromone[(u, v)] = 1.0
-
-        # 若 u 是充電站 => 初始化充電行為的費洛蒙
-        if G.nodes[u].get('is_charging_station', False):
-            # 這裡示範一些常見停留時間 + SOC
-            pheromone[(u, 'charging')] = {
-                (0, 80): 1.0,
-                (15, 80): 1.0,
-                (15, 90): 1.0,
-                (30, 80): 1.0,
-                (30, 90): 1.0,
-                (45, 80): 1.0,
-                (45, 90): 1.0,
-                (60, 80): 1.0,
-                (60, 90): 1.0,
-            }
-    return pheromone
-
-def calculate_distance(u, v):
-    return G[u][v].get('length', 1)
-
-def calculate_energy_consumption(u, v):
-    return calculate_distance(u, v) * energy_consumption_per_m
-
-def calculate_travel_time(u, v):
-    return G[u][v].get('travel_time', 0)
-
-def calculate_pt_energy_gain(u, v):
-    return power_track_length / G[u][v].get('speed', 1) * power_track_power / 3600
-
-
-###############
-# 改善1: 道路啟發式
-###############
-def heuristic_road(u, v, current_soc):
+# 充電站的 (停留時間, 目標SOC) 選項, 這裡示範一些常見停留時間 + SOC
+charging_options = [
+    (0, 80),
+    (15, 80),
+    (15, 90),
+    (30, 80),
+    (30, 90),
+    (45, 80),
+    (45, 90),
+    (60, 80),
+    (60, 90),
+]
+
+
+class Colony:
     """
-    同時考慮:
-     - 該段 travel_time
-     - 預估的行駛電費
-     - visit_count (避免重複拜訪)
+    一次 ACO 求解共用的狀態: 預先載入的 CompiledGraph、RoutingProblem 參數、
+    visit 次數與 V2G 成本快取. 同一個 CompiledGraph / V2GCostCache 可跨多次查詢重複使用.
     """
-    travel_time = calculate_travel_time(u, v)
-    visit_count = visited_nodes.get(v, 0)
-
-    # 預估耗電
-    energy_consumption = calculate_energy_consumption(u, v)
-
-    # 假設此時是尖峰 or 離峰
-    # (簡單用 current time 這邊可能不準, 但示範)
-    # 這裡僅示範, 假設螞蟻不知道精確時間, 或可以傳入Ant的time_spent
-    # 為了簡單化, 先假設全用peak
-    driving_cost_rate = charging_cost_per_kWh_peak
-    # 也可根據 current_soc / some rule 來決定能不能走得動...(此處略)
-
-    driving_cost = (energy_consumption/1000.0) * driving_cost_rate
-
-    # 綜合指標 (可調參數λ,μ)
-    # 數值越小代表「越不吸引螞蟻」, 故啟發值要用 1/(...) 形式
-    combined_factor = travel_time + 10*driving_cost + 5*visit_count
-    if combined_factor <= 0:
-        combined_factor = 0.1
-
-    return 1.0 / combined_factor
 
+    def __init__(self, CG, problem, v2g_cache=None):
+        self.CG = CG
+        self.problem = problem
+        self.start_node = CG.node_index[problem.start_node]
+        self.end_node = CG.node_index[problem.end_node]
+        self.options = problem.charging_options or charging_options
+        self.visited_nodes = {}
+        if v2g_cache is None:
+            v2g_cache = V2GCostCache(table_file=problem.v2g_table_file)
+        self.v2g_cache = v2g_cache
+
+    # 以下函式皆以 edge index e 取代 (u, v), 直接查 CompiledGraph 的陣列
+    def calculate_distance(self, e):
+        return self.CG.length[e]
+
+    def calculate_energy_consumption(self, e):
+        return self.calculate_distance(e) * self.problem.energy_consumption_per_m
+
+    def calculate_travel_time(self, e):
+        return self.CG.travel_time[e]
+
+    def calculate_pt_energy_gain(self, e):
+        p = self.problem
+        return p.power_track_length / self.CG.speed[e] * p.power_track_power / 3600
+
+    ###############
+    # 改善1: 道路啟發式
+    ###############
+    def heuristic_road(self, e, current_soc):
+        """
+        同時考慮:
+         - 該段 travel_time
+         - 預估的行駛電費
+         - visit_count (避免重複拜訪)
+        """
+        travel_time = self.calculate_travel_time(e)
+        visit_count = self.visited_nodes.get(int(self.CG.targets[e]), 0)
+
+        # 預估耗電
+        energy_consumption = self.calculate_energy_consumption(e)
+
+        # 假設此時是尖峰 or 離峰
+        # (簡單用 current time 這邊可能不準, 但示範)
+        # 這裡僅示範, 假設螞蟻不知道精確時間, 或可以傳入Ant的time_spent
+        # 為了簡單化, 先假設全用peak
+        driving_cost_rate = self.problem.charging_cost_per_kWh_peak
+        # 也可根據 current_soc / some rule 來決定能不能走得動...(此處略)
+
+        driving_cost = (energy_consumption/1000.0) * driving_cost_rate
+
+        # 綜合指標 (可調參數λ,μ)
+        # 數值越小代表「越不吸引螞蟻」, 故啟發值要用 1/(...) 形式
+        combined_factor = travel_time + 10*driving_cost + 5*visit_count
+        if combined_factor <= 0:
+            combined_factor = 0.1
+
+        return 1.0 / combined_factor
+
+    def road_static_cost(self):
+        """
+        heuristic_road 綜合指標中與 visit_count 無關的部分 (travel_time + 10*driving_cost),
+        對每條邊只算一次.
+        """
+        p = self.problem
+        driving_cost = (self.CG.length * p.energy_consumption_per_m / 1000.0) * p.charging_cost_per_kWh_peak
+        return self.CG.travel_time + 10 * driving_cost
+
+    def build_transition_table(self):
+        return TransitionTable(self.CG, self.road_static_cost(), self.problem.alpha, self.problem.beta, visit_weight=5)
+
+    def visit_count_array(self):
+        """將 visited_nodes 轉成對齊節點 id 的陣列"""
+        counts = np.zeros(self.CG.num_nodes, dtype=np.float64)
+        if self.visited_nodes:
+            counts[list(self.visited_nodes.keys())] = list(self.visited_nodes.values())
+        return counts
+
+    ###############
+    # 改善2: 充電決策啟發式
+    ###############
+    def estimate_charging_cost(self, time_spent, option_time_min, current_soc, option_target_soc):
+        """
+        一個示範函式:
+         - 先假設要停 option_time_min 分鐘, 並從 current_soc => option_target_soc
+         - 用 v2g_optimize 做一次 "試算" => 得到預估cost (經由快取, 不重複求解)
+        """
+        status, cost, _ = self.v2g_cache.lookup(
+            time_spent,
+            option_time_min,
+            current_soc,
+            option_target_soc,
+        )
+        return status, cost
+
+    def estimate_charging_costs(self, time_spent, options, current_soc):
+        """
+        estimate_charging_cost 的批次版: options 為 [(停留分鐘, 目標SOC), ...],
+        快取查不到的選項合併成一次 v2g_batch_optimize 呼叫.
+        """
+        results = self.v2g_cache.lookup_batch(time_spent, options, current_soc)
+        return [(status, cost) for status, cost, _ in results]
+
+
+def initialize_pheromone(colony):
+    # 一般路徑: 對齊 edge index 的陣列; 充電行為: 充電站 x 選項 矩陣
+    return PheromoneTable(colony.CG, colony.options, initial=1.0)
 
-###############
-# 改善2: 充電決策啟發式
-###############
-def estimate_charging_cost(time_spent, option_time_min, current_soc, option_target_soc):
-    """
-    一個示範函式:
-     - 先假設要停 option_time_min 分鐘, 並從 current_soc => option_target_soc
-     - 用 v2g_optimize 做一次 "試算" => 得到預估cost
-    """
-    status, cost, _ = v2g_milp_optimize(
-        time_spent,
-        option_time_min,
-        current_soc,
-        option_target_soc,
-    )
-    return status, cost
 
 class Ant:
-    def __init__(self, start_node, end_node):
-        self.path = [start_node]
-        self.soc = initial_soc
+    def __init__(self, colony):
+        self.colony = colony
+        self.path = [colony.start_node]
+        self.edges = []  # 走過的 edge index, 用於費洛蒙更新
+        self.soc = colony.problem.initial_soc
         self.time_spent = 0
-        self.current_node = start_node
-        self.end_node = end_node
+        self.current_node = colony.start_node
+        self.end_node = colony.end_node
         self.total_cost = 0
         self.charging_cost = 0
         self.stations_log = []
         # 新增: 為了路段啟發式, 你可能需要保留"move"時動態判斷peak/offpeak
         # 這裡先省略不做.
 
-    def move(self, pheromone, alpha, beta):
-        # 選下一個節點
-        next_node = self.select_next_node(pheromone, alpha, beta)
-        visited_nodes[next_node] = visited_nodes.get(next_node, 0) + 1
+    def __getstate__(self):
+        # 平行模式回傳螞蟻時不需要帶回整個 colony (圖與快取)
+        state = self.__dict__.copy()
+        state['colony'] = None
+        return state
+
+    def move(self, pheromone, alpha, beta, transitions=None):
+        colony, CG, problem = self.colony, self.colony.CG, self.colony.problem
+
+        # 選下一條邊 (edge index)
+        e = self.select_next_edge(pheromone, alpha, beta, transitions)
+        next_node = int(CG.targets[e])
+        colony.visited_nodes[next_node] = colony.visited_nodes.get(next_node, 0) + 1
         self.path.append(next_node)
+        self.edges.append(e)
 
         # 處理道路行駛耗電
-        if G[self.path[-2]][self.path[-1]].get('is_charging', False):
-            pt_charging = calculate_pt_energy_gain(self.path[-2], self.path[-1])
-            energy_consumption = calculate_energy_consumption(self.path[-2], self.path[-1]) - pt_charging
+        if CG.is_charging[e]:
+            pt_charging = colony.calculate_pt_energy_gain(e)
+            energy_consumption = colony.calculate_energy_consumption(e) - pt_charging
             # 判斷尖峰/離峰(示範)
-            if self.time_spent < 1.5 * 3600:
-                cost_rate = charging_cost_per_kWh_peak
-            else:
-                cost_rate = charging_cost_per_kWh_offpeak
+            cost_rate = problem.cost_rate(self.time_spent)
 
             charging_cost = pt_charging * cost_rate / 1000
             self.charging_cost += charging_cost
             self.total_cost += charging_cost
-            self.soc += (pt_charging / maximum_power) * 100
+            self.soc += (pt_charging / problem.maximum_power) * 100
         else:
-            energy_consumption = calculate_energy_consumption(self.path[-2], self.path[-1])
+            energy_consumption = colony.calculate_energy_consumption(e)
 
-        travel_time = calculate_travel_time(self.path[-2], self.path[-1])
+        travel_time = colony.calculate_travel_time(e)
         self.time_spent += travel_time
-        self.soc -= energy_consumption / maximum_power * 100
+        self.soc -= energy_consumption / problem.maximum_power * 100
 
         # 行駛耗電費用
-        if self.time_spent < 1.5 * 3600:
-            driving_cost_rate = charging_cost_per_kWh_peak
-        else:
-            driving_cost_rate = charging_cost_per_kWh_offpeak
+        driving_cost_rate = problem.cost_rate(self.time_spent)
         driving_cost = (energy_consumption / 1000.0) * driving_cost_rate
         self.total_cost += driving_cost
 
@@ -175,38 +200,41 @@ class Ant:
         self.current_node = next_node
 
         # 若是充電站 => handle_charging_station
-        if G.nodes[next_node].get('is_charging_station', False):
+        if CG.station_mask[next_node]:
             self.handle_charging_station(pheromone, alpha, beta)
 
     def handle_charging_station(self, pheromone, alpha, beta):
-        all_options = list(pheromone[(self.current_node, 'charging')].keys())
-        
+        colony = self.colony
+        all_options = pheromone.options
+        option_strengths = pheromone.station_options(self.current_node)
+
         feasible_options = []
         probabilities = []
 
-        for (option_time_min, option_target_soc) in all_options:
-            # 1) 確保最終 SOC >= 20%
-            if option_target_soc < self.soc:
-                continue
-            
-            if option_target_soc < 20:
-                continue
+        # 1) 確保最終 SOC >= 最低電量, 且不低於目前 SOC
+        candidate_options = [
+            (option_time_min, option_target_soc)
+            for (option_time_min, option_target_soc) in all_options
+            if option_target_soc >= self.soc and option_target_soc >= colony.problem.min_soc
+        ]
 
+        # === 新增: 預估各選項的充電成本, 做為啟發式依據 (一次批次試算) ===
+        estimates = colony.estimate_charging_costs(self.time_spent, candidate_options, self.soc)
+
+        for (option_time_min, option_target_soc), (status, est_cost) in zip(candidate_options, estimates):
             # 2) 取對應的費洛蒙
-            pheromone_strength = pheromone[(self.current_node, 'charging')][(option_time_min, option_target_soc)]
+            pheromone_strength = option_strengths[pheromone.option_index[(option_time_min, option_target_soc)]]
 
-            # === 新增: 預估此選項的充電成本, 做為啟發式依據 ===
-            status, est_cost = estimate_charging_cost(self.time_spent, option_time_min, self.soc, option_target_soc)
             if status == 'Infeasible':
                 continue
-            
+
             if est_cost < 0:
                 # 表示放電收益, 可能很讚 => 給更高的吸引力
                 # (加個微小 offset避免分母0)
                 est_cost_value = 0.5  # 代表很有利
             else:
                 est_cost_value = est_cost + 1.0
-            
+
             # 啟發值 = 1 / (est_cost + 1)
             # => cost 越小 => 1/(小+1) 越大
             heuristic_strength = 1.0 / est_cost_value
@@ -228,14 +256,14 @@ class Ant:
         if chosen_time_min > 0:
             stop_time_sec = chosen_time_min * 60
 
-            # 呼叫 V2G 最佳化: 可能充電或放電
-            _, cost, delta_soc = v2g_milp_optimize(
+            # 呼叫 V2G 最佳化: 可能充電或放電 (試算時已快取, 這裡直接查表)
+            _, cost, delta_soc = colony.v2g_cache.lookup(
                 self.time_spent,
                 chosen_time_min,
                 self.soc,
                 chosen_target_soc,
             )
-            
+
             old_soc = self.soc
             self.soc += delta_soc
             self.time_spent += stop_time_sec
@@ -253,28 +281,128 @@ class Ant:
                 "cost": cost,
             })
 
-    def select_next_node(self, pheromone, alpha, beta):
-        neighbors = list(G.neighbors(self.current_node))
+    def select_next_edge(self, pheromone, alpha, beta, transitions=None):
+        if transitions is not None:
+            # 預先計算的累積機率表: 二分搜尋即可選出下一條邊
+            return transitions.sample(self.current_node, random.random())
+
+        out_edges = self.colony.CG.out_edges(self.current_node)
         probabilities = []
-        feasible_neighbors = []
-        for neighbor in neighbors:
-            pheromone_strength = pheromone.get((self.current_node, neighbor), min_pheromone)
+        for e in out_edges:
+            pheromone_strength = pheromone.edges[e]
 
             # 使用新的 "heuristic_road"
-            heuristic_strength = heuristic_road(self.current_node, neighbor, self.soc)
+            heuristic_strength = self.colony.heuristic_road(e, self.soc)
 
             probabilities.append((pheromone_strength ** alpha) * (heuristic_strength ** beta))
-            feasible_neighbors.append(neighbor)
 
         total_prob = sum(probabilities)
         probabilities = [p / total_prob for p in probabilities] if total_prob > 0 else [1 / len(probabilities)] * len(probabilities)
 
-        chosen_neighbor = random.choices(feasible_neighbors, probabilities)[0]
-        return chosen_neighbor
+        chosen_edge = random.choices(out_edges, probabilities)[0]
+        return chosen_edge
+
+
+def construct_ants(colony, pheromone, count, transitions=None):
+    """建構 count 隻螞蟻並讓牠們走完 (只讀取費洛蒙, 不更新)"""
+    p = colony.problem
+    ants = [Ant(colony) for _ in range(count)]
+    for ant in ants:
+        while ant.current_node != colony.end_node and ant.soc > p.min_soc and ant.time_spent < p.max_time:
+            ant.move(pheromone, p.alpha, p.beta, transitions)
+    return ants
+
+
+def _worker_seed(seed, iteration, chunk):
+    # 由 (seed, iteration, chunk) 導出固定的種子, 與 worker 分配順序無關
+    return int(np.random.SeedSequence([seed, iteration, chunk]).generate_state(1)[0])
 
 
-def run_aco():
-    pheromone = initialize_pheromone(G)
+# worker process 內的狀態 (由 _init_worker 設定, 圖只在建立 pool 時傳送一次; 從快取 mmap 載入的圖只傳路徑):
+# colony、費洛蒙表 (索引結構固定, 每回合只換數值陣列) 與機率表 (static_cost 等只算一次)
+_worker_colony = None
+_worker_pheromone = None
+_worker_transitions = None
+
+
+def _init_worker(CG, problem, v2g_table_file):
+    global _worker_colony, _worker_pheromone, _worker_transitions
+    _worker_colony = Colony(CG, problem, V2GCostCache(table_file=v2g_table_file))
+    _worker_pheromone = initialize_pheromone(_worker_colony)
+    _worker_transitions = _worker_colony.build_transition_table() if problem.use_transition_table else None
+
+
+def _construct_ants_worker(args):
+    """
+    process pool 的工作函式: 以該回合的費洛蒙數值與 visited_nodes 快照建構一批螞蟻,
+    回傳螞蟻與 visited_nodes 的增量, 由主程序合併.
+    機率表在 worker 內以同樣的快照重建, 與主程序單執行緒模式的結果相同.
+    """
+    edges, charging, visited_snapshot, count, seed = args
+    colony = _worker_colony
+    pheromone = _worker_pheromone
+    pheromone.edges, pheromone.charging = edges, charging
+    random.seed(seed)
+    colony.visited_nodes = dict(visited_snapshot)
+    transitions = _worker_transitions
+    if transitions is not None:
+        transitions.refresh(pheromone.edges, colony.visit_count_array())
+
+    ants = construct_ants(colony, pheromone, count, transitions)
+
+    increments = {
+        node: visits - visited_snapshot.get(node, 0)
+        for node, visits in colony.visited_nodes.items()
+        if visits != visited_snapshot.get(node, 0)
+    }
+    return ants, increments
+
+
+def construct_ants_parallel(colony, pool, pheromone, iteration, workers, seed):
+    """
+    將 num_ants 平均分給 workers 個 chunk, 平行建構後依 chunk 順序合併.
+    每個 task 只傳費洛蒙數值陣列與 visited_nodes 快照; 圖與機率表的固定部分在 worker 建立時準備好.
+    """
+    num_ants = colony.problem.num_ants
+    chunk_sizes = [num_ants // workers + (1 if k < num_ants % workers else 0) for k in range(workers)]
+    snapshot = dict(colony.visited_nodes)
+    tasks = [
+        (pheromone.edges, pheromone.charging, snapshot, size, _worker_seed(seed, iteration, k))
+        for k, size in enumerate(chunk_sizes) if size > 0
+    ]
+
+    ants = []
+    for chunk_ants, increments in pool.map(_construct_ants_worker, tasks):
+        for ant in chunk_ants:
+            ant.colony = colony
+        ants.extend(chunk_ants)
+        for node, visits in increments.items():
+            colony.visited_nodes[node] = colony.visited_nodes.get(node, 0) + visits
+    return ants
+
+
+def iter_aco(CG, problem, v2g_cache=None, verbose=False, pheromone=None):
+    """
+    逐回合執行 ACO 的 generator, 每回合結束 (費洛蒙更新後) yield 一次目前的最佳解 (anytime):
+        {"iteration", "elapsed", "improved", "stall", "branching_factor", "stop_reason",
+         "best_path", "best_cost", "best_charging_cost", "best_log", "best_time", "final_soc"}
+    best_path / best_log 已轉回原本的節點名稱. 最後一次 yield 的 stop_reason 為停止原因:
+    - "iterations":   跑完 problem.iterations 回合
+    - "time_budget":  超過 problem.time_budget 秒
+    - "stagnation":   最佳成本連續 problem.patience 回合沒有下降超過 problem.min_improvement (相對比例)
+    - "converged":    最佳路徑上的 λ-branching factor <= problem.min_branching_factor
+    其餘回合為 None. 呼叫端可隨時停止迭代 (例如已經夠好), 平行模式的 process pool 會在 generator 關閉時結束.
+    參數同 run_aco.
+    """
+    started = time.monotonic()
+    colony = Colony(CG, problem, v2g_cache)
+    p = problem
+    workers = p.num_workers
+    seed = p.random_seed
+
+    if pheromone is None:
+        pheromone = initialize_pheromone(colony)
+    transitions = colony.build_transition_table() if p.use_transition_table and workers <= 1 else None
 
     best_path = None
     best_cost = float('inf')
@@ -282,70 +410,163 @@ def run_aco():
     best_charging_cost = float('inf')
     best_time = None
     final_soc_val = None
-
-    for iteration in range(iterations):
-        ants = [Ant(start_node, end_node) for _ in range(num_ants)]
-
-        for ant in ants:
-            while ant.current_node != end_node and ant.soc > 20 and ant.time_spent < max_time:
-                ant.move(pheromone, alpha, beta)
-
-            if ant.current_node == end_node and ant.soc >= target_soc:
-                print(ant.path)
-                if ant.total_cost < best_cost:
-                    best_path = ant.path
-                    best_cost = ant.total_cost
-                    best_log = ant.stations_log
-                    best_charging_cost = ant.charging_cost
-                    best_time = ant.time_spent
-                    final_soc_val = ant.soc
-
-        # --- 費洛蒙更新 ---
-        for ant in ants:
-            if ant.current_node == end_node:
-                # 路徑上每條邊都加費洛蒙
-                print(ant.path)
-                for i in range(len(ant.path) - 1):
-                    edge = (ant.path[i], ant.path[i + 1])
-                    if edge not in pheromone:
-                        pheromone[edge] = min_pheromone
-                    pheromone[edge] = max(
-                        pheromone[edge] + Q / ant.total_cost,
-                        min_pheromone
-                    )
-                
-                # 充電行為的費洛蒙更新
-                for log_item in ant.stations_log:
-                    station = log_item['station']
-                    chosen_time_min = log_item['chosen_time_min']
-                    chosen_target_soc = log_item['chosen_target_soc']
-                    
-                    if (station, 'charging') in pheromone:
-                        if (chosen_time_min, chosen_target_soc) in pheromone[(station, 'charging')]:
-                            pheromone[(station, 'charging')][(chosen_time_min, chosen_target_soc)] = max(
-                                pheromone[(station, 'charging')][(chosen_time_min, chosen_target_soc)] + Q / ant.total_cost,
-                                min_pheromone
-                            )
-
-        # --- 費洛蒙揮發 ---
-        for edge in pheromone:
-            if isinstance(pheromone[edge], dict):
-                # 充電行為
-                for option in pheromone[edge]:
-                    pheromone[edge][option] = max(pheromone[edge][option] * (1 - rho), min_pheromone)
+    # 停滯判斷: 上次 "明顯改善" 時的成本與之後經過的回合數
+    plateau_cost = float('inf')
+    stall = 0
+    incumbent = (None, [])
+
+    pool = None
+    if workers > 1:
+        if seed is None:
+            seed = random.randrange(2**32)
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(CG, problem, p.v2g_table_file))
+    elif seed is not None:
+        random.seed(seed)
+
+    try:
+        for iteration in range(p.iterations):
+            if pool is None:
+                # 費洛蒙在上一回合結束時改變 => 重建累積機率表 (平行模式由各 worker 自行重建)
+                if transitions is not None:
+                    transitions.refresh(pheromone.edges, colony.visit_count_array())
+                ants = construct_ants(colony, pheromone, p.num_ants, transitions)
             else:
-                # 一般路徑
-                pheromone[edge] = max(pheromone[edge] * (1 - rho), min_pheromone)
+                ants = construct_ants_parallel(colony, pool, pheromone, iteration, workers, seed)
+
+            improved = False
+            for ant in ants:
+                if ant.current_node == colony.end_node and ant.soc >= p.target_soc:
+                    if verbose:
+                        print(CG.to_node_path(ant.path))
+                    if ant.total_cost < best_cost:
+                        best_path = ant.path
+                        best_cost = ant.total_cost
+                        best_log = ant.stations_log
+                        best_charging_cost = ant.charging_cost
+                        best_time = ant.time_spent
+                        final_soc_val = ant.soc
+                        improved = True
+
+            # --- 費洛蒙更新 ---
+            arrived = [ant for ant in ants if ant.current_node == colony.end_node]
+            if verbose:
+                for ant in arrived:
+                    print(CG.to_node_path(ant.path))
+
+            # 路徑上每條邊都加費洛蒙 (所有螞蟻一次以 np.add.at 累加)
+            pheromone.deposit(
+                [ant.edges for ant in arrived],
+                [p.Q / ant.total_cost for ant in arrived],
+                p.min_pheromone,
+            )
 
-    return best_path, best_cost, best_charging_cost, best_log, best_time, final_soc_val
+            # 充電行為的費洛蒙更新
+            station_logs = [(log_item, ant) for ant in arrived for log_item in ant.stations_log]
+            pheromone.deposit_charging(
+                [log_item['station'] for log_item, _ in station_logs],
+                [(log_item['chosen_time_min'], log_item['chosen_target_soc']) for log_item, _ in station_logs],
+                [p.Q / ant.total_cost for _, ant in station_logs],
+                p.min_pheromone,
+            )
 
+            # --- 費洛蒙揮發 ---
+            pheromone.evaporate(p.rho, p.min_pheromone)
+
+            # --- 停止條件 ---
+            # 還沒有任何可行解時不算停滯, 繼續找
+            if best_path is not None:
+                # 第一個可行解直接成為基準 (inf 參與相對比例的計算會得到 nan)
+                if math.isinf(plateau_cost) or best_cost < plateau_cost - p.min_improvement * abs(plateau_cost):
+                    plateau_cost = best_cost
+                    stall = 0
+                else:
+                    stall += 1
+            branching = None
+            if p.min_branching_factor is not None and best_path is not None:
+                # 只看最佳路徑經過的節點: 沒走過的節點費洛蒙一直是均勻的, 全圖平均不會下降
+                branching = pheromone.branching_factor(CG, best_path[:-1])
+
+            stop_reason = None
+            if p.time_budget is not None and time.monotonic() - started >= p.time_budget:
+                stop_reason = "time_budget"
+            elif p.patience is not None and stall >= p.patience:
+                stop_reason = "stagnation"
+            elif branching is not None and branching <= p.min_branching_factor:
+                stop_reason = "converged"
+            elif iteration == p.iterations - 1:
+                stop_reason = "iterations"
+
+            # 輸出時轉回原本的節點名稱 (只在最佳解改變時轉換)
+            if improved:
+                incumbent = (
+                    CG.to_node_path(best_path),
+                    [dict(item, station=CG.node_ids[item['station']]) for item in best_log],
+                )
+            yield {
+                "iteration": iteration,
+                "elapsed": time.monotonic() - started,
+                "improved": improved,
+                "stall": stall,
+                "branching_factor": branching,
+                "stop_reason": stop_reason,
+                "best_path": incumbent[0],
+                "best_cost": best_cost,
+                "best_charging_cost": best_charging_cost,
+                "best_log": incumbent[1],
+                "best_time": best_time,
+                "final_soc": final_soc_val,
+            }
+            if stop_reason is not None:
+                break
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
 
-# 執行
-best_path, best_cost, best_charging_cost, best_log, best_time, final_soc = run_aco()
 
-print("Best Path:", best_path)
-print("Best Cost:", best_cost)
-print("Best Charging Cost:", best_charging_cost)
-print("Stations Log:", best_log)
-print("Total Time Spent:", best_time, "seconds")
-print("Final SOC:", final_soc, "%")
+def run_aco(CG, problem, v2g_cache=None, verbose=False, pheromone=None, callback=None):
+    """
+    在預先載入的 CompiledGraph 上依 RoutingProblem 執行 ACO.
+    - problem.num_workers: process 數, 1 代表原本的單執行緒模式
+    - problem.random_seed: 亂數種子; 平行模式下未設定則隨機產生一個
+    - problem.time_budget: 時間上限 (秒), 超過後在該回合結束時停止
+    - problem.patience / min_improvement / min_branching_factor: 提早停止條件 (見 iter_aco)
+    - v2g_cache:           可傳入共用的 V2GCostCache, 讓多次查詢共用快取
+    - verbose:             印出每隻抵達終點的螞蟻路徑
+    - pheromone:           接續先前查詢的 PheromoneTable (會直接更新), None 代表重新初始化
+    - callback:            每回合結束時以 iter_aco 的進度 dict 呼叫, 回傳 True 代表立即停止
+    """
+    progress = None
+    with closing(iter_aco(CG, problem, v2g_cache, verbose, pheromone)) as steps:
+        for progress in steps:
+            if callback is not None and callback(progress):
+                break
+
+    if progress is None:
+        return None, float('inf'), float('inf'), [], None, None
+    return (progress["best_path"], progress["best_cost"], progress["best_charging_cost"],
+            progress["best_log"], progress["best_time"], progress["final_soc"])
+
+
+# 執行 (平行模式在 Windows 下需要 __main__ 保護)
+if __name__ == "__main__":
+    import argparse
+    from routing import load_graph
+
+    parser = argparse.ArgumentParser(description="V2G ACO routing")
+    parser.add_argument("--graph", default=None,
+                        help="二進位圖快取目錄或 GraphML 檔 (預設 Taiwan.graph, 不存在時用 Taiwan.graphml)")
+    args = parser.parse_args()
+
+    # 讀取二進位圖快取 (mmap, 含來源檔雜湊檢查), 沒有快取時才解析 GraphML
+    CG = load_graph(args.graph)
+
+    problem = RoutingProblem()
+    best_path, best_cost, best_charging_cost, best_log, best_time, final_soc = run_aco(CG, problem, verbose=True)
+
+    print("Best Path:", best_path)
+    print("Best Cost:", best_cost)
+    print("Best Charging Cost:", best_charging_cost)
+    print("Stations Log:", best_log)
+    print("Total Time Spent:", best_time, "seconds")
+    print("Final SOC:", final_soc, "%")
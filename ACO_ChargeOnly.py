@@ -1,130 +1,132 @@
 import random
-import networkx as nx
+import time
 import numpy as np
+from pheromone import PheromoneTable
+from transition import TransitionTable
+from routing_problem import RoutingProblem
 
-# 讀取圖形文件
-graphml_file = "Taiwan.graphml"
-G = nx.read_graphml(graphml_file)
-
-# 參數設置
-start_node = "-144866"
-end_node = "-212207"
-initial_soc = 80  # 起始電量 (百分比)
-target_soc = 80  # 目標電量 (百分比)
-maximum_power = 60000  # 電池最大容量 (Wh)
-max_time = 3600 * 2  # 總時間為 2 小時
-charging_cost_per_kWh_peak = 0.3  # 尖峰時段每千瓦時充電成本 (usd)
-charging_cost_per_kWh_offpeak = 0.2  # 非尖峰時段每千瓦時充電成本 (usd)
-energy_consumption_per_m = 0.2  # 每米耗電量 (Wh)
-charging_station_power = 80  # kW (充電站功率)
-power_track_power = 12 # kW
-power_track_length = 200 # m
-
-# 螞蟻群算法參數
-num_ants = 300
-iterations = 300
-alpha = 4
-beta = 4
-rho = 0.1
-Q = 100
-min_pheromone = 1e-6  # 費洛蒙濃度下限
-
-visited_nodes = {}
+
+# 充電站可選的充電時間 (分鐘)
+charging_options = [0, 15, 30, 45, 60]
+
+
+class Colony:
+    """一次求解共用的狀態: CompiledGraph、RoutingProblem 參數與 visit 次數"""
+
+    def __init__(self, CG, problem):
+        self.CG = CG
+        self.problem = problem
+        self.start_node = CG.node_index[problem.start_node]
+        self.end_node = CG.node_index[problem.end_node]
+        self.options = problem.charging_options or charging_options
+        self.visited_nodes = {}
+
+    # 計算邊的距離 (e 為 edge index)
+    def calculate_distance(self, e):
+        return self.CG.length[e]
+
+    # 計算能量消耗
+    def calculate_energy_consumption(self, e):
+        return self.calculate_distance(e) * self.problem.energy_consumption_per_m
+
+    # 計算行駛時間
+    def calculate_travel_time(self, e):
+        return self.CG.travel_time[e]
+
+    def calculate_pt_energy_gain(self, e):
+        p = self.problem
+        return p.power_track_length / self.CG.speed[e] * p.power_track_power / 3600
+
+    # 計算充電成本
+    def calculate_station_segmented_cost(self, start_time, duration):
+        p = self.problem
+        remaining_time = duration
+        total_cost = 0
+        charging_energy = 0
+
+        while remaining_time > 0:
+            if start_time < p.peak_time_limit:
+                segment_time = min(remaining_time, p.peak_time_limit - start_time)
+                unit_cost = p.charging_cost_per_kWh_peak
+            else:
+                segment_time = remaining_time
+                unit_cost = p.charging_cost_per_kWh_offpeak
+
+            segment_energy = p.charging_station_power * segment_time / 3600
+            segment_cost = segment_energy * unit_cost
+            charging_energy += segment_energy * 1000
+            total_cost += segment_cost
+
+            remaining_time -= segment_time
+            start_time += segment_time
+
+        return total_cost, charging_energy
+
+    def heuristic(self, e, current_soc):
+        energy_consumption = self.calculate_energy_consumption(e)
+        travel_time = self.calculate_travel_time(e)
+        visit_count = self.visited_nodes.get(int(self.CG.targets[e]), 0)
+        return 1.0 / (travel_time + visit_count * 10)
+
+    def build_transition_table(self):
+        # heuristic 的固定部分為 travel_time, visit 懲罰權重為 10
+        return TransitionTable(self.CG, self.CG.travel_time, self.problem.alpha, self.problem.beta, visit_weight=10)
+
+    def visit_count_array(self):
+        counts = np.zeros(self.CG.num_nodes, dtype=np.float64)
+        if self.visited_nodes:
+            counts[list(self.visited_nodes.keys())] = list(self.visited_nodes.values())
+        return counts
 
 
 # 初始化費洛蒙
-def initialize_pheromone(G):
-    pheromone = {}
-    for u, v in G.edges():
-        pheromone[(u, v)] = 1.0
-        if G.nodes[u].get('is_charging_station', False):
-            pheromone[(u, 'charging')] = {0: 1.0, 15: 1.0, 30: 1.0, 45: 1.0, 60: 1.0}
-    return pheromone
-
-# 計算邊的距離
-def calculate_distance(u, v):
-    return G[u][v].get('length', 1)
-
-# 計算能量消耗
-def calculate_energy_consumption(u, v):
-    return calculate_distance(u, v) * energy_consumption_per_m
-
-# 計算行駛時間
-def calculate_travel_time(u, v):
-    return G[u][v].get('travel_time', 0)
-
-def calculate_pt_energy_gain(u, v):
-    return power_track_length / G[u][v].get('speed') * power_track_power / 3600
-
-# 計算充電成本
-def calculate_station_segmented_cost(start_time, duration):
-    remaining_time = duration
-    total_cost = 0
-    charging_energy = 0
-
-    while remaining_time > 0:
-        if start_time < 1.5 * 3600:
-            segment_time = min(remaining_time, 1.5 * 3600 - start_time)
-            unit_cost = charging_cost_per_kWh_peak
-        else:
-            segment_time = remaining_time
-            unit_cost = charging_cost_per_kWh_offpeak
-
-        segment_energy = charging_station_power * segment_time / 3600
-        segment_cost = segment_energy * unit_cost
-        charging_energy += segment_energy * 1000
-        total_cost += segment_cost
-
-        remaining_time -= segment_time
-        start_time += segment_time
-
-    return total_cost, charging_energy
-
-def heuristic(u, v, current_soc):
-    energy_consumption = calculate_energy_consumption(u, v)
-    travel_time = calculate_travel_time(u, v)
-    visit_count = visited_nodes.get(v, 0)
-    return 1.0 / (travel_time + visit_count * 10)
+def initialize_pheromone(colony):
+    return PheromoneTable(colony.CG, colony.options, initial=1.0)
 
 class Ant:
-    def __init__(self, start_node, end_node):
-        self.path = [start_node]
-        self.soc = initial_soc
+    def __init__(self, colony):
+        self.colony = colony
+        self.path = [colony.start_node]
+        self.edges = []  # 走過的 edge index
+        self.soc = colony.problem.initial_soc
         self.time_spent = 0
-        self.current_node = start_node
-        self.end_node = end_node
+        self.current_node = colony.start_node
+        self.end_node = colony.end_node
         self.total_cost = 0
         self.stations_log = []
 
-    def move(self, pheromone, alpha, beta):
-        next_node = self.select_next_node(pheromone, alpha, beta)
-        visited_nodes[next_node] = visited_nodes.get(next_node, 0) + 1
+    def move(self, pheromone, alpha, beta, transitions=None):
+        colony, CG, problem = self.colony, self.colony.CG, self.colony.problem
+        e = self.select_next_edge(pheromone, alpha, beta, transitions)
+        next_node = int(CG.targets[e])
+        colony.visited_nodes[next_node] = colony.visited_nodes.get(next_node, 0) + 1
         self.path.append(next_node)
+        self.edges.append(e)
         self.current_node = next_node
-        
-        if G[self.path[-2]][self.path[-1]].get('is_charging', False):  # 如果是充電道路
-            pt_charging = calculate_pt_energy_gain(self.path[-2], self.path[-1])
-            energy_consumption = calculate_energy_consumption(self.path[-2], self.path[-1]) - pt_charging
-            charging_cost = pt_charging * (charging_cost_per_kWh_peak if self.time_spent < 1.5 * 3600 else charging_cost_per_kWh_offpeak) / 1000
+
+        if CG.is_charging[e]:  # 如果是充電道路
+            pt_charging = colony.calculate_pt_energy_gain(e)
+            energy_consumption = colony.calculate_energy_consumption(e) - pt_charging
+            charging_cost = pt_charging * problem.cost_rate(self.time_spent) / 1000
             self.total_cost += charging_cost  # 計入總成本
-            self.soc = self.soc + (pt_charging / maximum_power) * 100
+            self.soc = self.soc + (pt_charging / problem.maximum_power) * 100
         else:  # 普通道路
-            energy_consumption = calculate_energy_consumption(self.path[-2], self.path[-1])
-            
-        travel_time = calculate_travel_time(self.path[-2], self.path[-1])
+            energy_consumption = colony.calculate_energy_consumption(e)
+
+        travel_time = colony.calculate_travel_time(e)
         self.time_spent += travel_time
-        self.soc -= energy_consumption / maximum_power * 100
+        self.soc -= energy_consumption / problem.maximum_power * 100
 
-        if G.nodes[next_node].get('is_charging_station', False):
+        if CG.station_mask[next_node]:
             self.handle_charging_station(pheromone, alpha, beta)
 
     def handle_charging_station(self, pheromone, alpha, beta):
-        charging_options = list(pheromone[(self.current_node, 'charging')].keys())
+        problem = self.colony.problem
+        charging_options = pheromone.options
         probabilities = []
-        for option in charging_options:
-            pheromone_strength = pheromone[(self.current_node, 'charging')][option]
-            projected_soc = self.soc + (option / 60) * charging_station_power * 1000 / maximum_power * 100
-            heuristic_strength = 1.0 / (1 + abs(target_soc - projected_soc))
+        for option, pheromone_strength in zip(charging_options, pheromone.station_options(self.current_node)):
+            projected_soc = self.soc + (option / 60) * problem.charging_station_power * 1000 / problem.maximum_power * 100
+            heuristic_strength = 1.0 / (1 + abs(problem.target_soc - projected_soc))
             probabilities.append((pheromone_strength ** alpha) * (heuristic_strength ** beta))
 
         total_prob = sum(probabilities)
@@ -133,9 +135,9 @@ class Ant:
 
         if chosen_option > 0:
             charging_time = chosen_option * 60
-            charging_energy = charging_time * charging_station_power / 3600
-            station_cost = charging_energy * (charging_cost_per_kWh_peak if self.time_spent < 1.5 * 3600 else charging_cost_per_kWh_offpeak)
-            self.soc += charging_energy * 1000 / maximum_power * 100
+            charging_energy = charging_time * problem.charging_station_power / 3600
+            station_cost = charging_energy * problem.cost_rate(self.time_spent)
+            self.soc += charging_energy * 1000 / problem.maximum_power * 100
             self.time_spent += charging_time
             self.total_cost += station_cost
             self.stations_log.append({
@@ -145,20 +147,34 @@ class Ant:
                 "cost": station_cost
             })
 
-    def select_next_node(self, pheromone, alpha, beta):
-        neighbors = list(G.neighbors(self.current_node))
+    def select_next_edge(self, pheromone, alpha, beta, transitions=None):
+        if transitions is not None:
+            return transitions.sample(self.current_node, random.random())
+
+        out_edges = self.colony.CG.out_edges(self.current_node)
         probabilities = []
-        for neighbor in neighbors:
-            pheromone_strength = pheromone.get((self.current_node, neighbor), min_pheromone)
-            heuristic_strength = heuristic(self.current_node, neighbor, self.soc)
+        for e in out_edges:
+            pheromone_strength = pheromone.edges[e]
+            heuristic_strength = self.colony.heuristic(e, self.soc)
             probabilities.append((pheromone_strength ** alpha) * (heuristic_strength ** beta))
 
         total_prob = sum(probabilities)
         probabilities = [p / total_prob for p in probabilities]
-        return random.choices(neighbors, probabilities)[0]
-
-def run_aco():
-    pheromone = initialize_pheromone(G)
+        return random.choices(out_edges, probabilities)[0]
+
+def run_aco(CG, problem):
+    """
+    在預先載入的 CompiledGraph 上依 RoutingProblem 執行 (只在充電站充電的) ACO.
+    problem.time_budget (秒) 不為 None 時, 超過後在該回合結束時停止.
+    """
+    started = time.monotonic()
+    colony = Colony(CG, problem)
+    p = problem
+    if p.random_seed is not None:
+        random.seed(p.random_seed)
+
+    pheromone = initialize_pheromone(colony)
+    transitions = colony.build_transition_table() if p.use_transition_table else None
 
     best_path = None
     best_cost = float('inf')
@@ -166,14 +182,17 @@ def run_aco():
     best_time = float('inf')
     final_soc = None
 
-    for iteration in range(iterations):
-        ants = [Ant(start_node, end_node) for _ in range(num_ants)]
+    for iteration in range(p.iterations):
+        if transitions is not None:
+            transitions.refresh(pheromone.edges, colony.visit_count_array())
+
+        ants = [Ant(colony) for _ in range(p.num_ants)]
 
         for ant in ants:
-            while ant.current_node != end_node and ant.soc > 10 and ant.time_spent < max_time:
-                ant.move(pheromone, alpha, beta)
+            while ant.current_node != colony.end_node and ant.soc > p.min_soc and ant.time_spent < p.max_time:
+                ant.move(pheromone, p.alpha, p.beta, transitions)
 
-            if ant.current_node == end_node and ant.soc >= target_soc:
+            if ant.current_node == colony.end_node and ant.soc >= p.target_soc:
                 if ant.time_spent < best_time:
                     best_path = ant.path
                     best_cost = ant.total_cost
@@ -181,30 +200,48 @@ def run_aco():
                     best_time = ant.time_spent
                     final_soc = ant.soc
 
-        for ant in ants:
-            if ant.current_node == end_node:
-                #print(ant.path)
-                for i in range(len(ant.path) - 1):
-                    edge = (ant.path[i], ant.path[i + 1])
-                    pheromone[edge] = max(pheromone[edge] + Q / ant.total_cost, min_pheromone)
-                for log in ant.stations_log:
-                    station = log['station']
-                    charging_time = log['charging_time'] // 60
-                    if charging_time in pheromone[(station, 'charging')]:
-                        pheromone[(station, 'charging')][charging_time] = max(pheromone[(station, 'charging')][charging_time] + Q / ant.total_cost, min_pheromone)
-
-        for edge in pheromone:
-            if isinstance(pheromone[edge], dict):
-                for option in pheromone[edge]:
-                    pheromone[edge][option] = max(pheromone[edge][option] * (1 - rho), min_pheromone)
-            else:
-                pheromone[edge] = max(pheromone[edge] * (1 - rho), min_pheromone)
+        arrived = [ant for ant in ants if ant.current_node == colony.end_node]
+        pheromone.deposit([ant.edges for ant in arrived], [p.Q / ant.total_cost for ant in arrived], p.min_pheromone)
+
+        station_logs = [(log, ant) for ant in arrived for log in ant.stations_log]
+        pheromone.deposit_charging(
+            [log['station'] for log, _ in station_logs],
+            [log['charging_time'] // 60 for log, _ in station_logs],
+            [p.Q / ant.total_cost for _, ant in station_logs],
+            p.min_pheromone,
+        )
+
+        pheromone.evaporate(p.rho, p.min_pheromone)
+
+        if p.time_budget is not None and time.monotonic() - started >= p.time_budget:
+            break
+
+    # 輸出時轉回原本的節點名稱
+    if best_path is not None:
+        best_path = CG.to_node_path(best_path)
+        best_log = [dict(log, station=CG.node_ids[log['station']]) for log in best_log]
 
     return best_path, best_cost, best_log, best_time, final_soc
 
-best_path, best_cost, best_log, best_time, final_soc = run_aco()
-print("Path:", best_path)
-print("Cost:", best_cost)
-print("Stations Log:", best_log)
-print("Total Time Spent:", best_time, "seconds")
-print("Final SOC:", final_soc, "%")
\ No newline at end of file
+
+# 此版本的預設參數: 目標電量 80%, 最低電量 10%
+default_problem = RoutingProblem(target_soc=80, min_soc=10)
+
+if __name__ == "__main__":
+    import argparse
+    from routing import load_graph
+
+    parser = argparse.ArgumentParser(description="Charge-only ACO routing")
+    parser.add_argument("--graph", default=None,
+                        help="二進位圖快取目錄或 GraphML 檔 (預設 Taiwan.graph, 不存在時用 Taiwan.graphml)")
+    args = parser.parse_args()
+
+    # 讀取二進位圖快取 (mmap, 含來源檔雜湊檢查), 沒有快取時才解析 GraphML
+    CG = load_graph(args.graph)
+
+    best_path, best_cost, best_log, best_time, final_soc = run_aco(CG, default_problem)
+    print("Path:", best_path)
+    print("Cost:", best_cost)
+    print("Stations Log:", best_log)
+    print("Total Time Spent:", best_time, "seconds")
+    print("Final SOC:", final_soc, "%")
@@ -0,0 +1,329 @@
+import os
+import json
+import heapq
+import hashlib
+import numpy as np
+import networkx as nx
+
+
+# 二進位圖快取的格式版本, 陣列配置改變時要加一
+GRAPH_CACHE_VERSION = 1
+
+# 快取目錄中的陣列 (各存成一個 .npy, 可用 mmap 載入)
+_CACHE_ARRAYS = ("node_ids", "offsets", "targets", "edge_ids", "length", "travel_time", "speed",
+                 "is_charging", "station_mask")
+
+
+class CompiledGraph:
+    """
+    將 NetworkX 有向圖編譯成 CSR (compressed sparse row) 陣列結構.
+
+    - 節點以整數 id (0..N-1) 表示, node_ids[i] 為原本的節點名稱
+    - 節點 u 的出邊為 edge index offsets[u] ~ offsets[u+1]-1
+    - 邊屬性 (length / travel_time / speed / is_charging) 皆為對齊 edge index 的 NumPy 陣列
+    - station_mask[u] 為充電站 bitmask (節點是否為充電站)
+    """
+
+    def __init__(self, node_ids, offsets, targets, edge_ids, length, travel_time, speed,
+                 is_charging, station_mask):
+        self.node_ids = list(node_ids)
+        self.node_index = {node: i for i, node in enumerate(self.node_ids)}
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+        self.targets = np.asarray(targets, dtype=np.int64)
+        # 每條邊的起點, 由 offsets 展開而得 (方便向量化運算)
+        self.sources = np.repeat(np.arange(len(self.node_ids), dtype=np.int64), np.diff(self.offsets))
+        self.edge_ids = list(edge_ids)
+        self.length = np.asarray(length, dtype=np.float64)
+        self.travel_time = np.asarray(travel_time, dtype=np.float64)
+        self.speed = np.asarray(speed, dtype=np.float64)
+        self.is_charging = np.asarray(is_charging, dtype=bool)
+        self.station_mask = np.asarray(station_mask, dtype=bool)
+        # 由二進位快取 mmap 載入時記錄來源目錄, pickle 時只傳路徑
+        self.cache_path = None
+        self._in_edges = None
+        self._cheapest_parallel = {}
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    @property
+    def num_edges(self):
+        return len(self.targets)
+
+    def out_edges(self, u):
+        """節點 u 所有出邊的 edge index"""
+        return range(self.offsets[u], self.offsets[u + 1])
+
+    def neighbors(self, u):
+        return self.targets[self.offsets[u]:self.offsets[u + 1]]
+
+    def edge_index(self, u, v, weight=None):
+        """
+        回傳 (u, v) 的 edge index, 不存在則回傳 -1.
+        有平行邊時: weight 為 None 取第一條, 否則取該權重最小的一條 (與 path_weight / KSP 的選擇一致).
+        """
+        start, stop = self.offsets[u], self.offsets[u + 1]
+        hits = np.nonzero(self.targets[start:stop] == v)[0]
+        if not len(hits):
+            return -1
+        e = int(start + hits[0])
+        return e if weight is None else int(self.cheapest_parallel_edges(weight)[e])
+
+    def cheapest_parallel_edges(self, weight):
+        """
+        長度 num_edges 的陣列: 每條邊對應到同一 (起點, 終點) 的平行邊中 weight 最小者
+        (相同時取 edge index 較小的). 每種權重第一次呼叫時建立後保留.
+        """
+        cheapest = self._cheapest_parallel.get(weight)
+        if cheapest is None:
+            keys = self.sources * self.num_nodes + self.targets
+            # 依 (key, 權重, edge index) 排序後, 每個 key 的第一條即最小的平行邊
+            order = np.lexsort((np.arange(self.num_edges), self.edge_weight(weight), keys))
+            sorted_keys = keys[order]
+            first = np.ones(self.num_edges, dtype=bool)
+            first[1:] = sorted_keys[1:] != sorted_keys[:-1]
+            group = np.searchsorted(sorted_keys[first], keys)
+            cheapest = self._cheapest_parallel[weight] = order[first][group]
+        return cheapest
+
+    def edge_index_array(self, us, vs, weight=None):
+        """
+        edge_index 的向量化版本: us, vs 為等長的節點陣列, 回傳 edge index 陣列 (不存在為 -1).
+        出邊依 (起點, 終點) 排序, 因此以 source * N + target 為 key 二分搜尋即可.
+        weight 的意義同 edge_index.
+        """
+        keys = self.sources * self.num_nodes + self.targets
+        query = np.asarray(us, dtype=np.int64) * self.num_nodes + np.asarray(vs, dtype=np.int64)
+        pos = np.searchsorted(keys, query)
+        found = pos < len(keys)
+        found[found] = keys[pos[found]] == query[found]
+        if weight is not None:
+            pos[found] = self.cheapest_parallel_edges(weight)[pos[found]]
+        return np.where(found, pos, -1)
+
+    def edge_indices(self, u, v):
+        """(u, v) 之間所有平行邊的 edge index"""
+        start, stop = self.offsets[u], self.offsets[u + 1]
+        return [int(start + k) for k in np.nonzero(self.targets[start:stop] == v)[0]]
+
+    def in_edges_csr(self):
+        """
+        反向 CSR: 節點 v 的入邊為 in_edges[in_offsets[v]:in_offsets[v+1]] (edge index),
+        供反向 Dijkstra 使用. 第一次呼叫時建立後保留.
+        """
+        if self._in_edges is None:
+            in_edges = np.argsort(self.targets, kind="stable")
+            in_offsets = np.zeros(self.num_nodes + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.targets, minlength=self.num_nodes), out=in_offsets[1:])
+            self._in_edges = (in_offsets, in_edges)
+        return self._in_edges
+
+    def is_station(self, u):
+        return bool(self.station_mask[u])
+
+    def edge_weight(self, weight):
+        """依屬性名稱取得邊權重陣列, 例如 'travel_time' 或 'length'"""
+        return getattr(self, weight)
+
+    def to_index_path(self, path):
+        return [self.node_index[node] for node in path]
+
+    def to_node_path(self, path):
+        return [self.node_ids[u] for u in path]
+
+    def __getstate__(self):
+        # 從快取 mmap 載入的圖傳給 worker process 時只傳路徑, worker 再以 mmap 開啟同一批檔案 (共用 page cache)
+        if self.cache_path is not None:
+            return {"cache_path": self.cache_path}
+        return self.__dict__
+
+    def __setstate__(self, state):
+        if set(state) == {"cache_path"}:
+            state = load_graph_cache(state["cache_path"]).__dict__
+        self.__dict__.update(state)
+
+
+def compile_graph(G):
+    """
+    將 NetworkX 有向圖 (directed_graph.py 的輸出格式, DiGraph 或 MultiDiGraph) 編譯成 CompiledGraph.
+    缺少的屬性沿用原本程式的預設值: length=1, travel_time=0, speed=1.
+    """
+    node_ids = list(G.nodes())
+    node_index = {node: i for i, node in enumerate(node_ids)}
+
+    offsets = np.zeros(len(node_ids) + 1, dtype=np.int64)
+    targets, edge_ids = [], []
+    length, travel_time, speed, is_charging = [], [], [], []
+
+    for i, u in enumerate(node_ids):
+        # 依目標節點排序, 讓同一節點的出邊順序固定; MultiDiGraph 的平行邊各自成為一條 edge
+        if G.is_multigraph():
+            out = [(v, data) for v, keydict in G[u].items() for data in keydict.values()]
+        else:
+            out = list(G[u].items())
+        out.sort(key=lambda item: node_index[item[0]])
+        for v, data in out:
+            targets.append(node_index[v])
+            edge_ids.append(data.get('id'))
+            length.append(data.get('length', 1))
+            travel_time.append(data.get('travel_time', 0))
+            speed.append(data.get('speed', 1))
+            is_charging.append(data.get('is_charging', False))
+        offsets[i + 1] = len(targets)
+
+    station_mask = [G.nodes[u].get('is_charging_station', False) for u in node_ids]
+
+    return CompiledGraph(node_ids, offsets, targets, edge_ids, length, travel_time, speed,
+                         is_charging, station_mask)
+
+
+def load_compiled_graph(graphml_file):
+    """讀取 GraphML 並編譯成 CompiledGraph (只需做一次)"""
+    return compile_graph(nx.read_graphml(graphml_file))
+
+
+def file_hash(paths):
+    """來源檔案 (例如 net.xml 與充電站檔) 內容的 SHA-256, 用來檢查快取是否過期"""
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                digest.update(chunk)
+    return digest.hexdigest()
+
+
+def graph_signature(cg, weight=None):
+    """
+    圖結構 (offsets/targets) 的 SHA-256, 給定 weight 時連同該邊權重一起計算.
+    依附在圖上的衍生資料 (地標表、費洛蒙) 以此檢查是否屬於同一張圖; 充電站更新不影響.
+    """
+    digest = hashlib.sha256()
+    arrays = (cg.offsets, cg.targets) if weight is None else (cg.offsets, cg.targets, cg.edge_weight(weight))
+    for array in arrays:
+        digest.update(np.ascontiguousarray(array).tobytes())
+    return digest.hexdigest()
+
+
+def save_graph_cache(cg, cache_dir, source_hash=None, source_files=None, net_hash=None):
+    """
+    將 CompiledGraph 存成二進位快取目錄: 每個陣列一個 .npy, 另有 meta.json
+    (格式版本、來源檔雜湊與路徑、節點/邊數). 節點與邊的名稱存成定長字串陣列.
+    source_files 以相對於快取目錄的路徑記錄, 載入時 (graph_cache_sources) 可找回來源檔重算雜湊.
+    net_hash 為路網 (拓撲) 來源檔本身的雜湊, 只更新充電站時用來確認路網沒有改變.
+    """
+    os.makedirs(cache_dir, exist_ok=True)
+    meta_file = os.path.join(cache_dir, "meta.json")
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+
+    arrays = {
+        "node_ids": np.array(cg.node_ids, dtype=str),
+        "edge_ids": np.array(["" if e is None else e for e in cg.edge_ids], dtype=str),
+    }
+    for name in _CACHE_ARRAYS:
+        if name not in arrays:
+            arrays[name] = getattr(cg, name)
+    for name, array in arrays.items():
+        np.save(os.path.join(cache_dir, name + ".npy"), array)
+
+    meta = {
+        "version": GRAPH_CACHE_VERSION,
+        "source_hash": source_hash,
+        "source_files": None if source_files is None else [os.path.relpath(path, cache_dir) for path in source_files],
+        "net_hash": net_hash,
+        "num_nodes": cg.num_nodes,
+        "num_edges": cg.num_edges,
+    }
+    # meta.json 最後寫入, 中途失敗的目錄不會被當成完整快取
+    with open(meta_file, "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def graph_cache_sources(cache_dir):
+    """meta.json 記錄的來源檔路徑 (依 save_graph_cache 的 source_files 順序), 沒有記錄時回傳 None"""
+    meta_file = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_file):
+        return None
+    with open(meta_file) as f:
+        source_files = json.load(f).get("source_files")
+    if not source_files:
+        return None
+    return [os.path.normpath(os.path.join(cache_dir, path)) for path in source_files]
+
+
+def load_graph_cache(cache_dir, expected_hash=None, mmap=True):
+    """
+    讀取 save_graph_cache 產生的目錄. mmap=True 時數值陣列以唯讀 mmap 開啟,
+    多個 process 載入同一目錄時共用作業系統的 page cache.
+    格式版本不符, 或 expected_hash 與建立時的來源檔雜湊不同時 raise ValueError.
+    """
+    meta_file = os.path.join(cache_dir, "meta.json")
+    if not os.path.exists(meta_file):
+        raise ValueError(f"{cache_dir} is not a graph cache (missing meta.json)")
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta.get("version") != GRAPH_CACHE_VERSION:
+        raise ValueError(
+            f"Graph cache {cache_dir} has version {meta.get('version')}, expected {GRAPH_CACHE_VERSION}"
+        )
+    if expected_hash is not None and meta.get("source_hash") != expected_hash:
+        raise ValueError(f"Graph cache {cache_dir} is out of date with its source files")
+
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(cache_dir, name + ".npy"), mmap_mode=mmap_mode)
+              for name in _CACHE_ARRAYS}
+    arrays["node_ids"] = arrays["node_ids"].tolist()
+    arrays["edge_ids"] = [e if e else None for e in arrays["edge_ids"].tolist()]
+
+    cg = CompiledGraph(**arrays)
+    if cg.num_nodes != meta["num_nodes"] or cg.num_edges != meta["num_edges"]:
+        raise ValueError(f"Graph cache {cache_dir} is inconsistent with its meta.json")
+    if mmap:
+        cg.cache_path = os.path.abspath(cache_dir)
+    return cg
+
+
+def shortest_path(cg, source, target, weight="travel_time", banned_edges=None):
+    """
+    在 CompiledGraph 上做 Dijkstra, 回傳整數節點路徑 (找不到則回傳 None).
+    banned_edges: edge index 集合, 搜尋時視為不存在 (不需修改圖本身)
+    """
+    w = cg.edge_weight(weight)
+    offsets, targets = cg.offsets, cg.targets
+    dist = {source: 0.0}
+    prev = {}
+    done = set()
+    heap = [(0.0, source)]
+
+    while heap:
+        d, u = heapq.heappop(heap)
+        if u in done:
+            continue
+        done.add(u)
+        if u == target:
+            break
+        for e in range(offsets[u], offsets[u + 1]):
+            if banned_edges and e in banned_edges:
+                continue
+            v = int(targets[e])
+            nd = d + w[e]
+            if nd < dist.get(v, float('inf')):
+                dist[v] = nd
+                prev[v] = u
+                heapq.heappush(heap, (nd, v))
+
+    if target not in done:
+        return None
+
+    path = [target]
+    while path[-1] != source:
+        path.append(prev[path[-1]])
+    path.reverse()
+    return path
+
+
+def path_weight(cg, path, weight="travel_time"):
+    w = cg.edge_weight(weight)
+    # 有平行邊時取權重最小的一條 (與 shortest_path 的選擇一致)
+    return sum(min(w[e] for e in cg.edge_indices(u, v)) for u, v in zip(path[:-1], path[1:]))
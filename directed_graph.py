@@ -1,92 +1,343 @@
-import xml.etree.ElementTree as ET
+import os
+import json
+import sys
+import time
+import argparse
+import numpy as np
 import networkx as nx
+from compiled_graph import compile_graph, file_hash, save_graph_cache, load_graph_cache
+from landmarks import build_landmarks, save_landmarks
+from xml_stream import iter_top_level
 
-# 載入 SUMO 的 .net.xml 文件
-network_tree = ET.parse('Taiwan2.net.xml')  # 請替換為你的 SUMO 網路文件名稱
-network_root = network_tree.getroot()
-
-
-# 初始化有向圖
-G = nx.DiGraph()
-
-
-# 遍歷所有節點，並將其加入圖中
-for node in network_root.findall('node'):
-   node_id = node.get('id')
-   x, y = float(node.get('x')), float(node.get('y'))
-   G.add_node(node_id, pos=(x, y))  # 使用節點的座標作為屬性
-
-
-# 遍歷所有邊，將其加入有向圖中
-for edge in network_root.findall('edge'):
-   # 排除內部邊
-   if 'function' in edge.attrib and edge.get('function') == 'internal':
-       continue
-
-
-   edge_id = edge.get('id')
-   from_node = edge.get('from')
-   to_node = edge.get('to')
-   length = float(edge.find('lane').get('length'))
-   speed = float(edge.find('lane').get('speed'))
-   travel_time = float(edge.find('lane').get('length')) / float(edge.find('lane').get('speed'))
-  
-   # 將邊添加到圖中，並加上長度和速度等屬性
-   G.add_edge(from_node, to_node, id=edge_id, length=length, speed=speed, travel_time=travel_time, is_charging=False)
-
-
-# 載入充電站文件並標記充電邊
-charging_tree = ET.parse('power_track_add_Taiwan.xml')  # 請替換為你的充電站文件名稱
-charging_root = charging_tree.getroot()
-
-
-# 提取充電站資訊，並標記 NetworkX 圖中的相應邊
-for station in charging_root.findall('chargingStation'):
-   lane_id = station.get('lane')
-   edge_id = lane_id.split('_')[0]  # 假設 edge_id 是 lane_id 去掉 "_0" 等後綴部分
-  
-   # 在 NetworkX 圖中找到對應的邊，並設置充電屬性
-   for from_node, to_node, data in G.edges(data=True):
-       if data['id'] == edge_id:
-           data['is_charging'] = True
-       
-# 載入充電站文件並標記充電站
-charging_tree = ET.parse('charging_stations_add_Taiwan.xml')  # 請替換為你的充電站文件名稱
-charging_root = charging_tree.getroot()
-
-# 提取充電站資訊，並標記 NetworkX 圖中的相應節點
-for station in charging_root.findall('chargingStation'):
-    lane_id = station.get('lane')
-    edge_id = lane_id.split('_')[0]  # 假設 edge_id 是 lane_id 去掉 "_0" 等後綴部分
-    start_pos = float(station.get('startPos'))
-
-    # 找到與充電站匹配的節點
-    for from_node, to_node, data in G.edges(data=True):
-        if data['id'] == edge_id:
-            # 將充電站屬性標記到目標節點上
-            G.nodes[to_node]['is_charging_station'] = True
-            G.nodes[to_node]['charging_station_id'] = station.get('id')
-            break
-
-
-# 圖構建完成，現在 G 是包含充電資訊的 NetworkX 有向圖
-# 將圖保存為 GraphML 格式
-largest_scc = max(nx.strongly_connected_components(G), key=len)
-G_largest_scc = G.subgraph(largest_scc).copy()
-
-# 輸出結果
-print(f"Original Graph Nodes: {len(G.nodes)}")
-print(f"Original Graph Edges: {len(G.edges)}")
-print(f"Largest Strongly Connected Component Nodes: {len(G_largest_scc.nodes)}")
-print(f"Largest Strongly Connected Component Edges: {len(G_largest_scc.edges)}")
-
-# 保存結果為 GraphML 格式
-nx.write_graphml(G_largest_scc, "Taiwan.graphml")
-# 檢查是否強連通
-if nx.is_strongly_connected(G_largest_scc):
-    print("The graph is already strongly connected.")
-else:
-    print("The graph is not strongly connected.")
-    components = list(nx.strongly_connected_components(G))
-    print(f"Strongly connected components: {components}")
+try:
+    import resource  # 只有 Unix 有, 用來取得 peak RSS
+except ImportError:
+    resource = None
 
+# 輸入/輸出檔案 (請替換為你的 SUMO 網路與充電站文件名稱, 可直接使用 .gz 壓縮檔)
+net_file = 'Taiwan2.net.xml'
+power_track_file = 'power_track_add_Taiwan.xml'
+charging_station_file = 'charging_stations_add_Taiwan.xml'
+graphml_file = "Taiwan.graphml"
+graph_cache_dir = "Taiwan.graph"  # 二進位快取 (compiled_graph.load_graph_cache 讀取)
+station_records_file = "stations.json"  # 快取目錄中的充電站紀錄 (供增量更新比對)
+network_index_file = "network.json"  # 快取目錄中的 edge id / lane 索引 (增量更新時對應充電站 lane)
+
+
+def peak_rss_mb():
+    """目前程序的 peak RSS (MB), 平台不支援時回傳 None"""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 以 KB 回報, macOS 以 bytes 回報
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def parse_lane_id(lane_id):
+    """SUMO 的 lane id 為 "<edge id>_<lane index>", edge id 本身可能含底線, 只去掉最後一段"""
+    return lane_id.rsplit('_', 1)[0]
+
+
+def station_lanes(station):
+    """chargingStation 的 lane 屬性, 允許以空白或逗號分隔多條 lane"""
+    return station.get('lane', '').replace(',', ' ').split()
+
+
+def read_station_edges(path, edge_ids, lane_to_edge=None):
+    """
+    串流讀取充電站文件, 回傳 ({station id: [edge id, ...]}, 找不到對應 edge 的 lane 數).
+    edge_ids 為圖中存在的 edge id 集合 (或以 edge id 為 key 的 dict);
+    lane_to_edge 沒有的 lane 以 parse_lane_id 推得 edge id.
+    """
+    lane_to_edge = lane_to_edge or {}
+    records = {}
+    unmatched = 0
+    for station in iter_top_level(path, ('chargingStation',)):
+        edges = records.setdefault(station.get('id'), [])
+        for lane_id in station_lanes(station):
+            edge_id = lane_to_edge.get(lane_id, parse_lane_id(lane_id))
+            if edge_id not in edge_ids:
+                unmatched += 1
+            elif edge_id not in edges:
+                edges.append(edge_id)
+    return records, unmatched
+
+
+def read_network_index(net_file):
+    """只串流讀取路網的 edge id 與 lane id -> edge id 索引 (不建圖), 回傳 (edge id 集合, lane_to_edge)"""
+    edge_ids = set()
+    lane_to_edge = {}
+    for elem in iter_top_level(net_file, ('edge',)):
+        if elem.get('function') == 'internal':
+            continue
+        edge_id = elem.get('id')
+        edge_ids.add(edge_id)
+        for lane in elem.findall('lane'):
+            lane_to_edge[lane.get('id')] = edge_id
+    return edge_ids, lane_to_edge
+
+
+def build_graph(net_file, power_track_file, charging_station_file):
+    """
+    由 SUMO 網路與充電站文件建立有向圖 (串流讀取, 可讀 .gz).
+    圖為 MultiDiGraph (key 為 SUMO edge id), 同一對節點間的多條 edge 都會保留.
+    讀取時建立 edge id -> (u, v) 與 lane id -> edge id 索引, 充電站標記為線性時間.
+    回傳 (原圖, 最大強連通子圖, stats), stats 含讀取的元素數、耗時、吞吐量、peak RSS
+    與找不到對應 edge 的充電站 lane 數.
+    """
+    started = time.perf_counter()
+
+    # 初始化有向圖
+    G = nx.MultiDiGraph()
+    edge_index = {}     # edge id -> (from_node, to_node)
+    lane_to_edge = {}   # lane id -> edge id
+    num_nodes = 0
+    num_edges = 0
+
+    # 串流讀取節點與邊
+    for elem in iter_top_level(net_file, ('node', 'edge')):
+        if elem.tag == 'node':
+            node_id = elem.get('id')
+            x, y = float(elem.get('x')), float(elem.get('y'))
+            G.add_node(node_id, x=x, y=y)  # 使用節點的座標作為屬性 (GraphML 不支援 tuple 屬性)
+            num_nodes += 1
+            continue
+
+        # 排除內部邊
+        if elem.get('function') == 'internal':
+            continue
+
+        edge_id = elem.get('id')
+        from_node = elem.get('from')
+        to_node = elem.get('to')
+        lanes = elem.findall('lane')
+        length = float(lanes[0].get('length'))
+        speed = float(lanes[0].get('speed'))
+        travel_time = length / speed
+
+        # 將邊添加到圖中，並加上長度和速度等屬性
+        G.add_edge(from_node, to_node, key=edge_id, id=edge_id, length=length, speed=speed, travel_time=travel_time, is_charging=False)
+        edge_index[edge_id] = (from_node, to_node)
+        for lane in lanes:
+            lane_to_edge[lane.get('id')] = edge_id
+        num_edges += 1
+    parsed = time.perf_counter()
+
+    # 依 edge id / lane id 索引找出每個充電站所在的 edge
+    power_tracks, unmatched_pt = read_station_edges(power_track_file, edge_index, lane_to_edge)
+    stations, unmatched_cs = read_station_edges(charging_station_file, edge_index, lane_to_edge)
+
+    # 標記充電邊
+    for edge_ids in power_tracks.values():
+        for edge_id in edge_ids:
+            from_node, to_node = edge_index[edge_id]
+            G.edges[from_node, to_node, edge_id]['is_charging'] = True
+
+    # 標記充電站 (標記在 edge 的目標節點上)
+    for station_id, edge_ids in stations.items():
+        for edge_id in edge_ids:
+            node = G.nodes[edge_index[edge_id][1]]
+            node['is_charging_station'] = True
+            # 同一節點有多個充電站時, id 以空白分隔全部保留
+            ids = node.get('charging_station_id', '').split()
+            if station_id not in ids:
+                node['charging_station_id'] = ' '.join(ids + [station_id])
+
+
+    # 圖構建完成，現在 G 是包含充電資訊的 NetworkX 有向圖
+    largest_scc = max(nx.strongly_connected_components(G), key=len)
+    G_largest_scc = G.subgraph(largest_scc).copy()
+
+    elapsed = time.perf_counter() - started
+    parse_seconds = parsed - started
+    stats = {
+        "nodes_read": num_nodes,
+        "edges_read": num_edges,
+        "unmatched_station_lanes": unmatched_pt + unmatched_cs,
+        "parse_seconds": parse_seconds,
+        "total_seconds": elapsed,
+        "edges_per_second": num_edges / parse_seconds if parse_seconds > 0 else float('inf'),
+        "peak_rss_mb": peak_rss_mb(),
+        # 寫入快取目錄, 供之後的增量更新比對
+        "station_records": {"power_track": power_tracks, "charging_station": stations},
+        "network_index": (set(edge_index), lane_to_edge),
+    }
+    return G, G_largest_scc, stats
+
+
+def save_station_records(cache_dir, records):
+    path = os.path.join(cache_dir, station_records_file)
+    with open(path + '.tmp', 'w') as f:
+        json.dump(records, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_station_records(cache_dir):
+    path = os.path.join(cache_dir, station_records_file)
+    if not os.path.exists(path):
+        raise ValueError(f"{cache_dir} has no {station_records_file}; rebuild it with directed_graph.py first")
+    with open(path) as f:
+        return json.load(f)
+
+
+def save_network_index(cache_dir, edge_ids, lane_to_edge):
+    """保存路網的 edge id 與 lane 索引; lane 只存 parse_lane_id 推不出 edge id 的部分"""
+    lanes = {lane_id: edge_id for lane_id, edge_id in lane_to_edge.items() if parse_lane_id(lane_id) != edge_id}
+    path = os.path.join(cache_dir, network_index_file)
+    with open(path + '.tmp', 'w') as f:
+        json.dump({"edges": sorted(edge_ids), "lanes": lanes}, f)
+    os.replace(path + '.tmp', path)
+
+
+def load_network_index(cache_dir, net_file=None):
+    """讀取快取中的 (edge id 集合, lane_to_edge); 快取沒有索引時由 net_file 重建, 兩者都沒有則 raise ValueError"""
+    path = os.path.join(cache_dir, network_index_file)
+    if os.path.exists(path):
+        with open(path) as f:
+            index = json.load(f)
+        return set(index["edges"]), index["lanes"]
+    if net_file is None:
+        raise ValueError(f"{cache_dir} has no {network_index_file}; pass net_file or rebuild it with directed_graph.py")
+    return read_network_index(net_file)
+
+
+def station_flags(cg, records):
+    """由充電站紀錄計算 (is_charging, station_mask); 不在快取圖中 (例如最大強連通子圖外) 的 edge 略過"""
+    edge_position = {edge_id: e for e, edge_id in enumerate(cg.edge_ids)}
+
+    def positions(kind):
+        found = [edge_position.get(edge_id) for edge_ids in records[kind].values() for edge_id in edge_ids]
+        return np.array([e for e in found if e is not None], dtype=np.int64)
+
+    is_charging = np.zeros(cg.num_edges, dtype=bool)
+    is_charging[positions("power_track")] = True
+    station_mask = np.zeros(cg.num_nodes, dtype=bool)
+    station_mask[cg.targets[positions("charging_station")]] = True
+    return is_charging, station_mask
+
+
+def diff_station_records(old, new):
+    """各類充電站新增/移除/位置改變的 station id"""
+    diff = {}
+    for kind in ("power_track", "charging_station"):
+        before, after = old.get(kind, {}), new[kind]
+        diff[kind] = {
+            "added": sorted(set(after) - set(before)),
+            "removed": sorted(set(before) - set(after)),
+            "changed": sorted(k for k in set(before) & set(after) if before[k] != after[k]),
+        }
+    return diff
+
+
+def _replace_array(cache_dir, name, array):
+    # 先寫暫存檔再 rename: 已 mmap 舊檔的 process 仍看到完整的舊內容
+    path = os.path.join(cache_dir, name + ".npy")
+    with open(path + ".tmp", "wb") as f:
+        np.save(f, array)
+    os.replace(path + ".tmp", path)
+
+
+def update_graph_cache(cache_dir, power_track_file, charging_station_file, net_file=None):
+    """
+    充電站文件改變時只更新二進位快取中的充電旗標, 不重新解析路網、不重算強連通分量.
+    比對快取中的充電站紀錄與新文件, 重寫 is_charging / station_mask 與紀錄;
+    充電站 lane 與完整建圖時一樣經由路網的 lane 索引對應到 edge (快取中沒有索引時由 net_file 重建);
+    給定 net_file 時先確認它與建立快取時的路網相同 (不同則 raise ValueError, 需要完整重建),
+    再一併更新 meta.json 的來源檔雜湊與路徑. 沒有 net_file 時來源檔雜湊清空, 之後載入時無法通過檢查.
+    回傳各類充電站的差異, 以及找不到對應 edge 的充電站 lane 數 (unmatched_station_lanes).
+    注意: Taiwan.graphml 不會更新, 需要 GraphML 時仍要完整重建.
+    """
+    meta_file = os.path.join(cache_dir, "meta.json")
+    cg = load_graph_cache(cache_dir, mmap=False)
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if net_file is not None and meta.get("net_hash") != file_hash([net_file]):
+        raise ValueError(f"{net_file} differs from the network {cache_dir} was built from; "
+                         f"rebuild the cache instead of updating it")
+    old_records = load_station_records(cache_dir)
+
+    edge_ids, lane_to_edge = load_network_index(cache_dir, net_file)
+    power_tracks, unmatched_pt = read_station_edges(power_track_file, edge_ids, lane_to_edge)
+    stations, unmatched_cs = read_station_edges(charging_station_file, edge_ids, lane_to_edge)
+    records = {"power_track": power_tracks, "charging_station": stations}
+    diff = diff_station_records(old_records, records)
+
+    is_charging, station_mask = station_flags(cg, records)
+    _replace_array(cache_dir, "is_charging", is_charging)
+    _replace_array(cache_dir, "station_mask", station_mask)
+    save_station_records(cache_dir, records)
+
+    if net_file is not None:
+        source_files = [net_file, power_track_file, charging_station_file]
+        meta["source_hash"] = file_hash(source_files)
+        meta["source_files"] = [os.path.relpath(path, cache_dir) for path in source_files]
+    else:
+        meta["source_hash"] = None
+    with open(meta_file + ".tmp", "w") as f:
+        json.dump(meta, f, indent=2)
+    os.replace(meta_file + ".tmp", meta_file)
+
+    diff["changed_edges"] = int(np.count_nonzero(is_charging != cg.is_charging))
+    diff["changed_nodes"] = int(np.count_nonzero(station_mask != cg.station_mask))
+    diff["unmatched_station_lanes"] = unmatched_pt + unmatched_cs
+    return diff
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Build the routing graph from SUMO files")
+    parser.add_argument("--update", action="store_true",
+                        help="只依充電站文件更新既有的二進位快取 (不重建路網)")
+    parser.add_argument("--landmarks", type=int, default=16,
+                        help="預先計算的 travel_time 地標數 (ALT A* 用), 0 代表不建立")
+    args = parser.parse_args()
+
+    if args.update:
+        started = time.perf_counter()
+        diff = update_graph_cache(graph_cache_dir, power_track_file, charging_station_file, net_file)
+        for kind in ("power_track", "charging_station"):
+            print(f"{kind}: +{len(diff[kind]['added'])} -{len(diff[kind]['removed'])} "
+                  f"~{len(diff[kind]['changed'])}")
+        if diff['unmatched_station_lanes']:
+            print(f"Warning: {diff['unmatched_station_lanes']} charging station lanes not found in the network")
+        print(f"Updated {diff['changed_edges']} edges and {diff['changed_nodes']} nodes in "
+              f"{graph_cache_dir} ({time.perf_counter() - started:.2f}s)")
+        sys.exit(0)
+
+    G, G_largest_scc, stats = build_graph(net_file, power_track_file, charging_station_file)
+
+    # 輸出結果
+    print(f"Original Graph Nodes: {len(G.nodes)}")
+    print(f"Original Graph Edges: {len(G.edges)}")
+    print(f"Largest Strongly Connected Component Nodes: {len(G_largest_scc.nodes)}")
+    print(f"Largest Strongly Connected Component Edges: {len(G_largest_scc.edges)}")
+    print(f"Parsed {stats['edges_read']} edges in {stats['parse_seconds']:.2f}s "
+          f"({stats['edges_per_second']:.0f} edges/s), total build {stats['total_seconds']:.2f}s")
+    if stats['unmatched_station_lanes']:
+        print(f"Warning: {stats['unmatched_station_lanes']} charging station lanes not found in the network")
+    if stats['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {stats['peak_rss_mb']:.1f} MB")
+
+    # 保存結果為 GraphML 格式
+    nx.write_graphml(G_largest_scc, graphml_file)
+
+    # 同時輸出二進位快取, 記錄來源檔的雜湊以便之後檢查是否過期
+    source_files = [net_file, power_track_file, charging_station_file]
+    cg = compile_graph(G_largest_scc)
+    save_graph_cache(cg, graph_cache_dir, file_hash(source_files), source_files, file_hash([net_file]))
+    save_station_records(graph_cache_dir, stats["station_records"])
+    save_network_index(graph_cache_dir, *stats["network_index"])
+    print(f"Saved binary graph cache to {graph_cache_dir}")
+
+    # 地標表只取決於路網與 travel_time, --update 更新充電站時不需重建
+    if args.landmarks > 0:
+        started = time.perf_counter()
+        save_landmarks(build_landmarks(cg, args.landmarks), graph_cache_dir, cg)
+        print(f"Saved {args.landmarks} landmarks ({time.perf_counter() - started:.2f}s)")
+
+    # 檢查是否強連通
+    if nx.is_strongly_connected(G_largest_scc):
+        print("The graph is already strongly connected.")
+    else:
+        print("The graph is not strongly connected.")
+        components = list(nx.strongly_connected_components(G))
+        print(f"Strongly connected components: {components}")
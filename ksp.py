@@ -0,0 +1,169 @@
+import heapq
+import numpy as np
+from landmarks import alt_shortest_path
+
+
+class KShortestPaths:
+    """
+    CompiledGraph 上的 K 條最短簡單路徑 (Yen 演算法), 依成本遞增逐條產生.
+
+    - 候選路徑放在 heap 中, 以 (成本, 序號) 排序, 成本在產生候選時即算好
+    - 已見過的路徑以 tuple 放進 set 去重
+    - spur 搜尋以 banned 節點/邊集合遮蔽 (不修改圖); 已輸出的路徑存成 trie,
+      查詢某個 root path 的下一跳只需沿 trie 走一次
+    - 對終點的反向最短路徑樹 (reverse SPT) 只算一次: spur 點沿樹走到終點若沒碰到遮蔽
+      直接就是 spur path, 否則以樹上的距離作為 A* 的啟發值 (遮蔽只會讓距離變長, 啟發值仍可採納)
+    - 傳入 landmarks (landmarks.LandmarkTable) 時不建反向最短路徑樹, spur 搜尋改用 ALT A*,
+      省下每次查詢一次全圖 Dijkstra 的成本 (大圖上短距離查詢較快)
+    - Lawler 改良: 每條路徑只從它偏離父路徑的位置之後做 spur
+    """
+
+    def __init__(self, cg, source, target, weight="travel_time", landmarks=None):
+        self.cg = cg
+        self.source = source
+        self.target = target
+        self.weight = weight
+        self.landmarks = landmarks
+        self.offsets = cg.offsets.tolist()
+        self.targets = cg.targets.tolist()
+        self.weights = np.asarray(cg.edge_weight(weight), dtype=np.float64).tolist()
+        if landmarks is None:
+            self.dist_to_target, self.next_edge = self._reverse_tree()
+
+    def _reverse_tree(self):
+        """以反向 CSR 從終點做 Dijkstra, 回傳各節點到終點的距離與樹上的下一條邊"""
+        cg = self.cg
+        in_offsets, in_edges = cg.in_edges_csr()
+        in_offsets = in_offsets.tolist()
+        in_edges = in_edges.tolist()
+        sources = cg.sources.tolist()
+        w = self.weights
+
+        inf = float("inf")
+        dist = [inf] * cg.num_nodes
+        next_edge = [-1] * cg.num_nodes
+        dist[self.target] = 0.0
+        heap = [(0.0, self.target)]
+        while heap:
+            d, v = heapq.heappop(heap)
+            if d > dist[v]:
+                continue
+            for k in range(in_offsets[v], in_offsets[v + 1]):
+                e = in_edges[k]
+                u = sources[e]
+                nd = d + w[e]
+                if nd < dist[u]:
+                    dist[u] = nd
+                    next_edge[u] = e
+                    heapq.heappush(heap, (nd, u))
+        return dist, next_edge
+
+    def _spur_path(self, spur, banned_nodes, banned_edges):
+        """spur 點到終點、避開遮蔽節點與邊的最短路徑, 回傳 (成本, 路徑) 或 None"""
+        if self.landmarks is not None:
+            return alt_shortest_path(self.cg, spur, self.target, self.weight, self.landmarks,
+                                     banned_nodes, banned_edges)
+        h = self.dist_to_target
+        if h[spur] == float("inf"):
+            return None
+        target = self.target
+        targets, weights = self.targets, self.weights
+
+        # 沿反向最短路徑樹走, 沒碰到遮蔽就是答案
+        path = [spur]
+        u = spur
+        while u != target:
+            e = self.next_edge[u]
+            v = targets[e]
+            if e in banned_edges or v in banned_nodes:
+                break
+            path.append(v)
+            u = v
+        else:
+            return h[spur], path
+
+        # A* (啟發值 = 無遮蔽時到終點的距離)
+        offsets = self.offsets
+        g = {spur: 0.0}
+        prev = {}
+        done = set()
+        heap = [(h[spur], 0.0, spur)]
+        while heap:
+            _, d, u = heapq.heappop(heap)
+            if u in done:
+                continue
+            done.add(u)
+            if u == target:
+                path = [target]
+                while path[-1] != spur:
+                    path.append(prev[path[-1]])
+                path.reverse()
+                return d, path
+            for e in range(offsets[u], offsets[u + 1]):
+                if e in banned_edges:
+                    continue
+                v = targets[e]
+                if v in banned_nodes or v in done or h[v] == float("inf"):
+                    continue
+                nd = d + weights[e]
+                if nd < g.get(v, float("inf")):
+                    g[v] = nd
+                    prev[v] = u
+                    heapq.heappush(heap, (nd + h[v], nd, v))
+        return None
+
+    def _hop_cost(self, u, v):
+        # 有平行邊時取權重最小的一條 (與最短路徑搜尋的選擇一致)
+        return min(self.weights[e] for e in self.cg.edge_indices(u, v))
+
+    def __iter__(self):
+        """依成本遞增產生 (成本, 路徑), 路徑為整數節點 list"""
+        first = self._spur_path(self.source, set(), set())
+        if first is None:
+            return
+        cost, path = first
+
+        counter = 0
+        candidates = [(cost, counter, tuple(path), 0)]  # (成本, 序號, 路徑, 偏離位置)
+        seen = {tuple(path)}
+        trie = {}  # 已輸出路徑的前綴樹: 節點 -> 子樹
+
+        while candidates:
+            cost, _, path, deviation = heapq.heappop(candidates)
+            yield cost, list(path)
+
+            # 加入 trie, 同時記下每個前綴在 trie 中的位置
+            branches = []
+            node = trie
+            for u in path:
+                node = node.setdefault(u, {})
+                branches.append(node)
+
+            root_cost = sum(self._hop_cost(path[i], path[i + 1]) for i in range(deviation))
+            for i in range(deviation, len(path) - 1):
+                spur = path[i]
+                # 已輸出且 root path 相同的路徑, 其下一跳的所有平行邊都遮蔽
+                banned_edges = set()
+                for v in branches[i]:
+                    banned_edges.update(self.cg.edge_indices(spur, v))
+                banned_nodes = set(path[:i])
+
+                result = self._spur_path(spur, banned_nodes, banned_edges)
+                if result is not None:
+                    spur_cost, spur_path = result
+                    total_path = path[:i] + tuple(spur_path)
+                    if total_path not in seen:
+                        seen.add(total_path)
+                        counter += 1
+                        heapq.heappush(candidates, (root_cost + spur_cost, counter, total_path, i))
+                root_cost += self._hop_cost(path[i], path[i + 1])
+
+
+def k_shortest_paths(cg, source, target, K, weight="travel_time", landmarks=None):
+    """前 K 條最短簡單路徑 (整數節點 list), 依成本遞增排序"""
+    paths = []
+    for _, path in KShortestPaths(cg, source, target, weight, landmarks):
+        paths.append(path)
+        if len(paths) >= K:
+            break
+    return paths
@@ -0,0 +1,291 @@
+import os
+import json
+import heapq
+import argparse
+import time
+import numpy as np
+from compiled_graph import graph_signature
+
+
+# 地標表的格式版本, 陣列配置改變時要加一
+LANDMARK_CACHE_VERSION = 1
+
+
+def dijkstra_all(offsets, heads, weights, source):
+    """
+    單一起點到所有節點的最短距離. offsets/heads/weights 為對齊的 CSR list
+    (正向圖為出邊, 反向圖為入邊), 到不了的節點距離為 inf.
+    """
+    dist = [float("inf")] * (len(offsets) - 1)
+    dist[source] = 0.0
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in range(offsets[u], offsets[u + 1]):
+            v = heads[k]
+            nd = d + weights[k]
+            if nd < dist[v]:
+                dist[v] = nd
+                heapq.heappush(heap, (nd, v))
+    return dist
+
+
+def adjacency_lists(cg, weight="travel_time", reverse=False):
+    """dijkstra_all 使用的 (offsets, heads, weights) list; reverse=True 時為入邊 (往回搜尋)"""
+    w = np.asarray(cg.edge_weight(weight), dtype=np.float64)
+    if not reverse:
+        return cg.offsets.tolist(), cg.targets.tolist(), w.tolist()
+    in_offsets, in_edges = cg.in_edges_csr()
+    return in_offsets.tolist(), cg.sources[in_edges].tolist(), w[in_edges].tolist()
+
+
+class LandmarkTable:
+    """
+    ALT (A*, Landmarks, Triangle inequality) 的地標距離表.
+
+    - landmarks[i]:     第 i 個地標的節點 id
+    - dist_from[v, i]:  地標 i 到 v 的最短距離
+    - dist_to[v, i]:    v 到地標 i 的最短距離
+    由三角不等式, v 到 t 的距離至少為 max_i(dist_from[t,i] - dist_from[v,i], dist_to[v,i] - dist_to[t,i]),
+    這個下界是 consistent 的, 因此遮蔽部分節點/邊後仍可作為 A* 的啟發值.
+    """
+
+    def __init__(self, landmarks, dist_from, dist_to, weight="travel_time"):
+        self.landmarks = np.asarray(landmarks, dtype=np.int64)
+        self.dist_from = np.asarray(dist_from, dtype=np.float64)
+        self.dist_to = np.asarray(dist_to, dtype=np.float64)
+        self.weight = weight
+
+    @property
+    def num_landmarks(self):
+        return len(self.landmarks)
+
+    @staticmethod
+    def _bound(from_v, to_v, from_t, to_t):
+        # 兩邊都到不了地標時相減為 nan, 該地標不提供資訊
+        with np.errstate(invalid="ignore"):
+            bounds = np.concatenate((from_t - from_v, to_v - to_t), axis=-1)
+        return np.fmax(np.nan_to_num(bounds, nan=0.0, posinf=np.inf, neginf=-np.inf).max(axis=-1), 0.0)
+
+    def lower_bound(self, v, target):
+        """v 到 target 最短距離的下界"""
+        return float(self._bound(self.dist_from[v], self.dist_to[v], self.dist_from[target], self.dist_to[target]))
+
+    def lower_bounds_to(self, target):
+        """所有節點到 target 的距離下界 (長度 N 的陣列), 可作為 ACO / RCSP 的時間下界"""
+        return self._bound(self.dist_from, self.dist_to, self.dist_from[target], self.dist_to[target])
+
+    def heuristic(self, target):
+        """回傳到 target 的啟發函式 h(v), 每個節點只算一次"""
+        from_t, to_t = self.dist_from[target], self.dist_to[target]
+        cache = {}
+
+        def h(v):
+            value = cache.get(v)
+            if value is None:
+                value = cache[v] = float(self._bound(self.dist_from[v], self.dist_to[v], from_t, to_t))
+            return value
+        return h
+
+
+def build_landmarks(cg, count=16, weight="travel_time", seed=0):
+    """
+    以 farthest 策略選 count 個地標: 第一個為離隨機節點最遠者,
+    之後每次選 (去 + 回) 距離到已選地標最小值最大的節點. 每個地標做一次正向與一次反向 Dijkstra.
+    """
+    count = min(count, cg.num_nodes)
+    forward = adjacency_lists(cg, weight)
+    backward = adjacency_lists(cg, weight, reverse=True)
+
+    def finite(dist):
+        dist = np.asarray(dist)
+        return np.where(np.isfinite(dist), dist, -1.0)
+
+    rng = np.random.default_rng(seed)
+    start = int(rng.integers(cg.num_nodes))
+    current = int(np.argmax(finite(dijkstra_all(*forward, start))))
+
+    landmarks, dist_from, dist_to = [], [], []
+    separation = np.full(cg.num_nodes, np.inf)
+    while len(landmarks) < count:
+        landmarks.append(current)
+        dist_from.append(dijkstra_all(*forward, current))
+        dist_to.append(dijkstra_all(*backward, current))
+        round_trip = np.asarray(dist_from[-1]) + np.asarray(dist_to[-1])
+        separation = np.minimum(separation, np.where(np.isfinite(round_trip), round_trip, 0.0))
+        separation[landmarks] = -1.0
+        current = int(np.argmax(separation))
+
+    return LandmarkTable(landmarks, np.array(dist_from).T, np.array(dist_to).T, weight)
+
+
+def _landmark_dir(cache_dir, weight):
+    return os.path.join(cache_dir, "landmarks", weight)
+
+
+def save_landmarks(table, cache_dir, cg):
+    """
+    將地標表存到圖快取目錄下的 landmarks/<weight>/ (各陣列一個 .npy, meta.json 最後寫入),
+    並記錄圖的 graph_signature 以便載入時檢查.
+    """
+    directory = _landmark_dir(cache_dir, table.weight)
+    os.makedirs(directory, exist_ok=True)
+    meta_file = os.path.join(directory, "meta.json")
+    if os.path.exists(meta_file):
+        os.remove(meta_file)
+
+    np.save(os.path.join(directory, "landmarks.npy"), table.landmarks)
+    np.save(os.path.join(directory, "dist_from.npy"), np.ascontiguousarray(table.dist_from))
+    np.save(os.path.join(directory, "dist_to.npy"), np.ascontiguousarray(table.dist_to))
+
+    meta = {
+        "version": LANDMARK_CACHE_VERSION,
+        "weight": table.weight,
+        "num_nodes": cg.num_nodes,
+        "num_landmarks": table.num_landmarks,
+        "graph_signature": graph_signature(cg, table.weight),
+    }
+    with open(meta_file, "w") as f:
+        json.dump(meta, f, indent=2)
+
+
+def load_landmarks(cache_dir, cg, weight="travel_time", mmap=True):
+    """
+    讀取 save_landmarks 產生的地標表 (mmap 唯讀開啟).
+    不存在、格式版本不符或與 cg 的結構/權重不一致時 raise ValueError.
+    """
+    directory = _landmark_dir(cache_dir, weight)
+    meta_file = os.path.join(directory, "meta.json")
+    if not os.path.exists(meta_file):
+        raise ValueError(f"No {weight} landmark table in {cache_dir}")
+    with open(meta_file) as f:
+        meta = json.load(f)
+    if meta.get("version") != LANDMARK_CACHE_VERSION:
+        raise ValueError(
+            f"Landmark table {directory} has version {meta.get('version')}, expected {LANDMARK_CACHE_VERSION}"
+        )
+    if meta["num_nodes"] != cg.num_nodes or meta["graph_signature"] != graph_signature(cg, weight):
+        raise ValueError(f"Landmark table {directory} was built for a different graph")
+
+    mmap_mode = "r" if mmap else None
+    arrays = {name: np.load(os.path.join(directory, name + ".npy"), mmap_mode=mmap_mode)
+              for name in ("landmarks", "dist_from", "dist_to")}
+    return LandmarkTable(weight=weight, **arrays)
+
+
+def _reconstruct(prev, source, target):
+    path = [target]
+    while path[-1] != source:
+        path.append(prev[path[-1]])
+    path.reverse()
+    return path
+
+
+def alt_shortest_path(cg, source, target, weight="travel_time", landmarks=None,
+                      banned_nodes=None, banned_edges=None):
+    """
+    A* 最短路徑, 啟發值為地標下界 (landmarks 為 None 時退化為 Dijkstra).
+    banned_nodes / banned_edges: 搜尋時視為不存在的節點與 edge index.
+    回傳 (成本, 整數節點路徑), 找不到則回傳 None.
+    """
+    h = landmarks.heuristic(target) if landmarks is not None else (lambda v: 0.0)
+    w = cg.edge_weight(weight)
+    offsets, targets = cg.offsets, cg.targets
+    banned_nodes = banned_nodes or ()
+    banned_edges = banned_edges or ()
+
+    g = {source: 0.0}
+    prev = {}
+    done = set()
+    heap = [(h(source), 0.0, source)]
+    while heap:
+        _, d, u = heapq.heappop(heap)
+        if u in done:
+            continue
+        done.add(u)
+        if u == target:
+            return d, _reconstruct(prev, source, target)
+        for e in range(offsets[u], offsets[u + 1]):
+            if e in banned_edges:
+                continue
+            v = int(targets[e])
+            if v in done or v in banned_nodes:
+                continue
+            nd = d + w[e]
+            if nd < g.get(v, float("inf")):
+                estimate = h(v)
+                if estimate == float("inf"):
+                    continue
+                g[v] = nd
+                prev[v] = u
+                heapq.heappush(heap, (nd + estimate, nd, v))
+    return None
+
+
+def bidirectional_dijkstra(cg, source, target, weight="travel_time", banned_edges=None):
+    """
+    雙向 Dijkstra: 起點往前、終點沿入邊往回同時搜尋, 兩邊已定距離的和超過目前最佳值時停止.
+    回傳 (成本, 整數節點路徑), 找不到則回傳 None.
+    """
+    if source == target:
+        return 0.0, [source]
+    w = cg.edge_weight(weight)
+    in_offsets, in_edges = cg.in_edges_csr()
+    banned_edges = banned_edges or ()
+
+    # 0: 正向 (出邊), 1: 反向 (入邊)
+    dist = ({source: 0.0}, {target: 0.0})
+    prev = ({}, {})
+    done = (set(), set())
+    heaps = ([(0.0, source)], [(0.0, target)])
+    best, meet = float("inf"), None
+
+    while heaps[0] and heaps[1]:
+        if heaps[0][0][0] + heaps[1][0][0] >= best:
+            break
+        side = 0 if heaps[0][0][0] <= heaps[1][0][0] else 1
+        d, u = heapq.heappop(heaps[side])
+        if u in done[side]:
+            continue
+        done[side].add(u)
+        if side == 0:
+            edges = ((e, int(cg.targets[e])) for e in range(cg.offsets[u], cg.offsets[u + 1]))
+        else:
+            edges = ((int(e), int(cg.sources[e])) for e in in_edges[in_offsets[u]:in_offsets[u + 1]])
+        for e, v in edges:
+            if e in banned_edges:
+                continue
+            nd = d + w[e]
+            if nd < dist[side].get(v, float("inf")):
+                dist[side][v] = nd
+                prev[side][v] = u
+                heapq.heappush(heaps[side], (nd, v))
+            other = dist[1 - side].get(v)
+            if other is not None and nd + other < best:
+                best, meet = nd + other, v
+
+    if meet is None:
+        return None
+    forward = _reconstruct(prev[0], source, meet)
+    backward = _reconstruct(prev[1], target, meet)
+    return best, forward + backward[::-1][1:]
+
+
+if __name__ == "__main__":
+    from routing import load_graph
+
+    parser = argparse.ArgumentParser(description="Precompute ALT landmark tables for a binary graph cache")
+    parser.add_argument("--graph", default="Taiwan.graph", help="directed_graph.py 輸出的二進位快取目錄")
+    parser.add_argument("--count", type=int, default=16, help="地標數")
+    parser.add_argument("--weight", default="travel_time")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    cg = load_graph(args.graph)  # 與來源檔雜湊比對, 過期的快取不建地標表
+    started = time.perf_counter()
+    table = build_landmarks(cg, args.count, args.weight, args.seed)
+    save_landmarks(table, args.graph, cg)
+    print(f"Saved {table.num_landmarks} {args.weight} landmarks to {args.graph} "
+          f"({time.perf_counter() - started:.2f}s)")
@@ -1,151 +1,612 @@
-from gurobipy import Model, GRB, quicksum
-
-def milp_path_charging_gurobi(G,
-                              start_node,
-                              end_node,
-                              initial_soc_percent=50,
-                              target_soc_percent=90,
-                              battery_kwh=60.0,          # 60kWh
-                              driving_cost_rate=0.3,     # usd/kWh (行駛電費)
-                              charging_power=80,         # kW
-                              charging_cost_rate=0.3,    # usd/kWh (充電站電價)
-                              energy_consumption_per_m=0.2 # Wh/m  => 0.2Wh/m
-                             ):
+import time
+import heapq
+import numpy as np
+import pulp
+from landmarks import dijkstra_all, adjacency_lists
+from ksp import KShortestPaths
+
+try:
+    import gurobipy
+except ImportError:  # 沒有 Gurobi 授權的機器改用 PuLP (CBC / HiGHS)
+    gurobipy = None
+
+
+#############################
+# 走廊 (corridor): 只把起訖點附近的子圖放進模型
+#############################
+
+def ellipse_corridor(CG, source, target, slack=0.2, weight="travel_time"):
     """
-    在 NetworkX 圖 G 上，用Gurobi決定:
-      1) 哪些邊(路徑)要走
-      2) 每個節點的SOC (kWh)
-      3) 在充電站充多少電 (kWh)
+    旅行時間橢圓: d(source, v) + d(v, target) <= (1 + slack) * d(source, target) 的節點 mask.
+    只需一次正向與一次反向 Dijkstra; 最佳路徑若比最短路徑貴不到 slack 倍, 一定落在橢圓內.
+    """
+    from_source = np.asarray(dijkstra_all(*adjacency_lists(CG, weight), source))
+    to_target = np.asarray(dijkstra_all(*adjacency_lists(CG, weight, reverse=True), target))
+    return from_source + to_target <= (1 + slack) * from_source[target]
 
-    輸出:
-      - "status": Optimal / Infeasible / ...
-      - "total_cost": 總成本
-      - "edges_used": 哪些邊被選擇(路徑)
-      - "soc": 每個節點的SOC
-      - "charge": 每個節點充電量
+
+def ksp_corridor(CG, source, target, K=20, weight="travel_time", landmarks=None):
+    """前 K 條最短路徑經過的節點聯集 (mask)"""
+    mask = np.zeros(CG.num_nodes, dtype=bool)
+    for k, (_, path) in enumerate(KShortestPaths(CG, source, target, weight, landmarks)):
+        if k >= K:
+            break
+        mask[path] = True
+    return mask
+
+
+def corridor_edges(CG, node_mask=None):
+    """兩端點都在 node_mask 內的 edge index (node_mask 為 None 時為全圖)"""
+    if node_mask is None:
+        return np.arange(CG.num_edges)
+    node_mask = np.asarray(node_mask, dtype=bool)
+    return np.nonzero(node_mask[CG.sources] & node_mask[CG.targets])[0]
+
+
+#############################
+# 與求解器無關的模型資料
+#############################
+
+class PathChargingModel:
     """
+    路徑 + 充電 MILP 的係數 (不依賴任何求解器), 由各 backend 轉成自己的模型:
 
-    # 將百分比轉成 kWh
-    initial_soc_kwh = battery_kwh * (initial_soc_percent / 100.0)
-    target_soc_kwh = battery_kwh * (target_soc_percent / 100.0)
-
-    # 準備所有 "有邊"(u,v) 的集合 edges
-    edges = []
-    for (u, v) in G.edges():
-        edges.append((u, v))
-        if not G.is_directed():
-            edges.append((v, u))
-    edges = list(set(edges))  # 移除重複邊
-
-    # 建立一個 dict 用來存 "行駛耗電(kWh)" & "行駛電費"
-    edge_data = {}
-    for (u, v) in edges:
-        dist_m = G[u][v].get('length', 1.0)  # 預設1.0, 避免沒填
-        wh = dist_m * energy_consumption_per_m  # (Wh)
-        kwh = wh / 1000.0
-        cost = kwh * driving_cost_rate
-        edge_data[(u, v)] = {
-            'drive_kwh': kwh,
-            'drive_cost': cost
-        }
-
-    # 建立 Gurobi 模型
-    model = Model("Path_Charging")
+      min  sum_k drive_cost[k] * x[k] + charging_cost_rate * sum_u charge[u]
+      s.t. 起點流出 1、終點流入 1、其他節點流量守恆
+           soc[v] <= soc[u] - drive_kwh[k] + charge[v] + BigM * (1 - x[k])   (邊 k = u -> v)
+           soc[u] >= drive_kwh[k] * x[k]   (抵達下一個節點、充電之前電量不可為負)
+           soc[start] == initial, soc[end] >= target, 0 <= soc <= battery, 非充電站 charge = 0
 
-    # 1) 決策變數
-    # x_{u,v}: 是否選擇邊 (u, v)
-    x = model.addVars(edges, vtype=GRB.BINARY, name="x")
+    k 為模型中的邊序號 (對應 CompiledGraph 的 edge index edges[k]), 節點為整數 id.
+    流量約束以出/入邊的鄰接 list 建立 (每條邊只出現在兩條約束中), 建模為 O(V + E).
+    """
+
+    def __init__(self, CG, start_node, end_node, initial_soc_percent=50, target_soc_percent=90,
+                 battery_kwh=60.0, driving_cost_rate=0.3, charging_cost_rate=0.3,
+                 energy_consumption_per_m=0.2, corridor=None):
+        self.CG = CG
+        self.start = CG.node_index[start_node]
+        self.end = CG.node_index[end_node]
+        self.battery_kwh = battery_kwh
+        self.driving_cost_rate = driving_cost_rate
+        self.charging_cost_rate = charging_cost_rate
+        # 將百分比轉成 kWh
+        self.initial_soc_kwh = battery_kwh * (initial_soc_percent / 100.0)
+        self.target_soc_kwh = battery_kwh * (target_soc_percent / 100.0)
+        self.big_m = battery_kwh + 100
+
+        self.edges = corridor_edges(CG, corridor)
+        if corridor is None:
+            nodes = np.arange(CG.num_nodes)
+        else:
+            nodes = np.nonzero(corridor)[0]
+            if not (corridor[self.start] and corridor[self.end]):
+                raise ValueError("start_node and end_node must be inside the corridor")
+        self.nodes = nodes.tolist()
+        self.sources = CG.sources[self.edges].tolist()
+        self.targets = CG.targets[self.edges].tolist()
+        self.is_station = {u: bool(CG.station_mask[u]) for u in self.nodes}
+
+        # 每條邊的 "行駛耗電(kWh)" & "行駛電費"
+        self.drive_kwh = (CG.length[self.edges] * energy_consumption_per_m / 1000.0).tolist()
+        self.drive_cost = [kwh * driving_cost_rate for kwh in self.drive_kwh]
 
-    # soc[u]: 抵達節點 u 的電量
-    soc = model.addVars(G.nodes(), lb=0, ub=battery_kwh, vtype=GRB.CONTINUOUS, name="soc")
+        # 鄰接 list, 取代對每個節點掃描全部邊
+        self.out_edges = {u: [] for u in self.nodes}
+        self.in_edges = {u: [] for u in self.nodes}
+        for k, (u, v) in enumerate(zip(self.sources, self.targets)):
+            self.out_edges[u].append(k)
+            self.in_edges[v].append(k)
 
-    # charge[u]: 在節點 u 充電量
-    charge = model.addVars(G.nodes(), lb=0, vtype=GRB.CONTINUOUS, name="charge")
+    @property
+    def num_edges(self):
+        return len(self.edges)
 
-    # 限制非充電站充電量為 0
-    for u in G.nodes():
-        if not G.nodes[u].get('is_charging_station', False):
-            charge[u].ub = 0
+    def flow_rhs(self, u):
+        """節點 u 的 (流出 - 流入)"""
+        if u == self.start:
+            return 1
+        if u == self.end:
+            return -1
+        return 0
+
+    def warm_start(self, path):
+        """
+        由啟發式路徑 (節點名稱 list, 例如 ACO 的 best_path) 建立初始解 (x, soc, charge).
+        路徑先去掉迴圈 (模型中每個節點只有一個 SOC), 平行邊取耗電最少的一條;
+        充電站依 "補足到走完剩餘路段並達到目標電量所需, 不超過電池容量" 的方式充電.
+        路徑走出模型範圍或仍不可行時回傳 None.
+        """
+        index_path = []
+        for node in (self.CG.node_index[name] for name in path):
+            if node in index_path:
+                del index_path[index_path.index(node) + 1:]
+            else:
+                index_path.append(node)
+        if not index_path or index_path[0] != self.start or index_path[-1] != self.end:
+            return None
+
+        edge_position = {}
+        for k, (u, v) in enumerate(zip(self.sources, self.targets)):
+            if (u, v) not in edge_position or self.drive_kwh[k] < self.drive_kwh[edge_position[u, v]]:
+                edge_position[u, v] = k
+        ks = [edge_position.get(hop) for hop in zip(index_path[:-1], index_path[1:])]
+        if None in ks:
+            return None
+
+        remaining = sum(self.drive_kwh[k] for k in ks)
+        x = {k: 1.0 for k in ks}
+        soc = {self.start: self.initial_soc_kwh}
+        charge = {}
+        level = self.initial_soc_kwh
+        for k, v in zip(ks, index_path[1:]):
+            level -= self.drive_kwh[k]
+            remaining -= self.drive_kwh[k]
+            if level < 0:
+                return None
+            if self.is_station[v]:
+                charge[v] = max(0.0, min(self.battery_kwh - level, remaining + self.target_soc_kwh - level))
+                level += charge[v]
+            soc[v] = level
+        if level < self.target_soc_kwh - 1e-9:
+            return None
+        return x, soc, charge
+
+
+#############################
+# 求解器 backend: 各自回傳 (status, objective, x, soc, charge)
+# status 為 "Optimal" / "Feasible" (時限或 gap 內的可行解) / "Infeasible" / "Unbounded" / "NotSolved"
+#############################
+
+_pulp_status = {
+    pulp.LpSolutionOptimal: "Optimal",
+    pulp.LpSolutionIntegerFeasible: "Feasible",
+    pulp.LpSolutionInfeasible: "Infeasible",
+    pulp.LpSolutionUnbounded: "Unbounded",
+    pulp.LpSolutionNoSolutionFound: "NotSolved",
+}
+
+
+def _pulp_solver(name, time_limit, mip_gap, warm, verbose):
+    options = dict(msg=verbose, timeLimit=time_limit, gapRel=mip_gap, warmStart=warm)
+    if name == "cbc":
+        return pulp.PULP_CBC_CMD(**options)
+    if name == "highs":
+        for solver in (pulp.HiGHS(**options), pulp.HiGHS_CMD(**options)):
+            if solver.available():
+                return solver
+        raise ValueError("HiGHS is not available (install highspy or the highs executable)")
+    raise ValueError(f"Unknown PuLP solver: {name}")
+
+
+def solve_with_pulp(model, solver="cbc", time_limit=None, mip_gap=None, start=None, verbose=False):
+    """以 PuLP 建模, 交給 CBC 或 HiGHS 求解"""
+    prob = pulp.LpProblem("Path_Charging", pulp.LpMinimize)
+
+    # 1) 決策變數
+    x = [pulp.LpVariable(f"x_{k}", cat=pulp.LpBinary) for k in range(model.num_edges)]
+    soc = {u: pulp.LpVariable(f"soc_{u}", lowBound=0, upBound=model.battery_kwh) for u in model.nodes}
+    charge = {u: pulp.LpVariable(f"charge_{u}", lowBound=0, upBound=None if model.is_station[u] else 0)
+              for u in model.nodes}
 
     # 2) 目標函式: 行駛電費 + 充電電費
-    driving_cost = quicksum(edge_data[(u, v)]['drive_cost'] * x[u, v] for u, v in edges)
-    charging_cost = quicksum(charging_cost_rate * charge[u] for u in G.nodes())
-    model.setObjective(driving_cost + charging_cost, GRB.MINIMIZE)
+    prob += pulp.LpAffineExpression(
+        [(x[k], model.drive_cost[k]) for k in range(model.num_edges)]
+        + [(charge[u], model.charging_cost_rate) for u in model.nodes if model.is_station[u]]
+    )
 
     # 3) 約束條件
-    # 3.1 流量/路徑約束
-    for u in G.nodes():
-        in_edges = [(i, j) for (i, j) in edges if j == u]
-        out_edges = [(i, j) for (i, j) in edges if i == u]
-
-        if u == start_node:
-            model.addConstr(quicksum(x[e] for e in out_edges) == 1)
-            model.addConstr(quicksum(x[e] for e in in_edges) == 0)
-        elif u == end_node:
-            model.addConstr(quicksum(x[e] for e in out_edges) == 0)
-            model.addConstr(quicksum(x[e] for e in in_edges) == 1)
-        else:
-            model.addConstr(quicksum(x[e] for e in out_edges) == quicksum(x[e] for e in in_edges))
+    for u in model.nodes:
+        flow = pulp.LpAffineExpression(
+            [(x[k], 1) for k in model.out_edges[u]] + [(x[k], -1) for k in model.in_edges[u]]
+        )
+        prob += flow == model.flow_rhs(u)
+        if u == model.start:
+            prob += pulp.lpSum(x[k] for k in model.in_edges[u]) == 0
+        elif u == model.end:
+            prob += pulp.lpSum(x[k] for k in model.out_edges[u]) == 0
+    M = model.big_m
+    for k, (u, v) in enumerate(zip(model.sources, model.targets)):
+        prob += soc[v] - soc[u] - charge[v] + M * x[k] <= M - model.drive_kwh[k]
+        prob += soc[u] - model.drive_kwh[k] * x[k] >= 0
+    prob += soc[model.start] == model.initial_soc_kwh
+    prob += soc[model.end] >= model.target_soc_kwh
+
+    if start is not None:
+        start_x, start_soc, start_charge = start
+        for k, var in enumerate(x):
+            var.setInitialValue(start_x.get(k, 0.0))
+        for u in model.nodes:
+            soc[u].setInitialValue(start_soc.get(u, 0.0))
+            charge[u].setInitialValue(start_charge.get(u, 0.0))
+
+    # 4. 求解
+    prob.solve(_pulp_solver(solver, time_limit, mip_gap, start is not None, verbose))
+    status = _pulp_status.get(prob.sol_status, "NotSolved")
+    if status == "NotSolved" and prob.status == pulp.LpStatusInfeasible:
+        status = "Infeasible"
+    if status not in ("Optimal", "Feasible"):
+        return status, None, None, None, None
+    return (
+        status,
+        pulp.value(prob.objective),
+        [var.varValue or 0.0 for var in x],
+        {u: soc[u].varValue for u in model.nodes},
+        {u: charge[u].varValue for u in model.nodes},
+    )
 
-    # 3.2 SOC 遞推
-    BigM = battery_kwh + 100
-    for (u, v) in edges:
-        drive_kwh = edge_data[(u, v)]['drive_kwh']
-        model.addConstr(soc[v] >= soc[u] - drive_kwh + charge[v] - BigM * (1 - x[u, v]))
 
-    # 3.3 初始 SOC
-    model.addConstr(soc[start_node] == initial_soc_kwh)
+def solve_with_gurobi(model, time_limit=None, mip_gap=None, start=None, verbose=False):
+    """以 gurobipy 建模求解 (需要 Gurobi 授權)"""
+    if gurobipy is None:
+        raise ValueError("gurobipy is not installed; use backend='cbc' or 'highs'")
+    GRB, quicksum = gurobipy.GRB, gurobipy.quicksum
 
-    # 3.4 終點 SOC
-    model.addConstr(soc[end_node] >= target_soc_kwh)
+    m = gurobipy.Model("Path_Charging")
+    m.Params.OutputFlag = 1 if verbose else 0
+    if time_limit is not None:
+        m.Params.TimeLimit = time_limit
+    if mip_gap is not None:
+        m.Params.MIPGap = mip_gap
+
+    # 1) 決策變數
+    x = m.addVars(model.num_edges, vtype=GRB.BINARY, name="x")
+    soc = m.addVars(model.nodes, lb=0, ub=model.battery_kwh, vtype=GRB.CONTINUOUS, name="soc")
+    charge_ub = [GRB.INFINITY if model.is_station[u] else 0.0 for u in model.nodes]
+    charge = m.addVars(model.nodes, lb=0, ub=charge_ub, vtype=GRB.CONTINUOUS, name="charge")
+
+    # 2) 目標函式: 行駛電費 + 充電電費
+    m.setObjective(
+        quicksum(model.drive_cost[k] * x[k] for k in range(model.num_edges))
+        + quicksum(model.charging_cost_rate * charge[u] for u in model.nodes),
+        GRB.MINIMIZE,
+    )
+
+    # 3) 約束條件
+    for u in model.nodes:
+        m.addConstr(quicksum(x[k] for k in model.out_edges[u]) - quicksum(x[k] for k in model.in_edges[u])
+                    == model.flow_rhs(u))
+        if u == model.start:
+            m.addConstr(quicksum(x[k] for k in model.in_edges[u]) == 0)
+        elif u == model.end:
+            m.addConstr(quicksum(x[k] for k in model.out_edges[u]) == 0)
+    M = model.big_m
+    for k, (u, v) in enumerate(zip(model.sources, model.targets)):
+        m.addConstr(soc[v] <= soc[u] - model.drive_kwh[k] + charge[v] + M * (1 - x[k]))
+        m.addConstr(soc[u] >= model.drive_kwh[k] * x[k])
+    m.addConstr(soc[model.start] == model.initial_soc_kwh)
+    m.addConstr(soc[model.end] >= model.target_soc_kwh)
+
+    if start is not None:
+        start_x, start_soc, start_charge = start
+        for k in range(model.num_edges):
+            x[k].Start = start_x.get(k, 0.0)
+        for u in model.nodes:
+            soc[u].Start = start_soc.get(u, 0.0)
+            charge[u].Start = start_charge.get(u, 0.0)
 
     # 4. 求解
-    model.optimize()
+    m.optimize()
+    if m.SolCount == 0:
+        status = {GRB.INFEASIBLE: "Infeasible", GRB.UNBOUNDED: "Unbounded"}.get(m.status, "NotSolved")
+        return status, None, None, None, None
+    status = "Optimal" if m.status == GRB.OPTIMAL else "Feasible"
+    return (
+        status,
+        m.ObjVal,
+        [x[k].X for k in range(model.num_edges)],
+        {u: soc[u].X for u in model.nodes},
+        {u: charge[u].X for u in model.nodes},
+    )
+
+
+#############################
+# 分解法: 充電停靠點上的主問題 + 道路圖上的最短路徑定價子問題
+#############################
+
+def _bounded_dijkstra(model, source, reverse=False, limit=float("inf")):
+    """模型子圖上以 drive_kwh 為權重的 Dijkstra, 只展開到 limit 為止; 回傳 (距離, 前一條邊)"""
+    adjacency = model.in_edges if reverse else model.out_edges
+    heads = model.sources if reverse else model.targets
+    dist = {source: 0.0}
+    prev = {}
+    heap = [(0.0, source)]
+    while heap:
+        d, u = heapq.heappop(heap)
+        if d > dist[u]:
+            continue
+        for k in adjacency[u]:
+            v = heads[k]
+            nd = d + model.drive_kwh[k]
+            if nd <= limit and nd < dist.get(v, float("inf")):
+                dist[v] = nd
+                prev[v] = k
+                heapq.heappush(heap, (nd, v))
+    return dist, prev
+
+
+def solve_with_decomposition(model, time_limit=None, mip_gap=None, start=None, verbose=False, callback=None,
+                             fallback="cbc"):
+    """
+    分解法求解 PathChargingModel.
+
+    模型中充電站電價固定、行駛電費與耗電成正比, 因此給定總耗電 D 時最少充電量為
+    max(0, target - initial + D), 總成本 f(D) = driving_cost_rate * D + charging_cost_rate * 充電量
+    只隨 D 遞增; 路徑可行的條件只剩 "相鄰兩個停靠點 (起點/充電站/終點) 之間的耗電不超過可用電量"
+    (起點出發為 initial, 充電站出發最多充滿到 battery, 抵達非充電站的終點還要留 target).
+    於是問題分成:
+      - 主問題: 停靠點序列上的最短路徑 (A*, 啟發值為到終點的最少耗電), 決定在哪些充電站停
+      - 定價子問題: 從一個停靠點在道路圖上做有上限的 Dijkstra, 產生到其他停靠點的路段 (column)
+    每回合展開一個停靠點 (一次定價), 下界 = f(目前最小的 D + 啟發值), 上界 = 已找到的最佳可行解;
+    兩者相遇即為最佳解. 不需要 big-M, 也沒有分支定界.
+
+    注意: 不同路段可能經過同一個路口 (或同一條邊); MILP 每條邊最多走一次、每個節點只有一個 SOC 變數,
+    不允許這種情況, 此時分解法的解只是 MILP 的下界而不是可行解. 遇到時改以 fallback
+    ("cbc" / "highs", 交給 solve_with_pulp, 使用剩下的時間) 求解; fallback 為 None 時回傳 "NotSolved".
+    callback(iteration, lower_bound, upper_bound) 每回合呼叫一次.
+    """
+    started = time.monotonic()
+    B, I, T = model.battery_kwh, model.initial_soc_kwh, model.target_soc_kwh
+    s, t = model.start, model.end
+    end_is_station = model.is_station[t]
+
+    def total_cost(D):
+        return model.driving_cost_rate * D + model.charging_cost_rate * max(0.0, T - I + D)
+
+    def capacity(u):
+        return I if u == s else B
+
+    def reserve(v):
+        return T if v == t and not end_is_station else 0.0
+
+    stops = {u for u in model.nodes if model.is_station[u] and u != s} | {t}
+    to_end, _ = _bounded_dijkstra(model, t, reverse=True)
+    if s not in to_end:
+        return "Infeasible", None, None, None, None
+
+    # 暖啟動解作為初始上界
+    upper = float("inf")
+    if start is not None:
+        start_x, _, start_charge = start
+        upper = sum(model.drive_cost[k] for k in start_x) + model.charging_cost_rate * sum(start_charge.values())
+
+    best = {s: 0.0}          # 主問題: 各停靠點目前最少的累積耗電
+    parent = {}              # 停靠點 -> (前一個停靠點, 該路段的 prev 表)
+    settled = set()
+    heap = [(to_end[s], 0.0, s)]
+    lower = total_cost(to_end[s])
+    iteration = 0
+
+    def gap_closed():
+        return upper < float("inf") and (upper - lower) <= (mip_gap or 0.0) * max(abs(upper), 1e-9) + 1e-9
+
+    while heap and not gap_closed():
+        key, D, u = heapq.heappop(heap)
+        if u in settled or D > best[u]:
+            continue
+        settled.add(u)
+        lower = max(lower, min(total_cost(key), upper))
+        if u == t:
+            break
+
+        # 定價: 從 u 出發可行的所有路段
+        dist, prev = _bounded_dijkstra(model, u, limit=capacity(u))
+        for v, leg in dist.items():
+            if v not in stops or v in settled or leg + reserve(v) > capacity(u):
+                continue
+            nd = D + leg
+            if nd < best.get(v, float("inf")) and v in to_end:
+                best[v] = nd
+                parent[v] = (u, prev)
+                heapq.heappush(heap, (nd + to_end[v], nd, v))
+                if v == t:
+                    upper = min(upper, total_cost(nd))
+
+        iteration += 1
+        if heap:
+            lower = max(lower, min(total_cost(heap[0][0]), upper))
+        if verbose:
+            print(f"iteration {iteration}: lower bound {lower:.6f}, upper bound {upper:.6f}")
+        if callback is not None:
+            callback(iteration, lower, upper)
+        if time_limit is not None and time.monotonic() - started >= time_limit:
+            break
+
+    if t not in parent or total_cost(best[t]) > upper + 1e-12:
+        if start is None:
+            return "Infeasible" if not heap else "NotSolved", None, None, None, None
+        # 沒有找到比暖啟動更好的解
+        start_x, start_soc, start_charge = start
+        x_values = [start_x.get(k, 0.0) for k in range(model.num_edges)]
+        status = "Optimal" if gap_closed() else "Feasible"
+        return status, upper, x_values, start_soc, start_charge
+
+    # 還原路段: 停靠點序列與每段的道路邊
+    legs = []
+    v = t
+    while v != s:
+        u, prev = parent[v]
+        ks = []
+        w = v
+        while w != u:
+            ks.append(prev[w])
+            w = model.sources[prev[w]]
+        legs.append((u, ks[::-1]))
+        v = u
+    legs.reverse()
 
-    if model.status != GRB.OPTIMAL:
-        print("No Optimal Solution, status =", model.status)
-        return model.status, None, None, None, None
+    # 整條路線重複經過同一個節點時不是 MILP 的可行解 (x 會大於 1, 同一節點有兩個 SOC)
+    route = [s] + [model.targets[k] for _, ks in legs for k in ks]
+    if len(set(route)) < len(route):
+        if verbose:
+            print("Decomposition route revisits a node; falling back to", fallback)
+        if fallback is None:
+            return "NotSolved", None, None, None, None
+        remaining = None if time_limit is None else max(time_limit - (time.monotonic() - started), 1.0)
+        return solve_with_pulp(model, fallback, remaining, mip_gap, start, verbose)
 
-    total_cost = model.objVal
-    edges_used = [(u, v) for u, v in edges if x[u, v].x > 0.5]
-    soc_values = {u: soc[u].x for u in G.nodes()}
-    charge_values = {u: charge[u].x for u in G.nodes()}
+    # 依需要充電: 每個停靠點只充到足以走完下一段 (最後一段還要留 target)
+    x_values = [0.0] * model.num_edges
+    soc, charge = {s: I}, {}
+    level = I
+    for i, (u, ks) in enumerate(legs):
+        if u != s:
+            need = sum(model.drive_kwh[k] for k in ks) + (reserve(t) if i == len(legs) - 1 else 0.0)
+            charge[u] = max(0.0, need - level)
+            level += charge[u]
+            soc[u] = level
+        for k in ks:
+            x_values[k] = 1.0
+            level -= model.drive_kwh[k]
+            soc[model.targets[k]] = level
+    if end_is_station:
+        charge[t] = max(0.0, T - level)
+        soc[t] = level + charge[t]
 
-    return model.status, total_cost, edges_used, soc_values, charge_values
+    objective = sum(model.drive_cost[k] * x for k, x in enumerate(x_values)) + model.charging_cost_rate * sum(charge.values())
+    upper = min(upper, objective)
+    status = "Optimal" if gap_closed() or not heap or t in settled else "Feasible"
+    return status, objective, x_values, soc, charge
+
+
+def solve_path_charging(CG,
+                        start_node,
+                        end_node,
+                        initial_soc_percent=50,
+                        target_soc_percent=90,
+                        battery_kwh=60.0,          # 60kWh
+                        driving_cost_rate=0.3,     # usd/kWh (行駛電費)
+                        charging_power=80,         # kW, 未使用 (見下方說明)
+                        charging_cost_rate=0.3,    # usd/kWh (充電站電價)
+                        energy_consumption_per_m=0.2, # Wh/m  => 0.2Wh/m
+                        corridor=None,
+                        backend="cbc",
+                        time_limit=None,
+                        mip_gap=None,
+                        warm_start_path=None,
+                        verbose=False):
+    """
+    在 CompiledGraph 上決定:
+      1) 哪些邊(路徑)要走
+      2) 每個節點的SOC (kWh)
+      3) 在充電站充多少電 (kWh)
+
+    corridor:        節點 mask (ellipse_corridor / ksp_corridor), 只以其中的節點與邊建模; None 代表全圖
+    backend:         "cbc" / "highs" (PuLP)、"gurobi", 或 "decomposition" (solve_with_decomposition, 不需 MILP 求解器)
+    time_limit:      求解時間上限 (秒); 時限內只找到可行解時 status 為 "Feasible"
+    mip_gap:         相對 MIP gap, 達到即停止
+    warm_start_path: 啟發式路徑 (節點名稱, 例如 ACO 的 best_path) 作為初始解;
+                     有 corridor 時路徑上的節點會一併加入
+    charging_power:  保留給原本的呼叫介面, 目前沒有作用 (模型不限制充電功率與停留時間,
+                     充電量只受電池容量限制)
+
+    輸出:
+      - "status": Optimal / Feasible / Infeasible / ...
+      - "total_cost": 總成本
+      - "edges_used": 哪些邊被選擇(路徑), 以節點名稱表示
+      - "soc": 每個節點的SOC
+      - "charge": 每個節點充電量
+    """
+    if corridor is not None and warm_start_path is not None:
+        corridor = np.array(corridor, dtype=bool)
+        corridor[CG.to_index_path(warm_start_path)] = True
+
+    model = PathChargingModel(CG, start_node, end_node, initial_soc_percent, target_soc_percent,
+                              battery_kwh, driving_cost_rate, charging_cost_rate,
+                              energy_consumption_per_m, corridor)
+    start = model.warm_start(warm_start_path) if warm_start_path is not None else None
+
+    if backend == "gurobi":
+        result = solve_with_gurobi(model, time_limit, mip_gap, start, verbose)
+    elif backend == "decomposition":
+        result = solve_with_decomposition(model, time_limit, mip_gap, start, verbose)
+    else:
+        result = solve_with_pulp(model, backend, time_limit, mip_gap, start, verbose)
+
+    status, total_cost, x_values, soc, charge = result
+    if total_cost is None:
+        print("No solution found, status =", status)
+        return status, None, None, None, None
+
+    edges_used = [(CG.node_ids[model.sources[k]], CG.node_ids[model.targets[k]])
+                  for k, value in enumerate(x_values) if value > 0.5]
+    soc_values = {CG.node_ids[u]: value for u, value in soc.items()}
+    charge_values = {CG.node_ids[u]: value for u, value in charge.items()}
+    return status, total_cost, edges_used, soc_values, charge_values
+
+
+def milp_path_charging_gurobi(CG, start_node, end_node, **kwargs):
+    """原本的 Gurobi 版本介面, 等同 solve_path_charging(..., backend="gurobi")"""
+    return solve_path_charging(CG, start_node, end_node, backend="gurobi", **kwargs)
 
 
 # 使用範例
 if __name__ == "__main__":
-    import networkx as nx
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Path + charging MILP")
+    parser.add_argument("--graph", default=None,
+                        help="二進位圖快取目錄或 GraphML 檔 (預設 Taiwan.graph, 不存在時用 Taiwan.graphml)")
+    parser.add_argument("--backend", choices=["cbc", "highs", "gurobi", "decomposition"], default="cbc")
+    parser.add_argument("--time-limit", type=float, default=None, help="求解時間上限 (秒)")
+    parser.add_argument("--mip-gap", type=float, default=None, help="相對 MIP gap")
+    parser.add_argument("--warm-start-aco", action="store_true", help="先跑一次 ACO, 以其最佳路徑作為初始解")
+    parser.add_argument("--corridor", choices=["none", "ellipse", "ksp"], default="ellipse",
+                        help="只以起訖點附近的子圖建模")
+    parser.add_argument("--slack", type=float, default=0.2, help="ellipse 走廊可比最短旅行時間多出的比例")
+    parser.add_argument("--K", type=int, default=20, help="ksp 走廊使用的最短路徑數")
+    args = parser.parse_args()
 
-    # 讀取你的大圖
-    graphml_file = "Taiwan.graphml"
-    G = nx.read_graphml(graphml_file)
+    # 讀取你的大圖 (二進位快取, 沒有時才解析 GraphML)
+    from routing import load_graph
+    CG = load_graph(args.graph)
 
     # 起始與終點
     start_node = "-144866"
     end_node = "-212207"
 
+    s, t = CG.node_index[start_node], CG.node_index[end_node]
+    corridor = None
+    if args.corridor == "ellipse":
+        corridor = ellipse_corridor(CG, s, t, args.slack)
+    elif args.corridor == "ksp":
+        corridor = ksp_corridor(CG, s, t, args.K)
+    if corridor is not None:
+        print(f"Corridor: {int(corridor.sum())} / {CG.num_nodes} nodes, "
+              f"{len(corridor_edges(CG, corridor))} / {CG.num_edges} edges")
+
+    warm_start_path = None
+    if args.warm_start_aco:
+        from ACO import run_aco
+        from routing_problem import RoutingProblem
+        warm_start_path = run_aco(CG, RoutingProblem(start_node=start_node, end_node=end_node))[0]
+
     # 跑 MILP
-    result = milp_path_charging_gurobi(
-        G=G,
+    started = time.perf_counter()
+    result = solve_path_charging(
+        CG=CG,
         start_node=start_node,
         end_node=end_node,
         initial_soc_percent=50,
         target_soc_percent=90,
         battery_kwh=60.0,
         driving_cost_rate=0.3,
-        charging_power=80,
         charging_cost_rate=0.3,
-        energy_consumption_per_m=0.2
+        energy_consumption_per_m=0.2,
+        corridor=corridor,
+        backend=args.backend,
+        time_limit=args.time_limit,
+        mip_gap=args.mip_gap,
+        warm_start_path=warm_start_path,
     )
 
     status, total_cost, edges_used, soc_values, charge_values = result
-    if status == GRB.OPTIMAL:
-        print("Optimal solution found!")
+    if total_cost is not None:
+        print(f"{status} solution found!")
         print("Total Cost =", total_cost)
         print("Edges used:", edges_used)
         print("SOC (kWh):", soc_values)
         print("Charge (kWh):", charge_values)
     else:
-        print("No solution or not optimal. status =", status)
+        print("No solution. status =", status)
+    print(f"Solved in {time.perf_counter() - started:.2f}s")
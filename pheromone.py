@@ -0,0 +1,232 @@
+import os
+import copy
+import json
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+from compiled_graph import graph_signature
+
+
+class PheromoneTable:
+    """
+    以 NumPy 陣列儲存的費洛蒙:
+     - edges[e]:           對齊 CompiledGraph edge index 的道路費洛蒙
+     - charging[row, k]:   充電站 x 充電選項 的稠密矩陣
+       (row 由 station_row[u] 查得, k 為 options 中的位置)
+    揮發、下限裁切與螞蟻路徑沉積皆為陣列運算.
+    """
+
+    def __init__(self, cg, options, initial=1.0):
+        self.edges = np.full(cg.num_edges, initial, dtype=np.float64)
+
+        # 有出邊的充電站才需要充電行為費洛蒙 (與原本 dict 版本一致)
+        has_out_edges = np.diff(cg.offsets) > 0
+        self.station_nodes = np.flatnonzero(cg.station_mask & has_out_edges)
+        self.station_row = np.full(cg.num_nodes, -1, dtype=np.int64)
+        self.station_row[self.station_nodes] = np.arange(len(self.station_nodes))
+
+        self.options = list(options)
+        self.option_index = {option: k for k, option in enumerate(self.options)}
+        self.charging = np.full((len(self.station_nodes), len(self.options)), initial, dtype=np.float64)
+
+    def copy(self):
+        """複製一份費洛蒙 (station_row 等索引結構共用, 數值陣列各自獨立)"""
+        table = copy.copy(self)
+        table.edges = self.edges.copy()
+        table.charging = self.charging.copy()
+        return table
+
+    def relax(self, decay, initial=1.0):
+        """
+        暖啟動前朝均勻值衰減: 先把數值縮放到平均為 initial (與新表的沉積量同一尺度),
+        再以 new = (1 - decay) * old + decay * initial 混合. decay=1 等於重新初始化, 0 為原樣沿用.
+        """
+        for array in (self.edges, self.charging):
+            if array.size == 0:
+                continue
+            mean = array.mean()
+            if mean > 0:
+                array *= (1 - decay) * initial / mean
+            else:
+                array *= 0.0
+            array += decay * initial
+
+    def save(self, path, cg):
+        """存成 .npz (數值陣列 + 充電選項 + 圖結構雜湊)"""
+        np.savez(
+            path,
+            edges=self.edges,
+            charging=self.charging,
+            station_nodes=self.station_nodes,
+            options=json.dumps(self.options),
+            signature=graph_signature(cg),
+        )
+
+    @classmethod
+    def load(cls, path, cg):
+        """讀取 save 的輸出; 與 cg 的結構或充電站不一致時 raise ValueError"""
+        with np.load(path) as data:
+            if str(data["signature"]) != graph_signature(cg):
+                raise ValueError(f"Pheromone table {path} was saved for a different graph")
+            options = [tuple(option) for option in json.loads(str(data["options"]))]
+            table = cls(cg, options)
+            if not np.array_equal(table.station_nodes, data["station_nodes"]):
+                raise ValueError(f"Pheromone table {path} has different charging stations")
+            table.edges[:] = data["edges"]
+            table.charging[:] = data["charging"]
+        return table
+
+    def branching_factor(self, cg, nodes=None, lam=0.05):
+        """
+        λ-branching factor: 每個節點費洛蒙 >= min + lam * (max - min) 的出邊數, 對 nodes 取平均
+        (None 代表所有有出邊的節點). 接近 1 代表螞蟻在這些節點幾乎只會選同一條邊 (已收斂).
+        """
+        offsets = cg.offsets
+        nodes = np.flatnonzero(np.diff(offsets) > 0) if nodes is None else np.asarray(nodes, dtype=np.int64)
+        degree = offsets[nodes + 1] - offsets[nodes]
+        nodes, degree = nodes[degree > 0], degree[degree > 0]
+        if len(nodes) == 0:
+            return 0.0
+        # 把各節點的出邊攤平成一個陣列, first[i] 為第 i 個節點在其中的起點
+        first = np.cumsum(degree) - degree
+        edge = np.arange(degree.sum()) - np.repeat(first, degree) + np.repeat(offsets[nodes], degree)
+        tau = self.edges[edge]
+        low = np.minimum.reduceat(tau, first)
+        high = np.maximum.reduceat(tau, first)
+        threshold = np.repeat(low + lam * (high - low), degree)
+        return float(np.count_nonzero(tau >= threshold) / len(nodes))
+
+    def has_station(self, u):
+        return self.station_row[u] >= 0
+
+    def station_options(self, u):
+        """充電站 u 各選項的費洛蒙 (與 options 順序對齊)"""
+        return self.charging[self.station_row[u]]
+
+    def evaporate(self, rho, min_pheromone):
+        self.edges *= (1 - rho)
+        np.maximum(self.edges, min_pheromone, out=self.edges)
+        self.charging *= (1 - rho)
+        np.maximum(self.charging, min_pheromone, out=self.charging)
+
+    def deposit(self, edge_paths, amounts, min_pheromone):
+        """
+        edge_paths: 每隻螞蟻走過的 edge index 序列
+        amounts:    每隻螞蟻要沉積的量 (例如 Q / total_cost)
+        同一條邊被多隻螞蟻 (或同一隻螞蟻多次) 走過時以 np.add.at 累加.
+        """
+        if not edge_paths:
+            return
+        lengths = np.fromiter((len(path) for path in edge_paths), dtype=np.int64, count=len(edge_paths))
+        if lengths.sum() == 0:
+            return
+        edge_index = np.concatenate([np.asarray(path, dtype=np.int64) for path in edge_paths])
+        np.add.at(self.edges, edge_index, np.repeat(np.asarray(amounts, dtype=np.float64), lengths))
+        np.maximum(self.edges, min_pheromone, out=self.edges)
+
+    def deposit_charging(self, stations, options, amounts, min_pheromone):
+        """
+        stations / options / amounts 為等長序列, 每筆代表一次 (充電站, 選項) 的沉積;
+        不在表中的充電站或選項會被略過.
+        """
+        rows, cols, values = [], [], []
+        for u, option, amount in zip(stations, options, amounts):
+            k = self.option_index.get(option)
+            if k is None or self.station_row[u] < 0:
+                continue
+            rows.append(self.station_row[u])
+            cols.append(k)
+            values.append(amount)
+        if not rows:
+            return
+        np.add.at(self.charging, (np.array(rows), np.array(cols)), np.array(values, dtype=np.float64))
+        np.maximum(self.charging, min_pheromone, out=self.charging)
+
+
+class PheromoneStore:
+    """
+    跨查詢保存費洛蒙: key (例如 OD 對或區域) -> PheromoneTable 的 LRU, 可存到目錄.
+
+    - checkout(key): 回傳 relax(decay) 後的複本, 作為 run_aco(pheromone=...) 的起點;
+      記憶體中沒有時從目錄讀取, 都沒有時依序嘗試 fallbacks (例如同終點的 key)
+    - store(key, table): 查詢結束後存回 (只標記, flush() 時才寫檔)
+    key 必須可以轉成 JSON (字串/數字/巢狀 tuple), 檔名為 key 的雜湊.
+    """
+
+    def __init__(self, cg, directory=None, max_entries=1000, decay=0.5):
+        self.cg = cg
+        self.directory = directory
+        self.max_entries = max_entries
+        self.decay = decay
+        self.tables = OrderedDict()
+        self.dirty = set()
+        self._lock = threading.RLock()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    def __len__(self):
+        return len(self.tables)
+
+    def _path(self, key):
+        name = hashlib.sha256(json.dumps(key).encode("utf-8")).hexdigest()[:24]
+        return os.path.join(self.directory, name + ".npz")
+
+    def _get(self, key):
+        table = self.tables.get(key)
+        if table is None and self.directory is not None and os.path.exists(self._path(key)):
+            try:
+                table = PheromoneTable.load(self._path(key), self.cg)
+            except ValueError:
+                return None  # 圖已重建, 舊的費洛蒙不再適用
+            self._put(key, table, dirty=False)
+        if table is not None:
+            self.tables.move_to_end(key)
+        return table
+
+    def _put(self, key, table, dirty=True):
+        self.tables[key] = table
+        self.tables.move_to_end(key)
+        if dirty:
+            self.dirty.add(key)
+        while len(self.tables) > self.max_entries:
+            old_key, old_table = self.tables.popitem(last=False)
+            if old_key in self.dirty:
+                self._write(old_key, old_table)
+
+    def _write(self, key, table):
+        self.dirty.discard(key)
+        if self.directory is None:
+            return
+        path = self._path(key)
+        temp_path = path + ".tmp.npz"
+        table.save(temp_path, self.cg)
+        os.replace(temp_path, path)
+
+    def checkout(self, key, fallbacks=(), decay=None):
+        """回傳 (費洛蒙複本, 命中的 key); 都找不到時為 (None, None)"""
+        decay = self.decay if decay is None else decay
+        with self._lock:
+            for candidate in (key, *fallbacks):
+                table = self._get(candidate)
+                if table is not None:
+                    break
+            else:
+                return None, None
+            table = table.copy()
+        table.relax(decay)
+        return table, candidate
+
+    def store(self, key, table, aliases=()):
+        """存回查詢後的費洛蒙; aliases 為同時指向這份表的其他 key (例如同終點的 fallback)"""
+        with self._lock:
+            for k in (key, *aliases):
+                self._put(k, table)
+
+    def flush(self):
+        """把有更新的表寫到目錄"""
+        with self._lock:
+            for key in list(self.dirty):
+                if key in self.tables:
+                    self._write(key, self.tables[key])
+            self.dirty.clear()
@@ -1,113 +1,176 @@
-import networkx as nx
 import random
+from itertools import islice
+import numpy as np
+from routing_problem import RoutingProblem
+from prepath import iter_charging_paths
 
 # 初始化參數
-graphml_file = "Taiwan.graphml"
-G = nx.read_graphml(graphml_file)
-
-start_node = "-144866"
-end_node = "-212207"
-initial_soc = 90  # 起始電量 (%)
-target_soc = 30  # 終點所需電量 (%)
-maximum_power = 60000  # 電池最大容量 (Wh)
-max_time = 3600 * 5  # 最大行駛時間 (秒)
-energy_consumption_per_m = 0.2  # 每米耗電量 (Wh)
+K = 1000  # 最多檢查的路徑數量
+N = None  # 找到 N 條可行路徑就停止, None 代表檢查全部 K 條
 charging_station_power = 120  # 充電站功率 (kW)
-K = 1000  # 需要的路徑數量
-
-# Yen's Algorithm for K Shortest Paths
-def yen_k_shortest_paths(G, source, target, K, weight="travel_time"):
-    def dijkstra(G, source, target, weight):
-        return nx.shortest_path(G, source=source, target=target, weight=weight)
-
-    A = [dijkstra(G, source, target, weight)]
-    B = []  # 儲存候選路徑
-
-    for k in range(1, K):
-        for i in range(len(A[k - 1]) - 1):
-            spur_node = A[k - 1][i]
-            root_path = A[k - 1][:i + 1]
-
-            # 暫時移除 root_path 上的邊
-            removed_edges = []
-            for path in A:
-                if len(path) > i and path[:i + 1] == root_path:
-                    edge = (path[i], path[i + 1])
-                    if G.has_edge(*edge):
-                        removed_edges.append((edge, G[edge[0]][edge[1]][weight]))
-                        G.remove_edge(*edge)
-
-            # 計算 spur_path
-            try:
-                spur_path = nx.shortest_path(G, spur_node, target, weight=weight)
-                total_path = root_path[:-1] + spur_path
-                if total_path not in A and total_path not in B:
-                    B.append(total_path)
-            except nx.NetworkXNoPath:
-                pass
-
-            # 恢復移除的邊
-            for edge, w in removed_edges:
-                G.add_edge(edge[0], edge[1], **{weight: w})
-
-        if not B:
-            break
-
-        # 選擇最短的候選路徑
-        B.sort(key=lambda path: sum(G[path[i]][path[i + 1]][weight] for i in range(len(path) - 1)))
-        A.append(B.pop(0))
-
-    return A
-
-# 篩選包含充電站的路徑
-def filter_paths_with_charging_stations(G, paths):
-    valid_paths = []
-    for path in paths:
-        if any(G.nodes[node].get("is_charging_station", False) for node in path):
-            valid_paths.append(path)
-    return valid_paths
-
-# 對路徑進行充電模擬並驗證
-def validate_paths_with_charging(G, paths, initial_soc, target_soc, max_time, max_power, energy_per_m):
-    valid_paths = []
-
-    for path in paths:
-        soc = initial_soc
-        time_spent = 0
-        is_valid = True
-
-        for u, v in zip(path[:-1], path[1:]):
-            travel_time = G[u][v].get("travel_time")
-            distance = G[u][v].get("length")
-            energy_consumed = distance * energy_per_m / 1000  # kWh
-
-            soc -= (energy_consumed / max_power) * 100
-            time_spent += travel_time
-
-            # 檢查是否需要充電
-            if G.nodes[v].get("is_charging_station", False):
-                charge_time = random.uniform(1800, 3600)  # 隨機充電時間
-                charge_amount = min(
-                    charge_time * charging_station_power, (100 - soc) * 0.01 * max_power
-                )
-                soc += charge_amount / max_power * 100
-                time_spent += charge_time
-
-            if soc < 10 or time_spent > max_time:
-                is_valid = False
-                break
-
-        if is_valid and soc >= target_soc and time_spent <= max_time:
-            valid_paths.append(path)
-
-    return valid_paths
+charge_time_range = (1800, 3600)  # 充電站隨機停留時間 (秒)
+batch_size = 64  # 串流驗證時每次批次模擬的路徑數上限 (從 1 條開始倍增)
+
+# 此版本的預設參數
+default_problem = RoutingProblem(
+    initial_soc=90,           # 起始電量 (%)
+    target_soc=30,            # 終點所需電量 (%)
+    max_time=3600 * 5,        # 最大行駛時間 (秒)
+    charging_station_power=charging_station_power,
+)
+
+# 對單一路徑進行充電模擬並驗證 (逐邊計算, 使用 random 模組; 批次版本見 simulate_paths_with_charging)
+# 有平行邊時取 weight 最小的一條, 與 K 短路徑搜尋的選擇一致
+def validate_path_with_charging(CG, path, initial_soc, target_soc, max_time, max_power, energy_per_m,
+                                charging_power=charging_station_power, weight="travel_time"):
+    soc = initial_soc
+    time_spent = 0
+
+    for u, v in zip(path[:-1], path[1:]):
+        e = CG.edge_index(u, v, weight)
+        travel_time = CG.travel_time[e]
+        distance = CG.length[e]
+        energy_consumed = distance * energy_per_m / 1000  # kWh
+
+        soc -= (energy_consumed / max_power) * 100
+        time_spent += travel_time
+
+        # 檢查是否需要充電
+        if CG.station_mask[v]:
+            charge_time = random.uniform(*charge_time_range)  # 隨機充電時間
+            charge_amount = min(
+                charge_time * charging_power, (100 - soc) * 0.01 * max_power
+            )
+            soc += charge_amount / max_power * 100
+            time_spent += charge_time
+
+        # 一旦低於最低電量或超時就提早結束
+        if soc < 10 or time_spent > max_time:
+            return False
+
+    return soc >= target_soc and time_spent <= max_time
+
+def simulate_paths_with_charging(CG, paths, initial_soc, max_power, energy_per_m,
+                                 charging_power=charging_station_power, seed=None, path_ids=None,
+                                 weight="travel_time"):
+    """
+    批次模擬多條路徑的 SOC 與時間 (與 validate_path_with_charging 相同的模型), 全部以 NumPy 陣列運算:
+     - 所有路徑的邊串成一個 edge index 陣列, 每一步的 SOC 變化與時間以累積和 (cumsum) 計算
+     - 充電站的 SOC 上限 100% 以 "累積和 - 累積最大超出量" 處理 (SOC 只在充電站上升)
+     - 每次充電停留時間 ~ U(charge_time_range), 由 (seed, path_id) 決定的亂數產生,
+       同一條路徑的結果與批次大小、順序無關; seed 為 None 時不可重現
+     - 相鄰節點間有平行邊時取 weight 最小的一條 (與 K 短路徑搜尋、path_weight 相同)
+    回傳 (min_soc, final_soc, total_time) 三個長度為路徑數的陣列, min_soc 為每一步之後的最低 SOC.
+    """
+    num_paths = len(paths)
+    if path_ids is None:
+        path_ids = range(num_paths)
+    lengths = np.fromiter((len(path) - 1 for path in paths), dtype=np.int64, count=num_paths)
+    nodes = [np.asarray(path, dtype=np.int64) for path in paths]
+    us = np.concatenate([path[:-1] for path in nodes]) if num_paths else np.zeros(0, dtype=np.int64)
+    vs = np.concatenate([path[1:] for path in nodes]) if num_paths else np.zeros(0, dtype=np.int64)
+    edges = CG.edge_index_array(us, vs, weight)
+    segment = np.repeat(np.arange(num_paths), lengths)  # 每一步屬於哪條路徑
+
+    # 充電站停留時間
+    stations = CG.station_mask[vs]
+    station_counts = np.bincount(segment[stations], minlength=num_paths)
+    low, high = charge_time_range
+    if seed is None:
+        draws = np.random.default_rng().uniform(low, high, int(station_counts.sum()))
+    else:
+        draws = np.concatenate([
+            np.random.default_rng([seed, path_id]).uniform(low, high, count)
+            for path_id, count in zip(path_ids, station_counts.tolist())
+        ]) if num_paths else np.zeros(0)
+    charge_time = np.zeros(len(vs))
+    charge_time[stations] = draws
+
+    # 每一步的 SOC 變化 (未考慮 100% 上限) 與時間
+    energy_consumed = CG.length[edges] * energy_per_m / 1000  # kWh
+    step_soc = -(energy_consumed / max_power) * 100 + charge_time * charging_power / max_power * 100
+    step_time = CG.travel_time[edges] + charge_time
+
+    # 攤成 (路徑數 x 最長步數) 的矩陣, 沿 axis=1 累積, 各路徑互不影響
+    width = int(lengths.max()) if num_paths else 0
+    valid_steps = np.arange(width) < lengths[:, None]
+    soc = np.zeros((num_paths, width))
+    elapsed = np.zeros((num_paths, width))
+    soc[valid_steps] = step_soc
+    elapsed[valid_steps] = step_time
+    soc = initial_soc + np.cumsum(soc, axis=1)
+    elapsed = np.cumsum(elapsed, axis=1)
+    # SOC 只在充電站上升, 超過 100% 的部分等於到目前為止的最大超出量
+    soc -= np.maximum.accumulate(np.maximum(soc - 100, 0), axis=1)
+
+    min_soc = np.minimum(np.where(valid_steps, soc, np.inf).min(axis=1, initial=np.inf), initial_soc)
+    final_soc = np.full(num_paths, float(initial_soc))
+    total_time = np.zeros(num_paths)
+    moved = lengths > 0  # 只有一個節點的路徑維持初始值
+    final_soc[moved] = soc[moved, lengths[moved] - 1]
+    total_time[moved] = elapsed[moved, lengths[moved] - 1]
+    return min_soc, final_soc, total_time
+
+# 對路徑進行充電模擬並驗證 (批次)
+def validate_paths_with_charging(CG, paths, initial_soc, target_soc, max_time, max_power, energy_per_m,
+                                 charging_power=charging_station_power, seed=None, path_ids=None,
+                                 weight="travel_time"):
+    if not paths:
+        return []
+    min_soc, final_soc, total_time = simulate_paths_with_charging(
+        CG, paths, initial_soc, max_power, energy_per_m, charging_power, seed, path_ids, weight,
+    )
+    # 過程中任一步低於 10% 或超時即不可行 (時間單調遞增, 只需看總時間)
+    valid = (min_soc >= 10) & (total_time <= max_time) & (final_soc >= target_soc)
+    return [path for path, ok in zip(paths, valid) if ok]
+
+def iter_valid_paths(CG, problem, K=K, weight="travel_time", landmarks=None):
+    """
+    串流管線: 前 K 短路徑依成本遞增逐條產生 -> 經過充電站 -> 充電模擬驗證, 可行的路徑依序 yield.
+    批次大小從 1 開始每次加倍到 batch_size: 前幾條路徑就可行時 (例如 limit=1) 不會多算 K 短路徑,
+    之後才以較大的批次攤提模擬成本.
+    充電停留時間以 problem.random_seed 與路徑序號決定, 結果與批次大小無關.
+    """
+    start_node = CG.node_index[problem.start_node]
+    end_node = CG.node_index[problem.end_node]
+
+    def validate(batch, first_id):
+        return validate_paths_with_charging(
+            CG, batch, problem.initial_soc, problem.target_soc, problem.max_time,
+            problem.maximum_power, problem.energy_consumption_per_m, problem.charging_station_power,
+            seed=problem.random_seed, path_ids=range(first_id, first_id + len(batch)), weight=weight,
+        )
+
+    batch = []
+    checked = 0
+    size = 1
+    for path in iter_charging_paths(CG, start_node, end_node, K, weight, landmarks):
+        batch.append(path)
+        if len(batch) >= size:
+            yield from validate(batch, checked)
+            checked += len(batch)
+            batch = []
+            size = min(size * 2, batch_size)
+    yield from validate(batch, checked)
+
+def find_valid_paths(CG, problem, K=K, weight="travel_time", limit=None, landmarks=None):
+    """前 K 短路徑中的可行路徑 (整數節點 id); 找到 limit 條就停止, None 代表檢查全部 K 條"""
+    return list(islice(iter_valid_paths(CG, problem, K, weight, landmarks), limit))
 
 # 主程序
-k_shortest_paths = yen_k_shortest_paths(G, start_node, end_node, K)
-charging_paths = filter_paths_with_charging_stations(G, k_shortest_paths)
-valid_paths = validate_paths_with_charging(G, charging_paths, initial_soc, target_soc, max_time, maximum_power, energy_consumption_per_m)
-
-# 輸出結果
-print(f"找到 {len(valid_paths)} 條符合要求的路徑：")
-for i, path in enumerate(valid_paths):
-    print(f"路徑 {i + 1}: {path}")
+if __name__ == "__main__":
+    import argparse
+    from routing import load_graph
+
+    parser = argparse.ArgumentParser(description="Validate K-shortest paths with a charging simulation")
+    parser.add_argument("--graph", default=None,
+                        help="二進位圖快取目錄或 GraphML 檔 (預設 Taiwan.graph, 不存在時用 Taiwan.graphml)")
+    args = parser.parse_args()
+    CG = load_graph(args.graph)
+
+    valid_paths = find_valid_paths(CG, default_problem, K, limit=N)
+
+    # 輸出結果
+    print(f"找到 {len(valid_paths)} 條符合要求的路徑：")
+    for i, path in enumerate(valid_paths):
+        print(f"路徑 {i + 1}: {CG.to_node_path(path)}")
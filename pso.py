@@ -1,109 +1,106 @@
 import numpy as np
-import networkx as nx
-
-graphml_file = "expanded_network_with_charging_test.graphml"
-G = nx.read_graphml(graphml_file)
-
-G = nx.relabel_nodes(G, lambda x: str(x))
-start_node = "622617976"
-end_node = "622617959"
-
-if start_node not in G.nodes:
-    raise ValueError(f"Start node {start_node} not found in the graph.")
-if end_node not in G.nodes:
-    raise ValueError(f"End node {end_node} not found in the graph.")
-
-initial_soc = 20000  
-min_soc = 10  
-energy_consumption_per_km = 150  
-charging_road_length = 200  
-charging_cost_per_kWh = 0.2  
-num_particles = 100  
-num_iterations = 200  
-omega = 0.7  
-c1 = 1.5  
-c2 = 1.5  
-
-edges = list(G.edges(data=True))
-num_edges = len(edges)
-
-particles = np.random.uniform(0, 1, (num_particles, num_edges))  
-velocities = np.zeros_like(particles)  
-p_best = particles.copy()  
-fitness = np.full(num_particles, np.inf)  
-g_best = None  
-
-
-def is_valid_path(particle):
-    selected_edges = [(u, v) for i, (u, v, data) in enumerate(edges) if particle[i] > 0.5]
-    subgraph = nx.DiGraph()
-    subgraph.add_edges_from(selected_edges)
-
-    if start_node not in subgraph.nodes or end_node not in subgraph.nodes:
-        return False
-
-    return nx.has_path(subgraph, start_node, end_node)
-
-def fitness_function(particle):
-    if not is_valid_path(particle):
-        return np.inf
-
-    soc = initial_soc
-    total_cost = 0
-    selected_edges = [(u, v, data) for i, (u, v, data) in enumerate(edges) if particle[i] > 0.5]
-
-    for u, v, data in selected_edges:
-        energy_consumption = data['length'] / 1000 * energy_consumption_per_km
-        charging_gain = data['power'] * (charging_road_length / 10) if data.get('is_charging') else 0
-        soc -= energy_consumption
-        soc += charging_gain
-        if soc < min_soc:
-            return np.inf  
-        if data.get('is_charging'):
-            total_cost += charging_gain * charging_cost_per_kWh / 1000  
-
-    return total_cost
-
-# PSO
-for t in range(num_iterations):
-    for i in range(num_particles):
-        fitness_value = fitness_function(particles[i])
-        if fitness_value < fitness[i]:  
-            p_best[i] = particles[i]
-            fitness[i] = fitness_value
-
-    g_best_index = np.argmin(fitness)
-    if fitness[g_best_index] != np.inf:  
-        g_best = p_best[g_best_index]
-
-    for i in range(num_particles):
-        r1, r2 = np.random.rand(2)
-        velocities[i] = (
-            omega * velocities[i] +
-            c1 * r1 * (p_best[i] - particles[i]) +
-            c2 * r2 * (g_best - particles[i])
-        )
-        particles[i] += velocities[i]
-        particles[i] = np.clip(particles[i], 0, 1)  
-
-final_solution = (g_best > 0.5).astype(int)
-selected_edges = [(u, v, data) for i, (u, v, data) in enumerate(edges) if final_solution[i] == 1]
-
-subgraph = nx.DiGraph()
-subgraph.add_edges_from([(u, v) for u, v, data in selected_edges])
-
-if nx.has_path(subgraph, start_node, end_node):
-    print("The selected edges form a valid path.")
-else:
-    print("The selected edges do not form a valid path.")
-
-# 計算總成本
-total_cost = 0
-for u, v, data in selected_edges:
-    if data.get('is_charging'):
-        total_cost += data['power'] * (charging_road_length / 10) * charging_cost_per_kWh / 1000
-print(f"Total cost: {total_cost:.4f} USD")
-
-# 輸出選中邊的 ID
-selected_edge_ids = [data['id'] for u, v, data in selected_edges]
-print("Selected edge IDs:", selected_edge_ids)
+from compiled_graph import load_compiled_graph
+from routing_problem import RoutingProblem
+
+
+def _reaches(CG, mask, source, target):
+    """只走 mask 為 True 的邊時, source 是否到得了 target"""
+    seen = {source}
+    stack = [source]
+    while stack:
+        u = stack.pop()
+        if u == target:
+            return True
+        for e in range(CG.offsets[u], CG.offsets[u + 1]):
+            v = int(CG.targets[e])
+            if mask[e] and v not in seen:
+                seen.add(v)
+                stack.append(v)
+    return False
+
+
+def run_pso(CG, problem, num_particles=100, num_iterations=200, omega=0.7, c1=1.5, c2=1.5):
+    """
+    在預先載入的 CompiledGraph 上依 RoutingProblem 以 PSO 選邊 (每個粒子是一組邊的選擇機率, > 0.5 代表選取).
+    電量以 Wh 計: 起始/最低電量為 initial_soc / min_soc (%) x maximum_power,
+    每條邊耗電 length x energy_consumption_per_m, 充電道路補充的電量與 ACO 的 calculate_pt_energy_gain 相同.
+    PSO 沒有時間維度, 充電電價固定使用 charging_cost_per_kWh_offpeak.
+    num_particles / num_iterations / omega / c1 / c2 為 PSO 本身的參數; 亂數種子為 problem.random_seed.
+    回傳 (selected_edges, total_cost, is_valid), selected_edges 為選取邊的 (起點, 終點) 節點名稱.
+    """
+    p = problem
+    for node in (p.start_node, p.end_node):
+        if node not in CG.node_index:
+            raise ValueError(f"Node {node} not found in the graph.")
+    start, end = CG.node_index[p.start_node], CG.node_index[p.end_node]
+    rng = np.random.default_rng(p.random_seed)
+
+    # 每條邊的耗電與充電道路補充電量 (Wh), 只算一次
+    energy = CG.length * p.energy_consumption_per_m
+    gain = np.where(CG.is_charging, p.power_track_length / CG.speed * p.power_track_power / 3600, 0.0)
+    initial_energy = p.initial_soc / 100 * p.maximum_power
+    min_energy = p.min_soc / 100 * p.maximum_power
+    charging_rate = p.charging_cost_per_kWh_offpeak
+
+    def selection_cost(mask):
+        # 依 edge index 順序累計選取邊的電量 (與原本的模型相同)
+        return float(gain[mask].sum() * charging_rate / 1000)
+
+    def fitness_function(particle):
+        mask = particle > 0.5
+        if not _reaches(CG, mask, start, end):
+            return np.inf
+        levels = initial_energy + np.cumsum(gain[mask] - energy[mask])
+        if len(levels) and levels.min() < min_energy:
+            return np.inf
+        return selection_cost(mask)
+
+    num_edges = CG.num_edges
+    particles = rng.uniform(0, 1, (num_particles, num_edges))
+    velocities = np.zeros_like(particles)
+    p_best = particles.copy()
+    fitness = np.full(num_particles, np.inf)
+    g_best = None
+
+    for t in range(num_iterations):
+        for i in range(num_particles):
+            fitness_value = fitness_function(particles[i])
+            if fitness_value < fitness[i]:
+                p_best[i] = particles[i]
+                fitness[i] = fitness_value
+
+        g_best_index = np.argmin(fitness)
+        if fitness[g_best_index] != np.inf:
+            g_best = p_best[g_best_index]
+
+        for i in range(num_particles):
+            r1, r2 = rng.random(2)
+            velocities[i] = omega * velocities[i] + c1 * r1 * (p_best[i] - particles[i])
+            # 還沒有任何可行粒子時只依個體經驗移動
+            if g_best is not None:
+                velocities[i] += c2 * r2 * (g_best - particles[i])
+            particles[i] += velocities[i]
+            particles[i] = np.clip(particles[i], 0, 1)
+
+    if g_best is None:
+        return [], float('inf'), False
+
+    mask = g_best > 0.5
+    selected_edges = [(CG.node_ids[CG.sources[e]], CG.node_ids[CG.targets[e]]) for e in np.flatnonzero(mask)]
+    return selected_edges, selection_cost(mask), _reaches(CG, mask, start, end)
+
+
+if __name__ == "__main__":
+    graphml_file = "expanded_network_with_charging_test.graphml"
+    CG = load_compiled_graph(graphml_file)
+
+    problem = RoutingProblem(start_node="622617976", end_node="622617959")
+    selected_edges, total_cost, is_valid = run_pso(CG, problem)
+
+    if is_valid:
+        print("The selected edges form a valid path.")
+    else:
+        print("The selected edges do not form a valid path.")
+
+    print(f"Total cost: {total_cost:.4f} USD")
+    print("Selected edges:", selected_edges)
@@ -1,60 +1,104 @@
-from xml.etree import ElementTree as ET
-from xml.dom import minidom
-
-
-# 載入你的 XML 文件
-tree = ET.parse('Taiwan2.net.xml')  # 請將 'your_file.xml' 換成你的 XML 檔案路徑
-root = tree.getroot()
-
-
-# 初始化計數器與列表
-cs_id_counter = 0  # 充電站 ID 計數器
-charging_stations = []
-
-
-# 遍歷 edge 元素
-for edge in root.findall('edge'):
-   edge_type = edge.get('type')
-   # 過濾 type 是 primary, secondary 或 tertiary 的道路
-   if edge_type in ['highway.primary', 'highway.secondary', 'highway.tertiary', 'highway.trunk','highway.primary_link', 'highway.secondary_link', 'highway.tertiary_link', 'highway.trunk_link']:
-       added_charging = False  # 用來追蹤是否已為此 edge 添加充電站
-       for lane in edge.findall('lane'):
-           lane_length = float(lane.get('length'))
-           lane_speed = float(lane.get('speed'))
-           # 檢查 lane 的長度是否大於 200 並且該 edge 尚未添加充電站
-           if lane_length > 200 and lane_speed <= 13.89 and not added_charging:
-               lane_id = lane.get('id')
-               charging_stations.append((f"cs_{cs_id_counter}", lane_id))
-               cs_id_counter += 1
-               added_charging = True  # 標記已為該 edge 添加充電站
-
-
-# 創建新的 XML 文件結構
-new_root = ET.Element("additional")
-
-
-for cs_id, lane_id in charging_stations:
-   ET.SubElement(new_root, "chargingStation", {
-       "id": cs_id,
-       "lane": lane_id,
-       "startPos": "0.00",
-       "endPos": "200.00",
-       "chargeInTransit": "1",
-       "power": "11700"
-   })
-
-
-# 將 XML 格式化並寫入文件
-def prettify_and_write_xml(element, output_file):
-   rough_string = ET.tostring(element, 'utf-8')
-   reparsed = minidom.parseString(rough_string)
-   with open(output_file, "w", encoding="utf-8") as f:
-       f.write(reparsed.toprettyxml(indent="    "))
-
-
-# 輸出排版過的 XML 檔案
-output_path = 'charging_stations_add_Taiwan.xml'  # 儲存路徑
-prettify_and_write_xml(new_root, output_path)
-
-
-print(f"已成功生成格式化的充電站 XML 文件: {output_path}")
\ No newline at end of file
+import heapq
+import time
+import argparse
+from xml.sax.saxutils import quoteattr
+from xml_stream import iter_top_level
+
+
+# 預設規則: 主要道路上長度 > 200m 且速限 <= 13.89 m/s (50 km/h) 的 lane
+default_edge_types = ['highway.primary', 'highway.secondary', 'highway.tertiary', 'highway.trunk',
+                      'highway.primary_link', 'highway.secondary_link', 'highway.tertiary_link', 'highway.trunk_link']
+
+# 輸出 chargingStation 的固定屬性
+station_attributes = {
+    "startPos": "0.00",
+    "endPos": "200.00",
+    "chargeInTransit": "1",
+    "power": "11700",
+}
+
+
+class PlacementRule:
+    """哪些 lane 可以放置充電道路: 道路類型、最小長度 (m, 不含)、最大速限 (m/s, 含)"""
+
+    def __init__(self, edge_types=None, min_length=200, max_speed=13.89):
+        self.edge_types = set(default_edge_types if edge_types is None else edge_types)
+        self.min_length = min_length
+        self.max_speed = max_speed
+
+    def edge_allowed(self, edge_type):
+        return edge_type in self.edge_types
+
+    def lane_allowed(self, lane_length, lane_speed):
+        return lane_length > self.min_length and lane_speed <= self.max_speed
+
+
+def generate_candidates(net_file, rule=None, budget=None, prefer_longest=False):
+    """
+    串流掃描 net.xml, 依序產生 (station id, lane id, lane 長度); 每條 edge 最多一個 (第一條符合的 lane).
+    budget:         最多放置幾個, None 代表不限
+    prefer_longest: 有 budget 時保留最長的 budget 條 lane (以大小為 budget 的 heap 篩選),
+                    否則依檔案順序取前 budget 個並提早停止掃描
+    """
+    rule = rule or PlacementRule()
+
+    def scan():
+        for edge in iter_top_level(net_file, ('edge',)):
+            if not rule.edge_allowed(edge.get('type')):
+                continue
+            for lane in edge.findall('lane'):
+                lane_length = float(lane.get('length'))
+                if rule.lane_allowed(lane_length, float(lane.get('speed'))):
+                    yield lane.get('id'), lane_length
+                    break  # 每條 edge 只放一個充電站
+
+    if budget is not None and prefer_longest:
+        heap = []
+        for order, (lane_id, lane_length) in enumerate(scan()):
+            item = (lane_length, -order, lane_id)
+            if len(heap) < budget:
+                heapq.heappush(heap, item)
+            elif item > heap[0]:
+                heapq.heapreplace(heap, item)
+        # 輸出時回到檔案順序
+        lanes = [(lane_id, lane_length) for lane_length, _, lane_id in sorted(heap, key=lambda item: -item[1])]
+    else:
+        lanes = scan()
+
+    for cs_id_counter, (lane_id, lane_length) in enumerate(lanes):
+        if budget is not None and cs_id_counter >= budget:
+            break
+        yield f"cs_{cs_id_counter}", lane_id, lane_length
+
+
+def write_charging_stations(candidates, output_file, attributes=None):
+    """邊產生邊寫出 additional 檔 (不在記憶體中建立整棵 XML 樹), 回傳寫出的數量"""
+    attributes = station_attributes if attributes is None else attributes
+    extra = "".join(f" {name}={quoteattr(value)}" for name, value in attributes.items())
+    count = 0
+    with open(output_file, "w", encoding="utf-8") as f:
+        f.write('<?xml version="1.0" ?>\n<additional>\n')
+        for cs_id, lane_id, _ in candidates:
+            f.write(f'    <chargingStation id={quoteattr(cs_id)} lane={quoteattr(lane_id)}{extra}/>\n')
+            count += 1
+        f.write('</additional>\n')
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate power-track charging station candidates")
+    parser.add_argument("--net", default="Taiwan2.net.xml", help="SUMO 網路檔 (可為 .gz)")
+    parser.add_argument("--output", default="charging_stations_add_Taiwan.xml")
+    parser.add_argument("--types", nargs="*", default=None, help="允許的道路類型 (預設為主要道路)")
+    parser.add_argument("--min-length", type=float, default=200)
+    parser.add_argument("--max-speed", type=float, default=13.89)
+    parser.add_argument("--budget", type=int, default=None, help="最多放置的充電站數")
+    parser.add_argument("--prefer-longest", action="store_true", help="有 budget 時優先選最長的 lane")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rule = PlacementRule(args.types, args.min_length, args.max_speed)
+    candidates = generate_candidates(args.net, rule, args.budget, args.prefer_longest)
+    count = write_charging_stations(candidates, args.output)
+
+    print(f"已成功生成充電站 XML 文件: {args.output} ({count} 個, {time.perf_counter() - started:.2f}s)")
@@ -0,0 +1,227 @@
+import heapq
+import numpy as np
+from scheduling import day_start_minutes, peak_end_minutes
+from v2g_cache import V2GCostCache
+import ACO
+
+
+class LabelSettingSolver:
+    """
+    SOC 感知的資源限制最短路徑 (RCSP) label-setting 求解器.
+
+    模型與 ACO.py 的螞蟻完全相同: 道路耗電 (energy_consumption_per_m)、充電道路的
+    calculate_pt_energy_gain、尖峰/離峰電價、充電站的 (停留分鐘, 目標SOC) 選項與 V2G 成本,
+    以及 "SOC > min_soc 且時間 < max_time 才能繼續走、抵達終點時 SOC >= target_soc" 的限制.
+    目標為最小化總成本 (行駛電費 + 充電道路電費 + 充電站 V2G 成本).
+
+    V2G 成本可能為負, 因此 label 依時間 (而非成本) 遞增處理. 同一節點的 label 若落在同一個
+    時間桶, 且另一個 label 成本不高、SOC 桶不低 (且較早處理, 即不晚到), 就被支配而捨棄.
+    電價只在尖峰結束前隨時間變化, 所以時間桶只在那之前細分 (之後全部同一桶, 較早到達必不較差).
+    soc_resolution / time_resolution 越小越接近精確解 (ε-近似).
+    """
+
+    def __init__(self, CG, problem, v2g_cache=None, soc_resolution=1.0, time_resolution=300.0, landmarks=None):
+        self.CG = CG
+        self.problem = problem
+        self.colony = ACO.Colony(CG, problem, v2g_cache)
+        self.options = self.colony.options
+        self.soc_resolution = soc_resolution
+        self.time_resolution = time_resolution
+        p = problem
+
+        # 每條邊的 SOC 變化、時間與電量 (與 Ant.move 相同), 只算一次
+        pt_gain = np.where(CG.is_charging, p.power_track_length / CG.speed * p.power_track_power / 3600, 0.0)
+        energy = CG.length * p.energy_consumption_per_m - pt_gain
+        self.pt_gain = pt_gain.tolist()
+        self.energy = energy.tolist()
+        self.soc_change = ((pt_gain - energy) / p.maximum_power * 100).tolist()
+        self.travel_time = CG.travel_time.tolist()
+        self.offsets = CG.offsets.tolist()
+        self.targets = CG.targets.tolist()
+        self.station_mask = CG.station_mask.tolist()
+
+        # 電價 (行駛電價與 V2G 時段) 不再隨時間改變的時刻
+        v2g_peak_seconds = (peak_end_minutes - day_start_minutes) * 60
+        self.price_boundary = max(p.peak_time_limit, v2g_peak_seconds)
+
+        self.end = self.colony.end_node
+        # 有 travel_time 地標表時以地標下界代替反向 Dijkstra (不需每次查詢掃過全圖)
+        if landmarks is not None:
+            self.time_to_end = landmarks.lower_bounds_to(self.end).tolist()
+        else:
+            self.time_to_end = self._time_to_end()
+        into_end = CG.travel_time[CG.targets == self.end]
+        self.last_hop_slack = float(into_end.max()) if len(into_end) else 0.0
+
+    def _time_to_end(self):
+        """各節點到終點的最短行駛時間 (反向 Dijkstra), 用來剪掉不可能在時限內抵達的 label"""
+        CG = self.CG
+        in_offsets, order = CG.in_edges_csr()
+        in_offsets, order = in_offsets.tolist(), order.tolist()
+        sources = CG.sources.tolist()
+        w = self.travel_time
+        dist = [float("inf")] * CG.num_nodes
+        dist[self.end] = 0.0
+        heap = [(0.0, self.end)]
+        while heap:
+            d, v = heapq.heappop(heap)
+            if d > dist[v]:
+                continue
+            for k in range(in_offsets[v], in_offsets[v + 1]):
+                e = order[k]
+                u = sources[e]
+                if d + w[e] < dist[u]:
+                    dist[u] = d + w[e]
+                    heapq.heappush(heap, (dist[u], u))
+        return dist
+
+    def _time_bucket(self, t):
+        if t >= self.price_boundary:
+            return -1
+        return int(t // self.time_resolution)
+
+    def _dominated(self, fronts, node, t, soc, cost):
+        front = fronts.get((node, self._time_bucket(t)))
+        if not front:
+            return False
+        b = int(soc // self.soc_resolution)
+        return any(sb >= b and c <= cost for sb, c in front)
+
+    def _add_front(self, fronts, node, t, soc, cost):
+        key = (node, self._time_bucket(t))
+        b = int(soc // self.soc_resolution)
+        front = fronts.get(key, [])
+        fronts[key] = [(sb, c) for sb, c in front if not (b >= sb and cost <= c)] + [(b, cost)]
+
+    def solve(self):
+        """
+        回傳與 ACO.run_aco 相同格式:
+        (best_path, best_cost, best_charging_cost, best_log, best_time, final_soc)
+        """
+        CG, p = self.CG, self.problem
+        start = self.colony.start_node
+
+        # label: (time, cost, charging_cost, soc, node, parent, edge, station_log)
+        labels = []
+        heap = []
+        fronts = {}
+        counter = 0
+
+        def push(t, cost, charging_cost, soc, node, parent, edge, log):
+            nonlocal counter
+            labels.append((t, cost, charging_cost, soc, node, parent, edge, log))
+            heapq.heappush(heap, (t, counter, len(labels) - 1))
+            counter += 1
+
+        push(0.0, 0.0, 0.0, p.initial_soc, start, -1, -1, None)
+        best = None
+
+        while heap:
+            _, _, index = heapq.heappop(heap)
+            t, cost, charging_cost, soc, u, _, _, _ = labels[index]
+            if self._dominated(fronts, u, t, soc, cost):
+                continue
+            self._add_front(fronts, u, t, soc, cost)
+
+            if u == self.end:
+                if soc >= p.target_soc and (best is None or cost < labels[best][1]):
+                    best = index
+                continue
+            if not (soc > p.min_soc and t < p.max_time):
+                continue
+
+            for e in range(self.offsets[u], self.offsets[u + 1]):
+                v = self.targets[e]
+                nt = t + self.travel_time[e]
+                # 最快也要在時限內出發走最後一段才可能抵達
+                if nt + self.time_to_end[v] > p.max_time + self.last_hop_slack:
+                    continue
+                pt_cost = self.pt_gain[e] * p.cost_rate(t) / 1000
+                drive_cost = self.energy[e] / 1000.0 * p.cost_rate(nt)
+                ncost = cost + pt_cost + drive_cost
+                ncharging = charging_cost + pt_cost
+                nsoc = soc + self.soc_change[e]
+
+                if self.station_mask[v]:
+                    self._expand_station(push, index, e, nt, ncost, ncharging, nsoc, v)
+                elif v == self.end or (nsoc > p.min_soc and nt < p.max_time):
+                    if not self._dominated(fronts, v, nt, nsoc, ncost):
+                        push(nt, ncost, ncharging, nsoc, v, index, e, None)
+
+        if best is None:
+            return None, float('inf'), float('inf'), [], None, None
+        return self._reconstruct(labels, best)
+
+    def _expand_station(self, push, parent, e, t, cost, charging_cost, soc, v):
+        """
+        抵達充電站: 與 Ant.handle_charging_station 相同, 每個可行的 (停留分鐘, 目標SOC) 選項各產生一個 label.
+        停留 0 分鐘的選項或沒有任何可行選項時為不充電.
+        """
+        p = self.problem
+        candidates = [
+            (minutes, target) for minutes, target in self.options
+            if target >= soc and target >= p.min_soc
+        ]
+        results = self.colony.v2g_cache.lookup_batch(t, candidates, soc) if candidates else []
+        feasible = [
+            (minutes, target, stop_cost, delta_soc)
+            for (minutes, target), (status, stop_cost, delta_soc) in zip(candidates, results)
+            if status != 'Infeasible'
+        ]
+        if not feasible or any(minutes == 0 for minutes, _, _, _ in feasible):
+            push(t, cost, charging_cost, soc, v, parent, e, None)
+        for minutes, target, stop_cost, delta_soc in feasible:
+            if minutes == 0:
+                continue
+            log = {
+                "station": v,
+                "chosen_time_min": minutes,
+                "chosen_target_soc": target,
+                "initial_soc": soc,
+                "final_soc": soc + delta_soc,
+                "cost": stop_cost,
+            }
+            push(t + minutes * 60, cost + stop_cost, charging_cost + stop_cost, soc + delta_soc, v, parent, e, log)
+
+    def _reconstruct(self, labels, index):
+        t, cost, charging_cost, soc, _, _, _, _ = labels[index]
+        path, log = [], []
+        while index >= 0:
+            _, _, _, _, node, parent, _, station_log = labels[index]
+            path.append(node)
+            if station_log is not None:
+                log.append(station_log)
+            index = parent
+        path.reverse()
+        log.reverse()
+        best_log = [dict(item, station=self.CG.node_ids[item['station']]) for item in log]
+        return self.CG.to_node_path(path), cost, charging_cost, best_log, t, soc
+
+
+def solve_rcsp(CG, problem, v2g_cache=None, soc_resolution=1.0, time_resolution=300.0, landmarks=None):
+    """以 label-setting 求解單一 OD 查詢, 回傳格式與 ACO.run_aco 相同"""
+    return LabelSettingSolver(CG, problem, v2g_cache, soc_resolution, time_resolution, landmarks).solve()
+
+
+if __name__ == "__main__":
+    import argparse
+    import time
+    from routing import load_graph
+    from routing_problem import RoutingProblem
+
+    parser = argparse.ArgumentParser(description="SOC-aware label-setting solver")
+    parser.add_argument("--graph", default=None,
+                        help="二進位圖快取目錄或 GraphML 檔 (預設 Taiwan.graph, 不存在時用 Taiwan.graphml)")
+    args = parser.parse_args()
+    CG = load_graph(args.graph)
+    started = time.perf_counter()
+    best_path, best_cost, best_charging_cost, best_log, best_time, final_soc = solve_rcsp(
+        CG, RoutingProblem(), V2GCostCache(),
+    )
+    print("Best Path:", best_path)
+    print("Best Cost:", best_cost)
+    print("Best Charging Cost:", best_charging_cost)
+    print("Stations Log:", best_log)
+    print("Total Time Spent:", best_time, "seconds")
+    print("Final SOC:", final_soc, "%")
+    print(f"Solved in {time.perf_counter() - started:.2f}s")
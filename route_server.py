@@ -0,0 +1,307 @@
+"""
+常駐的路徑查詢服務.
+
+圖 (CompiledGraph)、V2G 成本快取與各起訖點 (OD) 的費洛蒙只在程序啟動後建立一次,
+之後的查詢都直接使用; 同一 OD 的後續查詢會從上次的費洛蒙接續搜尋 (warm start),
+沒有同一 OD 時改用同終點最近一次查詢的費洛蒙. 以 --pheromone-dir 指定目錄時,
+費洛蒙在程序結束時寫入, 下次啟動後繼續使用.
+
+兩種模式:
+    python route_server.py --graph Taiwan.graph < queries.jsonl      # stdin/stdout JSONL
+    python route_server.py --graph Taiwan.graph --http 8000          # POST /route, GET /stats
+
+每筆查詢是一個 JSON 物件, 例如
+    {"id": 1, "start_node": "-144866", "end_node": "-212207", "time_budget": 10}
+除 id / warm_start / warm_start_decay 外的欄位對應 RoutingProblem 的參數 (只限 QUERY_FIELDS).
+warm_start_decay (0~1) 為沿用費洛蒙前朝均勻值衰減的比例, 條件改變較多 (例如不同時段) 時可調高.
+time_budget / patience / min_branching_factor 任一條件成立即回傳當時的最佳解, 回應中的
+iterations 與 stop_reason 為實際執行的回合數與停止原因.
+"""
+import argparse
+import json
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import ACO
+from pheromone import PheromoneStore
+from routing import load_graph
+from routing_problem import RoutingProblem
+from v2g_cache import V2GCostCache
+
+
+# 查詢可以設定的 RoutingProblem 欄位與型別; 其餘欄位 (num_workers、v2g_table_file 等會在伺服器端
+# 開 process pool 或讀檔的設定) 只能由啟動參數決定
+QUERY_FIELDS = {
+    "start_node": "node",
+    "end_node": "node",
+    "initial_soc": "number",
+    "target_soc": "number",
+    "min_soc": "number",
+    "maximum_power": "number",
+    "max_time": "number",
+    "charging_cost_per_kWh_peak": "number",
+    "charging_cost_per_kWh_offpeak": "number",
+    "peak_time_limit": "number",
+    "energy_consumption_per_m": "number",
+    "charging_station_power": "number",
+    "power_track_power": "number",
+    "power_track_length": "number",
+    "num_ants": "count",
+    "iterations": "count",
+    "alpha": "number",
+    "beta": "number",
+    "rho": "number",
+    "Q": "number",
+    "min_pheromone": "number",
+    "charging_options": "options",
+    "random_seed": "optional_count",
+    "time_budget": "optional_number",
+    "patience": "optional_count",
+    "min_improvement": "number",
+    "min_branching_factor": "optional_number",
+}
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _check_field(name, kind, value):
+    """查詢欄位的型別檢查, 不符時 raise ValueError"""
+    if kind.startswith("optional_"):
+        if value is None:
+            return
+        kind = kind[len("optional_"):]
+    if kind == "node":
+        ok = isinstance(value, str)  # 圖的節點 id 一律是字串, 數字 id 也要以字串傳入
+    elif kind == "number":
+        ok = _is_number(value)
+    elif kind == "count":
+        ok = isinstance(value, int) and not isinstance(value, bool) and value >= 0
+    else:  # options: [[停留分鐘, 目標SOC], ...]
+        ok = value is None or (isinstance(value, list) and all(
+            isinstance(option, list) and len(option) == 2 and all(_is_number(v) for v in option)
+            for option in value))
+    if not ok:
+        raise ValueError(f"Invalid value for {name}: {value!r}")
+
+
+class RouteServer:
+    """
+    保存常駐狀態並回答查詢 (可由多個執行緒同時呼叫 solve).
+
+    每個 OD 的費洛蒙存在 PheromoneStore (LRU, 超過 max_od_states 時淘汰最久沒用到的;
+    有 pheromone_dir 時淘汰與 flush() 會寫入目錄). 同一 OD 的並行查詢各自從當下的費洛蒙複本開始,
+    結束時由較晚完成者覆寫.
+    注意: num_workers == 1 的查詢共用 random 模組的全域亂數, 並行時結果不保證可重現.
+    """
+
+    def __init__(self, CG, v2g_cache=None, base_problem=None, max_od_states=1000,
+                 pheromone_dir=None, warm_start_decay=0.5):
+        self.CG = CG
+        self.v2g_cache = v2g_cache if v2g_cache is not None else V2GCostCache()
+        self.base_problem = base_problem if base_problem is not None else RoutingProblem()
+        self.od_states = PheromoneStore(CG, pheromone_dir, max_od_states, warm_start_decay)
+        self._lock = threading.Lock()
+        self.queries = 0
+
+    def make_problem(self, query):
+        """
+        由查詢欄位建立 RoutingProblem (未指定的欄位沿用 base_problem).
+        只接受 QUERY_FIELDS 中的欄位, 未知欄位或型別不符時 raise ValueError.
+        """
+        params = {key: value for key, value in query.items()
+                  if key not in ("id", "warm_start", "warm_start_decay")}
+        unknown = sorted(set(params) - set(QUERY_FIELDS))
+        if unknown:
+            raise ValueError(f"Query fields not allowed: {unknown}")
+        for key, value in params.items():
+            _check_field(key, QUERY_FIELDS[key], value)
+        decay = query.get("warm_start_decay")
+        if decay is not None and not (_is_number(decay) and 0 <= decay <= 1):
+            raise ValueError(f"Invalid value for warm_start_decay: {decay!r}")
+        if params.get("charging_options") is not None:
+            # JSON 沒有 tuple, (停留分鐘, 目標SOC) 選項轉回 tuple
+            params["charging_options"] = [tuple(option) for option in params["charging_options"]]
+        return self.base_problem.replace(**params)
+
+    def _od_key(self, problem):
+        return problem.start_node, problem.end_node, tuple(problem.charging_options or ACO.charging_options)
+
+    def _destination_key(self, problem):
+        # 同終點的查詢: 靠近終點的費洛蒙仍然有用
+        return None, problem.end_node, tuple(problem.charging_options or ACO.charging_options)
+
+    def flush(self):
+        """把各 OD 的費洛蒙寫到 pheromone_dir (沒有指定時不做事)"""
+        self.od_states.flush()
+
+    def solve(self, query):
+        """回答一筆查詢, 回傳可直接 json.dumps 的 dict"""
+        started = time.monotonic()
+        if not isinstance(query, dict):
+            return {"id": None, "status": "error", "error": "Query must be a JSON object."}
+        response = {"id": query.get("id")}
+        try:
+            problem = self.make_problem(query)
+        except ValueError as exc:
+            response.update(status="error", error=str(exc))
+            return response
+        for node in (problem.start_node, problem.end_node):
+            if node not in self.CG.node_index:
+                response.update(status="error", error=f"Node {node} not found in the graph.")
+                return response
+
+        key, destination_key = self._od_key(problem), self._destination_key(problem)
+        pheromone, warm_key = None, None
+        if query.get("warm_start", True):
+            pheromone, warm_key = self.od_states.checkout(key, (destination_key,), query.get("warm_start_decay"))
+        warm = pheromone is not None
+        if pheromone is None:
+            pheromone = ACO.initialize_pheromone(ACO.Colony(self.CG, problem, self.v2g_cache))
+
+        # 記下最後一回合的進度 (回合數與停止原因)
+        progress = {}
+        best_path, best_cost, best_charging_cost, best_log, best_time, final_soc = ACO.run_aco(
+            self.CG, problem, v2g_cache=self.v2g_cache, pheromone=pheromone, callback=progress.update,
+        )
+        self.od_states.store(key, pheromone, aliases=(destination_key,))
+
+        with self._lock:
+            self.queries += 1
+        response.update(
+            status="ok" if best_path is not None else "no_path",
+            path=best_path,
+            cost=None if best_path is None else float(best_cost),
+            charging_cost=None if best_path is None else float(best_charging_cost),
+            stations=best_log,
+            travel_time=None if best_time is None else float(best_time),
+            final_soc=None if final_soc is None else float(final_soc),
+            warm_start=warm,
+            warm_start_source=None if warm_key is None else ("od" if warm_key == key else "destination"),
+            iterations=progress.get("iteration", -1) + 1,
+            stop_reason=progress.get("stop_reason"),
+            elapsed=time.monotonic() - started,
+        )
+        return response
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queries": self.queries,
+                "od_states": len(self.od_states),
+                "v2g_cache_hits": self.v2g_cache.hits,
+                "v2g_cache_misses": self.v2g_cache.misses,
+            }
+
+
+def _to_json(obj):
+    # NumPy 純量轉回 Python 數值
+    return json.dumps(obj, ensure_ascii=False, default=lambda value: value.item() if hasattr(value, "item") else str(value))
+
+
+def serve_jsonl(server, infile=sys.stdin, outfile=sys.stdout, max_concurrent=4):
+    """
+    逐行讀入 JSON 查詢, 最多 max_concurrent 筆同時求解, 完成後各輸出一行 (以 id 對應).
+    已讀入但還沒完成的查詢最多 max_concurrent x 2 筆, 輸入比求解快時暫停讀取 (不會把整個輸入排進佇列).
+    """
+    write_lock = threading.Lock()
+    in_flight = threading.BoundedSemaphore(max_concurrent * 2)
+
+    def handle(line):
+        try:
+            query = json.loads(line)
+            response = server.solve(query)
+        except Exception as exc:  # 單筆查詢失敗不影響其他查詢
+            response = {"status": "error", "error": str(exc)}
+        try:
+            with write_lock:
+                outfile.write(_to_json(response) + "\n")
+                outfile.flush()
+        finally:
+            in_flight.release()
+
+    with ThreadPoolExecutor(max_workers=max_concurrent) as executor:
+        for line in infile:
+            if line.strip():
+                in_flight.acquire()
+                executor.submit(handle, line)
+
+
+def serve_http(server, host="127.0.0.1", port=8000):
+    """POST /route (body 為一筆 JSON 查詢), GET /stats"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def _reply(self, code, body):
+            data = _to_json(body).encode("utf-8")
+            self.send_response(code)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/stats":
+                self._reply(200, server.stats())
+            else:
+                self._reply(404, {"status": "error", "error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/route":
+                self._reply(404, {"status": "error", "error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                query = json.loads(self.rfile.read(length))
+            except ValueError as exc:
+                self._reply(400, {"status": "error", "error": str(exc)})
+                return
+            try:
+                response = server.solve(query)
+            except Exception as exc:  # 與 JSONL 模式相同, 單筆查詢失敗仍回覆 JSON
+                self._reply(500, {"status": "error", "error": str(exc)})
+                return
+            self._reply(400 if response["status"] == "error" else 200, response)
+
+    httpd = ThreadingHTTPServer((host, port), Handler)
+    try:
+        httpd.serve_forever()
+    finally:
+        httpd.server_close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="EV routing query server")
+    parser.add_argument("--graph", default=None,
+                        help="二進位圖快取目錄或 GraphML 檔 (預設 Taiwan.graph, 不存在時用 Taiwan.graphml)")
+    parser.add_argument("--v2g-table", default=None, help="預先計算的 V2G 成本表 (npz)")
+    parser.add_argument("--http", type=int, default=None, metavar="PORT", help="以 HTTP 模式在 PORT 上服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--concurrency", type=int, default=4, help="JSONL 模式同時求解的查詢數")
+    parser.add_argument("--time-budget", type=float, default=30, help="查詢未指定時的時間上限 (秒)")
+    parser.add_argument("--patience", type=int, default=None,
+                        help="查詢未指定時, 最佳成本連續幾回合沒有改善就提早回傳")
+    parser.add_argument("--pheromone-dir", default=None, help="保存各 OD 費洛蒙的目錄 (重啟後沿用)")
+    parser.add_argument("--warm-start-decay", type=float, default=0.5,
+                        help="沿用費洛蒙前朝均勻值衰減的比例 (0~1)")
+    args = parser.parse_args()
+
+    CG = load_graph(args.graph)
+    server = RouteServer(
+        CG,
+        V2GCostCache(table_file=args.v2g_table),
+        RoutingProblem(time_budget=args.time_budget, patience=args.patience, v2g_table_file=args.v2g_table),
+        pheromone_dir=args.pheromone_dir,
+        warm_start_decay=args.warm_start_decay,
+    )
+
+    try:
+        if args.http is not None:
+            serve_http(server, args.host, args.http)
+        else:
+            serve_jsonl(server, max_concurrent=args.concurrency)
+    finally:
+        server.flush()
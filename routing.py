@@ -0,0 +1,139 @@
+"""
+路徑規劃的對外介面.
+
+圖只在 load_graph() 時讀取/編譯一次, 之後每次查詢以 RoutingProblem 描述參數,
+直接把已載入的 CompiledGraph 傳給各求解器 (不會在 import 時執行任何計算).
+
+    from routing import load_graph, solve_aco, RoutingProblem
+    CG = load_graph("Taiwan.graph")  # 二進位快取; 也可傳 GraphML 檔
+    result = solve_aco(CG, RoutingProblem(start_node="-144866", end_node="-212207"))
+"""
+import os
+import warnings
+from compiled_graph import load_compiled_graph, load_graph_cache, graph_cache_sources, file_hash
+import landmarks as alt
+from routing_problem import RoutingProblem
+import ACO
+import ACO_ChargeOnly
+import rcsp
+import pso
+import prepath
+import pre
+
+
+# directed_graph.py 的輸出: 二進位快取目錄 (優先使用) 與 GraphML
+default_graph_cache = "Taiwan.graph"
+default_graphml = "Taiwan.graphml"
+
+
+def load_graph(graph_file=None, source_files=None):
+    """
+    讀取圖並編譯成 CompiledGraph, 供後續多次查詢共用.
+    graph_file 為目錄時視為 directed_graph.py 輸出的二進位快取 (mmap 載入), 否則讀取 GraphML;
+    None 代表 default_graph_cache, 快取不存在時才退回解析 default_graphml.
+    快取會與來源檔 (net.xml / 電力軌道 / 充電站文件, 預設為快取建立時記錄的路徑) 的雜湊比對,
+    不一致時 raise ValueError; 找不到來源檔時只發出警告並照常載入.
+    """
+    if graph_file is None:
+        graph_file = default_graph_cache if os.path.isdir(default_graph_cache) else default_graphml
+    if not os.path.isdir(graph_file):
+        return load_compiled_graph(graph_file)
+    if source_files is None:
+        source_files = graph_cache_sources(graph_file)
+    if source_files is None or not all(os.path.exists(path) for path in source_files):
+        warnings.warn(f"Source files of graph cache {graph_file} not found; skipping the staleness check")
+        return load_graph_cache(graph_file)
+    return load_graph_cache(graph_file, expected_hash=file_hash(source_files))
+
+
+def load_landmarks(graph_file, CG, weight="travel_time"):
+    """
+    讀取二進位快取目錄中預先計算的地標表 (landmarks.py / directed_graph.py 建立).
+    graph_file 不是快取目錄、沒有地標表或地標表已過期時回傳 None, 各求解器會退回原本的搜尋方式.
+    """
+    if not os.path.isdir(graph_file):
+        return None
+    try:
+        return alt.load_landmarks(graph_file, CG, weight)
+    except ValueError:
+        return None
+
+
+def shortest_path(CG, source, target, weight="travel_time", landmarks=None, bidirectional=False):
+    """
+    兩個節點名稱之間的最短路徑, 回傳 (成本, 節點名稱路徑), 找不到則回傳 None.
+    有地標表時用 ALT A*; bidirectional=True 時改用雙向 Dijkstra.
+    """
+    s, t = CG.node_index[source], CG.node_index[target]
+    if bidirectional:
+        result = alt.bidirectional_dijkstra(CG, s, t, weight)
+    else:
+        result = alt.alt_shortest_path(CG, s, t, weight, landmarks)
+    if result is None:
+        return None
+    cost, path = result
+    return cost, CG.to_node_path(path)
+
+
+def solve_aco(CG, problem=None, v2g_cache=None, verbose=False, pheromone=None, callback=None):
+    """
+    V2G 版 ACO (ACO.py).
+    回傳 (best_path, best_cost, best_charging_cost, best_log, best_time, final_soc)
+    callback(progress) 每回合結束時呼叫, 回傳 True 代表提早停止.
+    """
+    if problem is None:
+        problem = RoutingProblem()
+    return ACO.run_aco(CG, problem, v2g_cache=v2g_cache, verbose=verbose, pheromone=pheromone, callback=callback)
+
+
+def iter_aco(CG, problem=None, v2g_cache=None, pheromone=None):
+    """V2G 版 ACO 的 anytime 版本: 每回合 yield 目前最佳解的進度 dict (見 ACO.iter_aco)"""
+    if problem is None:
+        problem = RoutingProblem()
+    return ACO.iter_aco(CG, problem, v2g_cache=v2g_cache, pheromone=pheromone)
+
+
+def solve_rcsp(CG, problem=None, v2g_cache=None, soc_resolution=1.0, time_resolution=300.0, landmarks=None):
+    """
+    SOC 感知的 label-setting 求解器 (rcsp.py), 與 solve_aco 使用相同的成本模型.
+    回傳 (best_path, best_cost, best_charging_cost, best_log, best_time, final_soc)
+    """
+    if problem is None:
+        problem = RoutingProblem()
+    return rcsp.solve_rcsp(CG, problem, v2g_cache, soc_resolution, time_resolution, landmarks)
+
+
+def solve_aco_charge_only(CG, problem=None):
+    """
+    只在充電站充電的 ACO (ACO_ChargeOnly.py).
+    回傳 (best_path, best_cost, best_log, best_time, final_soc)
+    """
+    if problem is None:
+        problem = ACO_ChargeOnly.default_problem
+    return ACO_ChargeOnly.run_aco(CG, problem)
+
+
+def solve_pso(CG, problem=None, num_particles=100, num_iterations=200, omega=0.7, c1=1.5, c2=1.5):
+    """
+    以 PSO 選邊 (pso.py).
+    回傳 (selected_edges, total_cost, is_valid)
+    """
+    if problem is None:
+        problem = RoutingProblem()
+    return pso.run_pso(CG, problem, num_particles, num_iterations, omega, c1, c2)
+
+
+def find_charging_paths(CG, problem=None, K=prepath.K, weight="travel_time", limit=None, landmarks=None):
+    """前 K 短路徑中經過充電站的路徑 (最多 limit 條), 以節點名稱回傳"""
+    if problem is None:
+        problem = RoutingProblem()
+    paths = prepath.find_charging_paths(CG, problem, K, weight, limit, landmarks)
+    return [CG.to_node_path(path) for path in paths]
+
+
+def find_valid_paths(CG, problem=None, K=pre.K, weight="travel_time", limit=None, landmarks=None):
+    """通過充電模擬驗證的前 K 短路徑 (找到 limit 條即停止), 以節點名稱回傳"""
+    if problem is None:
+        problem = pre.default_problem
+    paths = pre.find_valid_paths(CG, problem, K, weight, limit, landmarks)
+    return [CG.to_node_path(path) for path in paths]
@@ -0,0 +1,87 @@
+class RoutingProblem:
+    """
+    一次路徑查詢的所有參數 (起訖點、電池/SOC 限制、電價與 ACO 參數).
+    預設值與原本 ACO.py 的設定相同; 起訖點使用 GraphML 中的節點名稱.
+    """
+
+    def __init__(self,
+                 start_node="-144866",
+                 end_node="-212207",
+                 initial_soc=80,                    # 起始電量 (百分比)
+                 target_soc=90,                     # 目標電量 (百分比)
+                 min_soc=20,                        # 行駛中最低電量 (百分比)
+                 maximum_power=60000,               # 電池最大容量 (Wh)
+                 max_time=3600 * 2,                 # 最大行駛時間 (秒)
+                 charging_cost_per_kWh_peak=0.3,
+                 charging_cost_per_kWh_offpeak=0.2,
+                 peak_time_limit=1.5 * 3600,        # 出發後多少秒內算尖峰
+                 energy_consumption_per_m=0.2,      # 每米耗電量 (Wh)
+                 charging_station_power=80,         # kW
+                 power_track_power=12,              # kW
+                 power_track_length=200,            # m
+                 # 螞蟻群算法參數
+                 num_ants=300,
+                 iterations=300,
+                 alpha=4,
+                 beta=4,
+                 rho=0.1,
+                 Q=100,
+                 min_pheromone=1e-6,
+                 charging_options=None,             # None => 使用各求解器的預設選項
+                 num_workers=1,
+                 random_seed=None,
+                 use_transition_table=True,
+                 v2g_table_file=None,
+                 time_budget=None,                  # 單次求解的時間上限 (秒), None 代表跑完所有 iterations
+                 patience=None,                     # 最佳成本連續幾回合沒有改善就停止, None 代表不檢查
+                 min_improvement=0.0,               # 成本相對下降超過此比例才算改善
+                 min_branching_factor=None):        # 最佳路徑上費洛蒙的 λ-branching factor 降到此值以下就停止
+        self.start_node = start_node
+        self.end_node = end_node
+        self.initial_soc = initial_soc
+        self.target_soc = target_soc
+        self.min_soc = min_soc
+        self.maximum_power = maximum_power
+        self.max_time = max_time
+        self.charging_cost_per_kWh_peak = charging_cost_per_kWh_peak
+        self.charging_cost_per_kWh_offpeak = charging_cost_per_kWh_offpeak
+        self.peak_time_limit = peak_time_limit
+        self.energy_consumption_per_m = energy_consumption_per_m
+        self.charging_station_power = charging_station_power
+        self.power_track_power = power_track_power
+        self.power_track_length = power_track_length
+        self.num_ants = num_ants
+        self.iterations = iterations
+        self.alpha = alpha
+        self.beta = beta
+        self.rho = rho
+        self.Q = Q
+        self.min_pheromone = min_pheromone
+        self.charging_options = charging_options
+        self.num_workers = num_workers
+        self.random_seed = random_seed
+        self.use_transition_table = use_transition_table
+        self.v2g_table_file = v2g_table_file
+        self.time_budget = time_budget
+        self.patience = patience
+        self.min_improvement = min_improvement
+        self.min_branching_factor = min_branching_factor
+
+    def replace(self, **changes):
+        """回傳修改部分參數後的新 RoutingProblem (原物件不變)"""
+        params = dict(vars(self))
+        unknown = set(changes) - set(params)
+        if unknown:
+            raise TypeError(f"Unknown RoutingProblem parameters: {sorted(unknown)}")
+        params.update(changes)
+        return RoutingProblem(**params)
+
+    def cost_rate(self, time_spent):
+        """依出發後經過的秒數判斷尖峰/離峰電價"""
+        if time_spent < self.peak_time_limit:
+            return self.charging_cost_per_kWh_peak
+        return self.charging_cost_per_kWh_offpeak
+
+    def __repr__(self):
+        params = ", ".join(f"{key}={value!r}" for key, value in vars(self).items())
+        return f"RoutingProblem({params})"
@@ -1,6 +1,20 @@
 import math
+import random
+import numpy as np
 import pulp
 
+# 電池與充放電功率參數 (v2g_milp_optimize 的兩種求解模式共用)
+battery_kwh = 60
+max_charge_power = 80
+max_discharge_power = 50
+
+# 電價時段參數 (generate_time_slices 與批次解析解共用)
+day_start_minutes = 9*60      # current_time=0 對應 09:00
+slot_length_minutes = 5       # 時間片長度 (分鐘)
+peak_end_minutes = 600        # 10:00 以前為尖峰
+peak_price = 0.3
+offpeak_price = 0.2
+
 def generate_time_slices(current_time, stop_duration_minutes):
     """
     根據現在時刻與停留總分鐘數，自動切分出對應的時間片 (time slots)，
@@ -15,13 +29,12 @@ def generate_time_slices(current_time, stop_duration_minutes):
       - T: 時間片數
     """
     # 1. 解析 current_time => 09:15 => hour=9, minute=15
-    start_total_minutes = 9*60 + current_time/60  # e.g. 9*60+15=555
+    start_total_minutes = day_start_minutes + current_time/60  # e.g. 9*60+15=555
 
     # 2. 計算 "結束時間 (總分鐘數)"
     end_total_minutes = start_total_minutes + stop_duration_minutes  # e.g. 555+50=605 => 10:05
 
-    # 這邊用 "5 分鐘" 為離散單位 (自行調整)
-    slot_length_minutes = 5
+    # 這邊用 "5 分鐘" 為離散單位 (自行調整 slot_length_minutes)
     delta_t_hours = slot_length_minutes / 60  # => 5/60=0.0833小時
 
     # 3. 依序切出一個個 5 分鐘區塊, 判斷它落在哪個電價區
@@ -39,10 +52,10 @@ def generate_time_slices(current_time, stop_duration_minutes):
         #   09:00~10:00 => total_minutes in [540, 600) => price=0.3
         #   10:00~11:00 => total_minutes in [600, 660) => price=0.2
         # 先以當下 slot 開始時間為基準 (或中間點亦可)
-        if current_min < 600:
-            price = 0.3  # 尖峰
+        if current_min < peak_end_minutes:
+            price = peak_price  # 尖峰
         else:
-            price = 0.2  # 離峰
+            price = offpeak_price  # 離峰
 
         prices.append(price)
 
@@ -51,16 +64,157 @@ def generate_time_slices(current_time, stop_duration_minutes):
     T = len(prices)  # time slot 數量
     return prices, delta_t_hours, T
 
-def v2g_milp_optimize(current_time, stop_duration_minutes, initial_soc, final_soc,):
+def v2g_milp_optimize(current_time, stop_duration_minutes, initial_soc, final_soc, solver="greedy"):
     """
-    用 MILP 做 V2G 最佳化, 類似前面範例.
+    V2G 最佳化: 在停留期間決定每個時間片的充/放電功率, 使電費最小.
+    - solver="greedy": 純 NumPy 的解析解 (預設, 不需啟動求解器)
+    - solver="cbc":    原本的 PuLP/CBC LP 模型, 保留作為驗證用
+    兩者回傳相同格式: (status, total_cost, delta_soc)
     """
     if stop_duration_minutes == 0:
         return 'Feasible',0,0
-    battery_kwh = 60
-    max_charge_power = 80
-    max_discharge_power = 50
     prices, delta_t_hours, T = generate_time_slices(current_time, stop_duration_minutes)
+
+    if solver == "greedy":
+        status, total_cost_val = v2g_greedy_solve(prices, delta_t_hours, initial_soc, final_soc)
+    elif solver == "cbc":
+        status, total_cost_val = v2g_lp_solve(prices, delta_t_hours, initial_soc, final_soc)
+    else:
+        raise ValueError(f"Unknown V2G solver: {solver}")
+
+    return status, total_cost_val, final_soc-initial_soc
+
+
+def v2g_batch_optimize(current_times, stop_duration_minutes, initial_socs, final_socs):
+    """
+    批次版 v2g_milp_optimize: 輸入為同長度的陣列 (或可 broadcast 的純量),
+    一次回傳 (statuses, total_costs, delta_socs) 三個陣列.
+
+    generate_time_slices 的電價最多只有兩段 (尖峰 -> 離峰), 所以最佳解只取決於
+    兩段交界時的電量 E_mid: 尖峰段與離峰段各自單調充/放電即可, 成本為
+        peak_price*(E_mid-E0) + offpeak_price*(E_final-E_mid)
+    E_mid 的可行範圍由兩段的充/放電功率上限與電池容量決定, 全部用陣列運算求出.
+    不可行的情境 status 為 'Infeasible', cost 為 nan.
+    """
+    current_times, durations, initial_socs, final_socs = np.broadcast_arrays(
+        np.asarray(current_times, dtype=np.float64),
+        np.asarray(stop_duration_minutes, dtype=np.float64),
+        np.asarray(initial_socs, dtype=np.float64),
+        np.asarray(final_socs, dtype=np.float64),
+    )
+    delta_t_hours = slot_length_minutes / 60
+
+    # 每個情境的時間片數, 以及其中屬於尖峰的時間片數
+    start_minutes = day_start_minutes + current_times / 60
+    num_slots = np.ceil(durations / slot_length_minutes)
+    num_peak = np.clip(np.ceil((peak_end_minutes - start_minutes) / slot_length_minutes), 0, num_slots)
+    num_offpeak = num_slots - num_peak
+
+    start_kwh = initial_socs / 100 * battery_kwh
+    final_kwh = final_socs / 100 * battery_kwh
+    charge_per_slot = max_charge_power * delta_t_hours
+    discharge_per_slot = max_discharge_power * delta_t_hours
+
+    # 兩段交界時電量 E_mid 的可行範圍
+    mid_low = np.maximum.reduce([
+        np.zeros_like(start_kwh),
+        start_kwh - num_peak * discharge_per_slot,
+        final_kwh - num_offpeak * charge_per_slot,
+    ])
+    mid_high = np.minimum.reduce([
+        np.full_like(start_kwh, battery_kwh),
+        start_kwh + num_peak * charge_per_slot,
+        final_kwh + num_offpeak * discharge_per_slot,
+    ])
+
+    feasible = (
+        (mid_low <= mid_high + 1e-9)
+        & (initial_socs >= 0) & (initial_socs <= 100)
+        & (final_socs >= 0) & (final_socs <= 100)
+    )
+    # 尖峰較貴 => 交界時電量越低越好 (尖峰放電/少充, 離峰再充回)
+    if peak_price >= offpeak_price:
+        mid_kwh = mid_low
+    else:
+        mid_kwh = mid_high
+    costs = peak_price * (mid_kwh - start_kwh) + offpeak_price * (final_kwh - mid_kwh)
+
+    idle = durations == 0
+    costs = np.where(feasible, costs, np.nan)
+    costs[idle] = 0.0
+    delta_socs = np.where(idle, 0.0, final_socs - initial_socs)
+    statuses = np.where(feasible, 'Optimal', 'Infeasible').astype(object)
+    statuses[idle] = 'Feasible'
+
+    return statuses, costs, delta_socs
+
+
+def price_runs(prices):
+    """將電價序列壓縮成連續同價的區段, 回傳 (每段電價, 每段時間片數)"""
+    prices = np.asarray(prices, dtype=np.float64)
+    starts = np.concatenate(([0], np.flatnonzero(np.diff(prices)) + 1))
+    lengths = np.diff(np.concatenate((starts, [len(prices)])))
+    return prices[starts], lengths
+
+
+def v2g_greedy_solve(prices, delta_t_hours, initial_soc, final_soc, tol=1e-9):
+    """
+    與 v2g_lp_solve 相同的單一電池 LP, 但利用其結構直接求解:
+     1) 同價的連續時間片可合併成一段 (段內維持單調充/放電, SOC 不會越界)
+     2) 先把所需電量依各段上限平均分配, 得到一個可行解
+     3) 反覆把電量從貴的段移到便宜的段 (便宜時充電、貴時放電),
+        移動量受功率上下限與中間 SOC 0~100% 限制, 直到無法再降低成本
+    這是時間軸上的最小成本流, 無法再交換即為最佳解.
+    """
+    if not (0 <= initial_soc <= 100 and 0 <= final_soc <= 100):
+        return 'Infeasible', None
+
+    run_prices, run_lengths = price_runs(prices)
+    R = len(run_prices)
+    # 以 kWh 表示每段淨充電量 x[r] 的上下限
+    upper = run_lengths * max_charge_power * delta_t_hours
+    lower = -run_lengths * max_discharge_power * delta_t_hours
+    start_kwh = initial_soc / 100 * battery_kwh
+    need = (final_soc - initial_soc) / 100 * battery_kwh
+
+    if need > upper.sum() + tol or need < lower.sum() - tol:
+        return 'Infeasible', None
+
+    # 可行初始解: 依各段容量比例分配
+    capacity = upper if need >= 0 else lower
+    x = need * capacity / capacity.sum()
+
+    for _ in range(10 * R * R + 10):
+        # energy[k]: 第 k 段開始前的電量 (kWh), k = 0..R
+        energy = start_kwh + np.concatenate(([0.0], np.cumsum(x)))
+        best_gain, best_move = tol, None
+        for i in range(R):          # 多充電的段
+            for j in range(R):      # 少充電的段
+                gain = run_prices[j] - run_prices[i]
+                if gain <= best_gain:
+                    continue
+                room = min(upper[i] - x[i], x[j] - lower[j])
+                if i < j:
+                    # i~j 之間電量上升, 不可超過電池容量
+                    room = min(room, battery_kwh - energy[i + 1:j + 1].max())
+                else:
+                    # j~i 之間電量下降, 不可低於 0
+                    room = min(room, energy[j + 1:i + 1].min())
+                if room > tol:
+                    best_gain, best_move = gain, (i, j, room)
+        if best_move is None:
+            break
+        i, j, room = best_move
+        x[i] += room
+        x[j] -= room
+
+    return 'Optimal', float(np.dot(run_prices, x))
+
+
+def v2g_lp_solve(prices, delta_t_hours, initial_soc, final_soc):
+    """
+    用 PuLP/CBC 解 V2G LP (原本的模型).
+    """
     T = len(prices)
 
     model = pulp.LpProblem("V2G_Optimization", pulp.LpMinimize)
@@ -103,7 +257,7 @@ def v2g_milp_optimize(current_time, stop_duration_minutes, initial_soc, final_so
     soc_opt = [soc[t].varValue for t in range(T+1)]
     total_cost_val = pulp.value(model.objective)
     
-    return status, total_cost_val, final_soc-initial_soc
+    return status, total_cost_val
 
     """return {
         "status": status,
@@ -112,6 +266,39 @@ def v2g_milp_optimize(current_time, stop_duration_minutes, initial_soc, final_so
         "soc": soc_opt
     }"""
 
+
+def cross_check_v2g(num_cases=200, seed=0, tol=1e-6):
+    """
+    隨機產生停留情境, 比對 greedy 與 CBC 兩種模式的 status / cost / delta_soc.
+    回傳不一致的情境列表 (空列表代表全部一致).
+    """
+    rng = random.Random(seed)
+    mismatches = []
+    cases = []
+    for _ in range(num_cases):
+        current_time = rng.uniform(0, 3 * 3600)
+        duration = rng.choice([rng.randint(1, 120), rng.choice([15, 30, 45, 60])])
+        initial_soc = rng.choice([rng.uniform(0, 100), rng.uniform(-10, 110), 100])
+        final_soc = rng.choice([rng.uniform(0, 100), 80, 90, 100])
+
+        cases.append((current_time, duration, initial_soc, final_soc))
+
+    # 批次解析解也一併比對
+    batch = v2g_batch_optimize(*zip(*cases))
+
+    def same(result, exact):
+        same_status = (result[0] == 'Optimal') == (exact[0] == 'Optimal')
+        same_cost = exact[0] != 'Optimal' or abs(result[1] - exact[1]) <= tol * max(1.0, abs(exact[1]))
+        return same_status and same_cost and abs(result[2] - exact[2]) <= tol
+
+    for n, case in enumerate(cases):
+        exact = v2g_milp_optimize(*case, solver="cbc")
+        fast = v2g_milp_optimize(*case, solver="greedy")
+        batched = (batch[0][n], batch[1][n], batch[2][n])
+        if not (same(fast, exact) and same(batched, exact)):
+            mismatches.append((case, fast, batched, exact))
+    return mismatches
+
 if __name__ == "__main__":
     # 假設使用者說: 我現在是09:15, 要停留 50 分鐘, initial_soc=50%, final_soc=80%
     # 呼叫 V2G MILP
@@ -123,6 +310,12 @@ if __name__ == "__main__":
     )
 
     print(result)
+
+    # 驗證 greedy / 批次解析解與 CBC 結果一致
+    mismatches = cross_check_v2g()
+    print("greedy/batch vs CBC mismatches:", len(mismatches))
+    for case in mismatches:
+        print(case)
     '''print("status:", result["status"])
     print("total_cost:", result["total_cost"])
     print("p:", result["p"])
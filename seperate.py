@@ -1,32 +1,85 @@
+import os
+import tempfile
 import xml.etree.ElementTree as ET
+from xml_stream import open_xml, iter_top_level
+
+
+def attribute_equals(name, value):
+    """產生判斷條件: 元素屬性 name 等於 value"""
+    return lambda attrib: attrib.get(name) == value
+
+
+def root_tag(input_file):
+    """只讀到第一個 start 事件, 取得根節點標籤"""
+    with open_xml(input_file) as f:
+        for _, elem in ET.iterparse(f, events=('start',)):
+            return elem.tag
+
+
+def split_additional(input_file, outputs, default_output=None):
+    """
+    單次串流將 additional 檔的第一層元素依條件分到多個檔案.
+    outputs:        [(輸出檔, predicate), ...], predicate 接收元素屬性 dict,
+                    元素寫入第一個成立的輸出
+    default_output: 沒有任何條件成立的元素寫到這裡 (None 則捨棄)
+    先寫到同目錄的暫存檔, 全部完成後才 rename, 因此輸出檔可以與輸入檔相同.
+    回傳各輸出檔寫入的元素數.
+    """
+    targets = list(outputs)
+    if default_output is not None:
+        targets.append((default_output, lambda attrib: True))
+
+    tag = root_tag(input_file)
+    counts = {path: 0 for path, _ in targets}
+    temp_files = {}
+    try:
+        for path, _ in targets:
+            if path in temp_files:
+                continue
+            fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(path)), suffix='.tmp')
+            f = os.fdopen(fd, 'w', encoding='utf-8')
+            f.write(f"<?xml version='1.0' encoding='utf-8'?>\n<{tag}>\n")
+            temp_files[path] = (temp_path, f)
+
+        for elem in iter_top_level(input_file):
+            for path, predicate in targets:
+                if predicate(elem.attrib):
+                    elem.tail = None
+                    temp_files[path][1].write("    " + ET.tostring(elem, encoding='unicode') + "\n")
+                    counts[path] += 1
+                    break
+
+        for temp_path, f in temp_files.values():
+            f.write(f"</{tag}>\n")
+            f.close()
+        for path, (temp_path, _) in temp_files.items():
+            # mkstemp 建立的檔案權限為 0600, 改回原檔 (或一般檔案) 的權限
+            os.chmod(temp_path, os.stat(path).st_mode & 0o777 if os.path.exists(path) else 0o644)
+            os.replace(temp_path, path)
+    except BaseException:
+        for temp_path, f in temp_files.values():
+            f.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        raise
+    return counts
+
 
 def split_charge_in_transit(input_file, output_file_with_charge, output_file_without_charge):
-    # 讀取原始 XML 文件
-    tree = ET.parse(input_file)
-    root = tree.getroot()
-
-    # 建立兩個新的 XML 根節點
-    root_with_charge = ET.Element(root.tag)
-    root_without_charge = ET.Element(root.tag)
-
-    # 遍歷所有子節點，按條件分類
-    for elem in root:
-        if elem.attrib.get("chargeInTransit") == "1":
-            root_with_charge.append(elem)  # chargeInTransit='1'
-        else:
-            root_without_charge.append(elem)  # 其他元素
-
-    # 將有 chargeInTransit='1' 的元素保存到指定文件
-    tree_with_charge = ET.ElementTree(root_with_charge)
-    tree_with_charge.write(output_file_with_charge, encoding="utf-8", xml_declaration=True)
-
-    # 將沒有 chargeInTransit='1' 的元素保存到另一個文件
-    tree_without_charge = ET.ElementTree(root_without_charge)
-    tree_without_charge.write(output_file_without_charge, encoding="utf-8", xml_declaration=True)
-
-# 使用範例
-input_file = "charging_stations_add_Taiwan.xml"  # 原始 XML 文件
-output_file_with_charge = "power_track_add_Taiwan.xml"  # 含有 chargeInTransit='1' 的元素
-output_file_without_charge = "charging_stations_add_Taiwan.xml"  # 不含 chargeInTransit='1' 的元素
-
-split_charge_in_transit(input_file, output_file_with_charge, output_file_without_charge)
+    # chargeInTransit='1' 的元素 (充電道路) 與其他元素 (一般充電站) 分開
+    return split_additional(
+        input_file,
+        [(output_file_with_charge, attribute_equals("chargeInTransit", "1"))],
+        default_output=output_file_without_charge,
+    )
+
+
+if __name__ == "__main__":
+    # 使用範例 (輸出可以覆寫輸入檔)
+    input_file = "charging_stations_add_Taiwan.xml"  # 原始 XML 文件
+    output_file_with_charge = "power_track_add_Taiwan.xml"  # 含有 chargeInTransit='1' 的元素
+    output_file_without_charge = "charging_stations_add_Taiwan.xml"  # 不含 chargeInTransit='1' 的元素
+
+    counts = split_charge_in_transit(input_file, output_file_with_charge, output_file_without_charge)
+    for path, count in counts.items():
+        print(f"{path}: {count}")
@@ -0,0 +1,80 @@
+import networkx as nx
+import pytest
+
+import ACO
+from compiled_graph import compile_graph
+from routing_problem import RoutingProblem
+
+
+def _line_graph():
+    G = nx.DiGraph()
+    G.add_edge("a", "b", length=100, travel_time=10, speed=10)
+    G.add_edge("b", "c", length=100, travel_time=10, speed=10)
+    return compile_graph(G)
+
+
+class _FakeAnt:
+    """直接抵達終點的螞蟻, 成本由測試指定"""
+
+    def __init__(self, cost):
+        self.current_node = 2
+        self.soc = 100
+        self.total_cost = cost
+        self.charging_cost = 0.0
+        self.time_spent = 20.0
+        self.path = [0, 1, 2]
+        self.edges = [0, 1]
+        self.stations_log = []
+
+
+def _run(monkeypatch, costs, **changes):
+    """第 i 回合的螞蟻成本為 costs[i], 回傳每回合的進度"""
+    costs = iter(costs)
+    monkeypatch.setattr(ACO, "construct_ants", lambda *args: [_FakeAnt(next(costs))])
+    problem = RoutingProblem(start_node="a", end_node="c", use_transition_table=False, **changes)
+    return list(ACO.iter_aco(_line_graph(), problem))
+
+
+def test_improving_run_is_not_stopped(monkeypatch):
+    steps = _run(monkeypatch, [10.0 - i for i in range(8)], iterations=8, patience=2)
+    assert len(steps) == 8
+    assert all(step["improved"] and step["stall"] == 0 for step in steps)
+    assert steps[-1]["stop_reason"] == "iterations"
+    assert steps[-1]["best_cost"] == pytest.approx(3.0)
+    assert steps[-1]["best_path"] == ["a", "b", "c"]
+
+
+def test_plateau_stops_after_patience(monkeypatch):
+    steps = _run(monkeypatch, [5.0, 4.0] + [4.0] * 10, iterations=12, patience=3)
+    assert [step["stall"] for step in steps] == [0, 0, 1, 2, 3]
+    assert steps[-1]["stop_reason"] == "stagnation"
+
+
+def test_min_improvement_is_relative(monkeypatch):
+    # 每回合只下降 0.1%, 低於 1% 的門檻 => 不算改善
+    steps = _run(monkeypatch, [100.0 * 0.999 ** i for i in range(10)],
+                 iterations=10, patience=2, min_improvement=0.01)
+    assert steps[-1]["stop_reason"] == "stagnation"
+    assert len(steps) == 3
+
+
+def test_callback_stops_run_aco(monkeypatch):
+    costs = iter([10.0 - i for i in range(8)])
+    monkeypatch.setattr(ACO, "construct_ants", lambda *args: [_FakeAnt(next(costs))])
+    problem = RoutingProblem(start_node="a", end_node="c", use_transition_table=False, iterations=8)
+    seen = []
+    result = ACO.run_aco(_line_graph(), problem, callback=lambda step: seen.append(step) or len(seen) == 3)
+    assert len(seen) == 3
+    assert result[1] == pytest.approx(8.0)
+
+
+def test_parallel_run_is_reproducible():
+    G = nx.DiGraph()
+    for u, v in [("a", "b"), ("b", "c"), ("a", "d"), ("d", "c"), ("b", "d"), ("d", "b")]:
+        G.add_edge(u, v, length=100, travel_time=10, speed=10)
+    problem = RoutingProblem(start_node="a", end_node="c", target_soc=10, num_ants=8, iterations=3,
+                             num_workers=2, random_seed=5)
+    first = ACO.run_aco(compile_graph(G), problem)
+    second = ACO.run_aco(compile_graph(G), problem)
+    assert first[0] is not None
+    assert first[:2] == second[:2]
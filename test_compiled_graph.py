@@ -0,0 +1,44 @@
+import os
+import warnings
+
+import networkx as nx
+import pytest
+
+from compiled_graph import compile_graph, file_hash, save_graph_cache, graph_cache_sources
+from routing import load_graph
+
+
+def _cache(tmp_path):
+    G = nx.DiGraph()
+    G.add_edge("a", "b", length=100, travel_time=10, speed=10)
+    G.add_edge("b", "a", length=100, travel_time=10, speed=10)
+    sources = [str(tmp_path / "net.xml"), str(tmp_path / "stations.xml")]
+    for path in sources:
+        with open(path, "w") as f:
+            f.write(os.path.basename(path))
+    cache_dir = str(tmp_path / "graph")
+    save_graph_cache(compile_graph(G), cache_dir, file_hash(sources), sources)
+    return cache_dir, sources
+
+
+def test_load_graph_locates_recorded_sources(tmp_path):
+    cache_dir, sources = _cache(tmp_path)
+    assert graph_cache_sources(cache_dir) == sources
+    assert load_graph(cache_dir).num_nodes == 2
+
+
+def test_load_graph_rejects_stale_cache(tmp_path):
+    cache_dir, sources = _cache(tmp_path)
+    with open(sources[0], "w") as f:
+        f.write("changed")
+    with pytest.raises(ValueError):
+        load_graph(cache_dir)
+
+
+def test_load_graph_warns_without_sources(tmp_path):
+    cache_dir, sources = _cache(tmp_path)
+    os.remove(sources[0])
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        assert load_graph(cache_dir).num_nodes == 2
+    assert caught
@@ -0,0 +1,61 @@
+import os
+import shutil
+
+import pytest
+
+import directed_graph
+from compiled_graph import compile_graph, file_hash, save_graph_cache
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+NET = os.path.join(HERE, "osm.net.xml.gz")
+POWER_TRACK = os.path.join(HERE, "power_track_add_Taiwan.xml")
+STATIONS = os.path.join(HERE, "charging_stations_add_Taiwan.xml")
+
+
+@pytest.fixture(scope="module")
+def built_graph():
+    if not all(os.path.exists(path) for path in (NET, POWER_TRACK, STATIONS)):
+        pytest.skip("sample SUMO network not available")
+    _, scc, stats = directed_graph.build_graph(NET, POWER_TRACK, STATIONS)
+    return compile_graph(scc), stats
+
+
+def _cache(tmp_path, built_graph, network_index=True):
+    cg, stats = built_graph
+    net = str(tmp_path / "net.xml.gz")
+    shutil.copy(NET, net)
+    cache_dir = str(tmp_path / "graph")
+    sources = [net, POWER_TRACK, STATIONS]
+    save_graph_cache(cg, cache_dir, file_hash(sources), sources, file_hash([net]))
+    directed_graph.save_station_records(cache_dir, stats["station_records"])
+    if network_index:
+        directed_graph.save_network_index(cache_dir, *stats["network_index"])
+    return cache_dir, net
+
+
+def test_update_with_same_network(tmp_path, built_graph):
+    cache_dir, net = _cache(tmp_path, built_graph)
+    diff = directed_graph.update_graph_cache(cache_dir, POWER_TRACK, STATIONS, net)
+    assert diff["changed_edges"] == 0 and diff["changed_nodes"] == 0
+
+
+@pytest.mark.parametrize("network_index", [True, False])
+def test_update_with_same_stations_matches_build(tmp_path, built_graph, network_index):
+    # 沒有快取索引時由 net_file 重建, 結果須與完整建圖相同
+    cache_dir, net = _cache(tmp_path, built_graph, network_index)
+    cg, stats = built_graph
+    diff = directed_graph.update_graph_cache(cache_dir, POWER_TRACK, STATIONS, net)
+    assert diff["unmatched_station_lanes"] == stats["unmatched_station_lanes"]
+    for kind in ("power_track", "charging_station"):
+        assert diff[kind] == {"added": [], "removed": [], "changed": []}
+    updated = directed_graph.load_graph_cache(cache_dir)
+    assert (updated.is_charging == cg.is_charging).all()
+    assert (updated.station_mask == cg.station_mask).all()
+
+
+def test_update_refuses_changed_network(tmp_path, built_graph):
+    cache_dir, net = _cache(tmp_path, built_graph)
+    with open(net, "ab") as f:
+        f.write(b"\0")
+    with pytest.raises(ValueError):
+        directed_graph.update_graph_cache(cache_dir, POWER_TRACK, STATIONS, net)
@@ -0,0 +1,54 @@
+import networkx as nx
+import pulp
+import pytest
+
+import milp
+from compiled_graph import compile_graph
+
+cbc_available = pytest.mark.skipif(not pulp.PULP_CBC_CMD(msg=False).available(), reason="CBC is not installed")
+
+
+def _graph(edges, stations=()):
+    G = nx.DiGraph()
+    for u, v, length in edges:
+        G.add_edge(u, v, length=length, travel_time=length / 16, speed=16)
+    for u in stations:
+        G.nodes[u]["is_charging_station"] = True
+    return compile_graph(G)
+
+
+# s -> p -> q -> t 電量不夠, 唯一的充電站 A 只能經由 q -> A -> p 再走一次 p -> q
+_REVISIT = [("s", "p", 5000), ("p", "q", 5000), ("q", "A", 5000), ("A", "p", 5000), ("q", "t", 5000)]
+
+
+def test_decomposition_does_not_return_a_route_that_revisits_nodes():
+    CG = _graph(_REVISIT, stations=["A"])
+    model = milp.PathChargingModel(CG, "s", "t", 10, 10, 60.0)
+    status, cost, x_values, soc, charge = milp.solve_with_decomposition(model, fallback=None)
+    assert status == "NotSolved"
+    assert x_values is None
+
+
+@cbc_available
+def test_decomposition_falls_back_to_milp_on_revisits():
+    CG = _graph(_REVISIT, stations=["A"])
+    status, cost, edges, soc, charge = milp.solve_path_charging(CG, "s", "t", 10, 10, 60.0, backend="decomposition")
+    assert status == "Infeasible"
+    assert cost is None
+
+
+@cbc_available
+def test_decomposition_matches_cbc():
+    CG = _graph(
+        [("s", "a", 20000), ("a", "t", 20000), ("s", "A", 10000), ("A", "b", 15000), ("b", "t", 20000)],
+        stations=["A"],
+    )
+    results = {
+        backend: milp.solve_path_charging(CG, "s", "t", 20, 30, 60.0, backend=backend)
+        for backend in ("decomposition", "cbc")
+    }
+    for status, cost, edges, soc, charge in results.values():
+        assert status == "Optimal"
+        assert all(0 <= value <= 60.0 + 1e-6 for value in soc.values())
+    assert results["decomposition"][1] == pytest.approx(results["cbc"][1], rel=1e-6)
+    assert sorted(results["decomposition"][2]) == sorted(results["cbc"][2])
@@ -0,0 +1,73 @@
+import networkx as nx
+import numpy as np
+import pytest
+
+import pre
+from compiled_graph import compile_graph, path_weight
+from ksp import k_shortest_paths
+
+
+def _parallel_graph():
+    G = nx.MultiDiGraph()
+    # a -> b 有兩條平行邊, 第一條較慢也較長
+    G.add_edge("a", "b", length=3000, travel_time=300, speed=10)
+    G.add_edge("a", "b", length=1000, travel_time=100, speed=10)
+    G.add_edge("b", "c", length=1000, travel_time=100, speed=10)
+    G.add_edge("b", "c", length=500, travel_time=100, speed=5)
+    return compile_graph(G)
+
+
+def test_cheapest_parallel_edges():
+    cg = _parallel_graph()
+    w = cg.travel_time
+    cheapest = cg.cheapest_parallel_edges("travel_time")
+    for e in range(cg.num_edges):
+        siblings = cg.edge_indices(int(cg.sources[e]), int(cg.targets[e]))
+        assert w[cheapest[e]] == min(w[k] for k in siblings)
+        # 同權重時取 edge index 較小者
+        assert cheapest[e] == min(k for k in siblings if w[k] == w[cheapest[e]])
+
+
+def test_simulation_uses_the_searched_edges():
+    cg = _parallel_graph()
+    a, c = cg.node_index["a"], cg.node_index["c"]
+    (path,) = k_shortest_paths(cg, a, c, 1)
+    _, _, total_time = pre.simulate_paths_with_charging(cg, [path], 80, 60000, 0.2)
+    assert total_time[0] == pytest.approx(path_weight(cg, path))
+    assert cg.edge_index_array([a], [cg.node_index["b"]], "travel_time")[0] == cg.edge_index(a, cg.node_index["b"], "travel_time")
+    assert np.array_equal(cg.edge_index_array([a], [c]), [-1])
+
+
+def _grid_problem():
+    G = nx.grid_2d_graph(4, 4).to_directed()
+    G = nx.relabel_nodes(G, lambda node: f"{node[0]}_{node[1]}")
+    nx.set_edge_attributes(G, 100, "length")
+    nx.set_edge_attributes(G, 10, "travel_time")
+    nx.set_edge_attributes(G, 10, "speed")
+    for node in G.nodes:
+        G.nodes[node]["is_charging_station"] = True
+    problem = pre.default_problem.replace(start_node="0_0", end_node="3_3", random_seed=0)
+    return compile_graph(G), problem
+
+
+def test_limit_stops_the_path_search_early(monkeypatch):
+    cg, problem = _grid_problem()
+    generated = []
+    iter_charging_paths = pre.iter_charging_paths
+
+    def counting(*args):
+        for path in iter_charging_paths(*args):
+            generated.append(path)
+            yield path
+    monkeypatch.setattr(pre, "iter_charging_paths", counting)
+
+    assert len(pre.find_valid_paths(cg, problem, K=200, limit=1)) == 1
+    assert len(generated) == 1
+
+
+def test_results_do_not_depend_on_batch_size(monkeypatch):
+    cg, problem = _grid_problem()
+    expected = pre.find_valid_paths(cg, problem, K=50)
+    monkeypatch.setattr(pre, "batch_size", 1)
+    assert pre.find_valid_paths(cg, problem, K=50) == expected
+    assert len(expected) > 1
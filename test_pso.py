@@ -0,0 +1,19 @@
+import networkx as nx
+
+from compiled_graph import compile_graph
+from routing import solve_pso
+from routing_problem import RoutingProblem
+
+
+def test_solve_pso_finds_a_connected_selection():
+    G = nx.DiGraph()
+    for u, v in [("a", "b"), ("b", "c"), ("a", "c"), ("c", "a")]:
+        G.add_edge(u, v, length=100, travel_time=10, speed=10, is_charging=(u, v) == ("b", "c"))
+    problem = RoutingProblem(start_node="a", end_node="c", random_seed=0)
+    first = solve_pso(compile_graph(G), problem, num_particles=10, num_iterations=5)
+    second = solve_pso(compile_graph(G), problem, num_particles=10, num_iterations=5)
+    selected_edges, total_cost, is_valid = first
+    assert is_valid
+    assert ("a", "c") in selected_edges or {("a", "b"), ("b", "c")} <= set(selected_edges)
+    assert total_cost >= 0
+    assert first == second
@@ -0,0 +1,106 @@
+import json
+import socket
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import networkx as nx
+import pytest
+
+from compiled_graph import compile_graph
+from route_server import RouteServer, serve_http, serve_jsonl
+from routing_problem import RoutingProblem
+
+
+@pytest.fixture(scope="module")
+def server():
+    G = nx.DiGraph()
+    for u, v in [("a", "b"), ("b", "c"), ("c", "a")]:
+        G.add_edge(u, v, length=100, travel_time=10, speed=10)
+    base = RoutingProblem(start_node="a", end_node="c", num_ants=2, iterations=2, target_soc=10)
+    return RouteServer(compile_graph(G), base_problem=base)
+
+
+@pytest.mark.parametrize("query", [
+    [],
+    {"num_workers": 8},
+    {"v2g_table_file": "/etc/passwd"},
+    {"iterations": "x"},
+    {"num_ants": True},
+    {"charging_options": [[15]]},
+    {"warm_start_decay": 2},
+    {"start_node": 123},
+])
+def test_solve_rejects_bad_queries(server, query):
+    response = server.solve(query)
+    assert response["status"] == "error"
+
+
+def test_solve_accepts_allowed_fields(server):
+    response = server.solve({"id": 7, "iterations": 1, "time_budget": None, "charging_options": [[0, 80]]})
+    assert response["id"] == 7
+    assert response["status"] == "ok"
+    assert response["path"] == ["a", "b", "c"]
+
+
+def test_jsonl_limits_queries_in_flight():
+    release = threading.Event()
+    read = []
+
+    class _SlowServer:
+        def solve(self, query):
+            release.wait(10)
+            return {"id": query["id"], "status": "ok"}
+
+    def lines():
+        for i in range(20):
+            read.append(i)
+            yield json.dumps({"id": i}) + "\n"
+
+    class _Output(list):
+        write = list.append
+
+        def flush(self):
+            pass
+
+    out = _Output()
+    thread = threading.Thread(target=serve_jsonl, args=(_SlowServer(), lines(), out, 2))
+    thread.start()
+    time.sleep(0.2)
+    # 求解卡住時最多讀入 2 x 2 筆, 外加一筆等待中的
+    assert len(read) <= 5
+    release.set()
+    thread.join(10)
+    assert sorted(json.loads(line)["id"] for line in out) == list(range(20))
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def _post(port, body):
+    request = urllib.request.Request(f"http://127.0.0.1:{port}/route", data=body, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=10) as reply:
+            return reply.status, json.loads(reply.read())
+    except urllib.error.HTTPError as exc:
+        return exc.code, json.loads(exc.read())
+
+
+def test_http_replies_json_errors(server, monkeypatch):
+    port = _free_port()
+    threading.Thread(target=serve_http, args=(server, "127.0.0.1", port), daemon=True).start()
+    time.sleep(0.2)
+
+    assert _post(port, b"[]")[0] == 400
+    assert _post(port, b'{"iterations": "x"}')[0] == 400
+    assert _post(port, b"{}")[0] == 200
+
+    def fail(query):
+        raise RuntimeError("boom")
+    monkeypatch.setattr(server, "solve", fail)
+    code, body = _post(port, b"{}")
+    assert code == 500 and body["error"] == "boom"
@@ -0,0 +1,32 @@
+import random
+
+import pulp
+import pytest
+
+import scheduling
+
+cbc_available = pytest.mark.skipif(not pulp.PULP_CBC_CMD(msg=False).available(), reason="CBC is not installed")
+
+
+@cbc_available
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_greedy_and_batch_match_cbc(seed):
+    assert scheduling.cross_check_v2g(num_cases=100, seed=seed) == []
+
+
+@cbc_available
+def test_greedy_solve_matches_lp_on_random_prices():
+    rng = random.Random(42)
+    for _ in range(50):
+        prices = [rng.choice([0.1, 0.2, 0.3, 0.5]) for _ in range(rng.randint(1, 12))]
+        initial_soc, final_soc = rng.uniform(0, 100), rng.uniform(0, 100)
+        greedy = scheduling.v2g_greedy_solve(prices, 0.25, initial_soc, final_soc)
+        exact = scheduling.v2g_lp_solve(prices, 0.25, initial_soc, final_soc)
+        assert (greedy[0] == "Optimal") == (exact[0] == "Optimal")
+        if exact[0] == "Optimal":
+            assert greedy[1] == pytest.approx(exact[1], rel=1e-6, abs=1e-6)
+
+
+def test_greedy_rejects_out_of_range_soc():
+    assert scheduling.v2g_greedy_solve([0.2, 0.3], 0.25, -5, 80) == ("Infeasible", None)
+    assert scheduling.v2g_greedy_solve([0.2, 0.3], 0.25, 50, 120) == ("Infeasible", None)
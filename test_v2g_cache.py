@@ -0,0 +1,26 @@
+import pytest
+
+from v2g_cache import V2GCostCache
+
+
+def test_lookup_batch_counts_every_option():
+    cache = V2GCostCache()
+    options = [(30, 80), (30, 80), (45, 90)]
+    cache.lookup_batch(1800, options, 50)
+    assert (cache.hits, cache.misses) == (0, 3)
+    cache.lookup_batch(1800, options, 50)
+    assert (cache.hits, cache.misses) == (3, 3)
+
+
+def test_lookup_batch_matches_lookup():
+    options = [(0, 80), (15, 90), (30, 80), (30, 80), (60, 100)]
+    batch = V2GCostCache().lookup_batch(3600, options, 40)
+    single = V2GCostCache()
+    for (duration, final_soc), (status, cost, delta_soc) in zip(options, batch):
+        expected = single.lookup(3600, duration, 40, final_soc)
+        assert status == expected[0]
+        assert delta_soc == expected[2]
+        if cost is None:
+            assert expected[1] is None
+        else:
+            assert cost == pytest.approx(expected[1])
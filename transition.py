@@ -0,0 +1,85 @@
+import bisect
+import numpy as np
+
+
+class TransitionTable:
+    """
+    ACO 選下一條邊用的機率表.
+
+    啟發值的形式為 1 / (static_cost[e] + visit_weight * visits[v]), 其中
+    static_cost (行駛時間、電費等) 對每條邊是固定的, 只計算一次;
+    每個節點的出邊權重 pheromone^alpha * heuristic^beta 做成累積和 (prefix sum),
+    只在費洛蒙 (或 visit 次數快照) 改變時呼叫 refresh() 重建,
+    選邊時只要對該節點的區段做二分搜尋.
+    """
+
+    def __init__(self, cg, static_cost, alpha, beta, visit_weight=0.0):
+        self.offsets = cg.offsets
+        self.targets = cg.targets
+        self.sources = cg.sources
+        self.num_nodes = cg.num_nodes
+        self.alpha = alpha
+        self.beta = beta
+        self.visit_weight = visit_weight
+
+        self.static_cost = np.asarray(static_cost, dtype=np.float64)
+        # 沒有 visit 懲罰時的 heuristic^beta, 只算一次
+        self.static_heuristic_beta = self._heuristic(self.static_cost) ** beta
+
+        self.cum = np.zeros(cg.num_edges, dtype=np.float64)
+        self._cum_list = None
+
+    @staticmethod
+    def _heuristic(combined_factor):
+        # 與 heuristic_road 相同: 綜合指標 <= 0 時視為 0.1
+        return 1.0 / np.where(combined_factor <= 0, 0.1, combined_factor)
+
+    def refresh(self, pheromone_edges, visit_counts=None):
+        """
+        依目前的費洛蒙陣列 (對齊 edge index) 與各節點 visit 次數重建累積機率表.
+        visit_counts 為長度 num_nodes 的陣列, None 代表不加 visit 懲罰.
+        """
+        if visit_counts is None or self.visit_weight == 0 or not np.any(visit_counts):
+            heuristic_beta = self.static_heuristic_beta
+        else:
+            penalty = self.visit_weight * np.asarray(visit_counts, dtype=np.float64)[self.targets]
+            heuristic_beta = self._heuristic(self.static_cost + penalty) ** self.beta
+
+        weights = np.asarray(pheromone_edges, dtype=np.float64) ** self.alpha * heuristic_beta
+
+        # 以各節點最大權重正規化, 避免極小的費洛蒙在累積和中失去精度;
+        # 全部為 0 的節點改為均勻機率 (與原本 total_prob == 0 的處理一致)
+        starts = self.offsets[:-1]
+        nonempty = np.diff(self.offsets) > 0
+        node_max = np.zeros(self.num_nodes, dtype=np.float64)
+        if len(weights):
+            node_max[nonempty] = np.maximum.reduceat(weights, starts[nonempty])
+        scale = node_max[self.sources]
+        weights = np.divide(weights, scale, out=np.ones_like(weights), where=scale > 0)
+
+        # 每個節點區段內的累積和
+        cum = np.cumsum(weights)
+        segment_base = np.zeros(self.num_nodes, dtype=np.float64)
+        segment_base[nonempty] = cum[starts[nonempty]] - weights[starts[nonempty]]
+        self.cum = cum - segment_base[self.sources]
+        self._cum_list = None
+
+    def sample(self, u, r):
+        """r 為 [0, 1) 的亂數, 回傳節點 u 被選中的出邊 edge index"""
+        if self._cum_list is None:
+            self._cum_list = self.cum.tolist()
+        lo, hi = int(self.offsets[u]), int(self.offsets[u + 1])
+        x = r * self._cum_list[hi - 1]
+        return min(bisect.bisect_right(self._cum_list, x, lo, hi), hi - 1)
+
+    def probabilities(self, u):
+        """節點 u 各出邊的選擇機率 (除錯/檢查用)"""
+        lo, hi = self.offsets[u], self.offsets[u + 1]
+        cum = self.cum[lo:hi]
+        return np.diff(np.concatenate(([0.0], cum))) / cum[-1]
+
+    def __getstate__(self):
+        # 傳給 worker 時不需要 list 版本, 到了 worker 再重建
+        state = self.__dict__.copy()
+        state['_cum_list'] = None
+        return state
@@ -0,0 +1,186 @@
+import threading
+from collections import OrderedDict
+import numpy as np
+from scheduling import v2g_milp_optimize, v2g_batch_optimize
+
+
+class V2GCostCache:
+    """
+    v2g_milp_optimize 的快取層:
+     - 以量化後的 (時間, 停留分鐘, 初始SOC, 目標SOC) 為 key
+     - 執行中查不到的結果放進有上限的 LRU, 超過 maxsize 就淘汰最久沒用到的
+     - 可另外載入預先算好的磁碟表 (npz), 表內的結果不會被淘汰
+
+    注意: 成本是用量化後的代表值求解, delta_soc 則依實際輸入回傳 (與原函式一致).
+    查詢會加鎖, 可由多個執行緒 (例如 route_server 的多個查詢) 共用同一個快取.
+    """
+
+    def __init__(self, maxsize=100000, time_resolution=60, soc_resolution=0.5, table_file=None):
+        self.maxsize = maxsize
+        self.time_resolution = time_resolution  # 秒
+        self.soc_resolution = soc_resolution    # 百分比
+        self.table = {}           # 預先計算的結果 (不淘汰)
+        self.lru = OrderedDict()  # 執行中累積的結果
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.RLock()
+        if table_file is not None:
+            self.load(table_file)
+
+    def _key(self, current_time, stop_duration_minutes, initial_soc, final_soc):
+        return (
+            int(round(current_time / self.time_resolution)),
+            int(stop_duration_minutes),
+            int(round(initial_soc / self.soc_resolution)),
+            int(round(final_soc / self.soc_resolution)),
+        )
+
+    def _solve(self, key):
+        time_slot, duration, initial_q, final_q = key
+        status, cost, _ = v2g_milp_optimize(
+            time_slot * self.time_resolution,
+            duration,
+            initial_q * self.soc_resolution,
+            final_q * self.soc_resolution,
+        )
+        return status, cost
+
+    def lookup(self, current_time, stop_duration_minutes, initial_soc, final_soc):
+        """回傳與 v2g_milp_optimize 相同格式的 (status, cost, delta_soc)"""
+        with self._lock:
+            return self._lookup(current_time, stop_duration_minutes, initial_soc, final_soc)
+
+    def _lookup(self, current_time, stop_duration_minutes, initial_soc, final_soc):
+        key = self._key(current_time, stop_duration_minutes, initial_soc, final_soc)
+
+        if key in self.table:
+            self.hits += 1
+            status, cost = self.table[key]
+        elif key in self.lru:
+            self.hits += 1
+            self.lru.move_to_end(key)
+            status, cost = self.lru[key]
+        else:
+            self.misses += 1
+            status, cost = self._solve(key)
+            self.lru[key] = (status, cost)
+            if len(self.lru) > self.maxsize:
+                self.lru.popitem(last=False)
+
+        if stop_duration_minutes == 0:
+            return status, cost, 0
+        return status, cost, final_soc - initial_soc
+
+    def _solve_batch(self, keys):
+        """對多個 key 一次用 v2g_batch_optimize 求解"""
+        keys = np.asarray(keys, dtype=np.int64).reshape(-1, 4)
+        statuses, costs, _ = v2g_batch_optimize(
+            keys[:, 0] * self.time_resolution,
+            keys[:, 1],
+            keys[:, 2] * self.soc_resolution,
+            keys[:, 3] * self.soc_resolution,
+        )
+        return [(status, None if np.isnan(cost) else float(cost)) for status, cost in zip(statuses, costs)]
+
+    def lookup_batch(self, current_time, options, initial_soc):
+        """
+        同一時間/SOC 下的多個 (停留分鐘, 目標SOC) 選項一次查詢,
+        查不到的部分合併成一次批次求解. 回傳 [(status, cost, delta_soc), ...]
+        """
+        with self._lock:
+            return self._lookup_batch(current_time, options, initial_soc)
+
+    def _lookup_batch(self, current_time, options, initial_soc):
+        keys = [self._key(current_time, duration, initial_soc, final_soc) for duration, final_soc in options]
+        missing = [key for key in dict.fromkeys(keys) if key not in self.table and key not in self.lru]
+        # 命中/未命中以每個輸入選項計 (同一 key 重複出現時各算一次, 依查詢當下的快取狀態)
+        missing_set = set(missing)
+        num_missing = sum(key in missing_set for key in keys)
+        self.misses += num_missing
+        self.hits += len(keys) - num_missing
+        if missing:
+            for key, result in zip(missing, self._solve_batch(missing)):
+                self.lru[key] = result
+            while len(self.lru) > self.maxsize:
+                self.lru.popitem(last=False)
+
+        results = []
+        for key, (duration, final_soc) in zip(keys, options):
+            if key in self.table:
+                status, cost = self.table[key]
+            elif key in self.lru:
+                self.lru.move_to_end(key)
+                status, cost = self.lru[key]
+            else:
+                # maxsize 比選項數還小時, 剛算好的結果可能已被淘汰
+                status, cost = self._solve(key)
+            results.append((status, cost, 0 if duration == 0 else final_soc - initial_soc))
+        return results
+
+    def precompute(self, times, durations, initial_socs, final_socs):
+        """對所有組合預先求解並放進不淘汰的表中 (離線建表用, 整批向量化求解)"""
+        grid = np.stack(np.meshgrid(
+            np.round(np.asarray(times, dtype=np.float64) / self.time_resolution),
+            np.asarray(durations, dtype=np.float64),
+            np.round(np.asarray(initial_socs, dtype=np.float64) / self.soc_resolution),
+            np.round(np.asarray(final_socs, dtype=np.float64) / self.soc_resolution),
+            indexing='ij',
+        ), axis=-1).reshape(-1, 4).astype(np.int64)
+        keys = [key for key in map(tuple, grid.tolist()) if key not in self.table]
+        for key, result in zip(keys, self._solve_batch(keys)):
+            self.table[key] = result
+
+    def save(self, path):
+        """將預先計算表與 LRU 內容寫入 npz"""
+        entries = {**self.lru, **self.table}
+        keys = np.array(list(entries.keys()), dtype=np.int64).reshape(-1, 4)
+        statuses = np.array([status for status, _ in entries.values()], dtype=str)
+        costs = np.array([np.nan if cost is None else cost for _, cost in entries.values()], dtype=np.float64)
+        np.savez_compressed(
+            path,
+            keys=keys,
+            statuses=statuses,
+            costs=costs,
+            resolution=np.array([self.time_resolution, self.soc_resolution], dtype=np.float64),
+        )
+
+    def load(self, path):
+        data = np.load(path)
+        time_resolution, soc_resolution = data['resolution'].tolist()
+        if time_resolution != self.time_resolution or soc_resolution != self.soc_resolution:
+            raise ValueError(
+                f"V2G table {path} was built with resolution "
+                f"({time_resolution}, {soc_resolution}), expected "
+                f"({self.time_resolution}, {self.soc_resolution})"
+            )
+        for key, status, cost in zip(data['keys'].tolist(), data['statuses'].tolist(), data['costs'].tolist()):
+            self.table[tuple(key)] = (status, None if np.isnan(cost) else cost)
+
+    def clear(self):
+        with self._lock:
+            self.lru.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __getstate__(self):
+        # 鎖不能 pickle, 複製到其他 process 時重建
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.RLock()
+
+
+if __name__ == "__main__":
+    # 離線建表: ACO 充電選項 (停留分鐘 x 目標SOC) 在 0~3 小時內的所有出發時間
+    cache = V2GCostCache()
+    cache.precompute(
+        times=range(0, 3 * 3600 + 1, cache.time_resolution),
+        durations=[15, 30, 45, 60],
+        initial_socs=np.arange(20, 90 + cache.soc_resolution, cache.soc_resolution),
+        final_socs=[80, 90],
+    )
+    cache.save("v2g_cost_table.npz")
+    print(f"已儲存 {len(cache.table)} 筆 V2G 成本至 v2g_cost_table.npz")
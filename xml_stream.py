@@ -0,0 +1,33 @@
+"""串流讀取 SUMO XML (可讀 .gz) 的共用函式, 只依賴標準函式庫"""
+import gzip
+import xml.etree.ElementTree as ET
+
+
+def open_xml(path):
+    """開啟 XML 檔, 副檔名為 .gz 時直接以 gzip 串流解壓"""
+    if str(path).endswith('.gz'):
+        return gzip.open(path, 'rb')
+    return open(path, 'rb')
+
+
+def iter_top_level(path, tags=None):
+    """
+    以 iterparse 串流讀取 XML, 依序產生根節點底下 (第一層) 標籤在 tags 內的元素 (tags 為 None 時產生全部).
+    元素在 yield 後即被清除, 並從根節點移除, 記憶體用量與檔案大小無關.
+    產生的元素只在下一次迭代前有效.
+    """
+    with open_xml(path) as f:
+        depth = 0
+        root = None
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1:
+                if tags is None or elem.tag in tags:
+                    yield elem
+                elem.clear()
+                root.clear()